@@ -20,6 +20,34 @@ class Settings(BaseModel):
         description="Comma-separated origins allowed for CORS",
     )
     CAPACITY_REQUIRED: int = 1000
+    MIGRATE_ON_STARTUP: bool = Field(
+        default=True, description="Run schema migrations at startup (deployments run `python -m app.migrate`)"
+    )
+    LOOKAHEAD_HORIZON: int = Field(default=2, description="Default horizon for the lookahead_k strategy")
+    LOOKAHEAD_SAMPLES: int = Field(
+        default=0, description="Persons sampled per lookahead state (0 = exact expectation)"
+    )
+    LOOKAHEAD_TIME_BUDGET_MS: float = Field(default=50.0, description="Per-decision lookahead time budget")
+    LOOKAHEAD_CACHE_SIZE: int = Field(default=50_000, description="Max memoized lookahead states per evaluator")
+    RUN_STATE_CACHE_SIZE: int = Field(default=1024, description="Max runs whose parsed state is kept in-process")
+    SHUTDOWN_DRAIN_SECONDS: float = Field(
+        default=20.0, description="Max wait at shutdown for in-flight steps to commit"
+    )
+    RECOVERY_AFTER_SECONDS: float = Field(
+        default=60.0, description="Optimistic mode: age after which an unfinished step is recovered"
+    )
+    LOCK_BACKEND: str = Field(
+        default="memory",
+        description="Run lock: memory (single process) | lease (shared DB) | sticky (sharded) | optimistic (none)",
+    )
+    LOCK_LEASE_SECONDS: float = Field(default=60.0, description="Lease lifetime; frees runs held by dead workers")
+    LOCK_TIMEOUT_SECONDS: float = Field(default=30.0, description="Max wait for a run lease before answering 503")
+    WORKER_ID: int = Field(default=0, description="Sticky mode: shard owned by this replica")
+    WORKER_COUNT: int = Field(default=1, description="Sticky mode: number of replicas")
+    IMAGE_INDEX_DIR: str = Field(
+        default="", description="Image generator output dir holding scenario_<N>/index.json (empty = no imageUrl)"
+    )
+    IMAGE_BASE_URL: str = Field(default="/api/images", description="Prefix of NextPerson.imageUrl (e.g. a CDN)")
 
     @property
     def DATABASE_URL_ASYNC(self) -> str:
@@ -44,6 +72,21 @@ def load_settings() -> Settings:
         DATABASE_URL=os.getenv("DATABASE_URL", "sqlite:///./data/db.sqlite3"),
         CORS_ORIGINS=os.getenv("CORS_ORIGINS", "http://localhost:5174"),
         CAPACITY_REQUIRED=int(os.getenv("CAPACITY_REQUIRED", "1000")),
+        MIGRATE_ON_STARTUP=os.getenv("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes"),
+        LOOKAHEAD_HORIZON=int(os.getenv("LOOKAHEAD_HORIZON", "2")),
+        LOOKAHEAD_SAMPLES=int(os.getenv("LOOKAHEAD_SAMPLES", "0")),
+        LOOKAHEAD_TIME_BUDGET_MS=float(os.getenv("LOOKAHEAD_TIME_BUDGET_MS", "50")),
+        LOOKAHEAD_CACHE_SIZE=int(os.getenv("LOOKAHEAD_CACHE_SIZE", "50000")),
+        RUN_STATE_CACHE_SIZE=int(os.getenv("RUN_STATE_CACHE_SIZE", "1024")),
+        SHUTDOWN_DRAIN_SECONDS=float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20")),
+        RECOVERY_AFTER_SECONDS=float(os.getenv("RECOVERY_AFTER_SECONDS", "60")),
+        LOCK_BACKEND=os.getenv("LOCK_BACKEND", "memory"),
+        LOCK_LEASE_SECONDS=float(os.getenv("LOCK_LEASE_SECONDS", "60")),
+        LOCK_TIMEOUT_SECONDS=float(os.getenv("LOCK_TIMEOUT_SECONDS", "30")),
+        WORKER_ID=int(os.getenv("WORKER_ID", "0")),
+        WORKER_COUNT=int(os.getenv("WORKER_COUNT", "1")),
+        IMAGE_INDEX_DIR=os.getenv("IMAGE_INDEX_DIR", ""),
+        IMAGE_BASE_URL=os.getenv("IMAGE_BASE_URL", "/api/images"),
     )
 
 
@@ -1,12 +1,16 @@
 import asyncio
 import json
+import logging
 import os
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict
 
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from .config import settings
+from .metrics import on_cursor_execute
 
 
 class Base(DeclarativeBase):
@@ -15,6 +19,105 @@ class Base(DeclarativeBase):
 
 engine = create_async_engine(settings.DATABASE_URL_ASYNC, future=True, echo=False)
 SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+event.listen(engine.sync_engine, "before_cursor_execute", on_cursor_execute)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(sync_conn) -> None:
+    # create_all never alters existing tables; add new nullable (or server-defaulted) columns in place
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=sync_conn.dialect)
+            if column.nullable:
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"
+            elif column.server_default is not None:
+                default = column.server_default.arg
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type} NOT NULL DEFAULT {default}"
+            else:
+                continue
+            sync_conn.execute(text(ddl))
+
+
+def _dedupe_events(sync_conn) -> int:
+    # Keep the first event recorded per (run_id, person_index): later copies are
+    # lost races that were written before the unique index existed
+    result = sync_conn.execute(
+        text("DELETE FROM events WHERE id NOT IN (SELECT MIN(id) FROM events GROUP BY run_id, person_index)")
+    )
+    return result.rowcount
+
+
+# Unique indexes whose legacy duplicates can be resolved before creating them
+_DEDUPE = {"ux_event_run_person": _dedupe_events}
+# Indexes superseded by one above (the plain index the unique one replaces)
+_OBSOLETE_INDEXES = {"events": ("ix_event_run_person",)}
+
+
+def _add_missing_indexes(sync_conn) -> None:
+    # create_all only creates indexes together with their table
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                with sync_conn.begin_nested():
+                    index.create(sync_conn)
+            except IntegrityError:
+                dedupe = _DEDUPE.get(index.name)
+                if dedupe is None:
+                    raise
+                # Any error from here on fails the migration: the app must not run without the index
+                removed = dedupe(sync_conn)
+                logger.warning("removed %d duplicate row(s) from %s to create %s", removed, table.name, index.name)
+                index.create(sync_conn)
+        for name in _OBSOLETE_INDEXES.get(table.name, ()):
+            if name in existing:
+                sync_conn.execute(text(f"DROP INDEX {name}"))
+
+
+def _backfill_last_person_index(sync_conn) -> None:
+    # Runs recorded before runs.last_person_index existed; a MAX per run off the unique index
+    sync_conn.execute(
+        text(
+            "UPDATE runs SET last_person_index = "
+            "(SELECT MAX(person_index) FROM events WHERE events.run_id = runs.id) "
+            "WHERE last_person_index IS NULL "
+            "AND EXISTS (SELECT 1 FROM events WHERE events.run_id = runs.id)"
+        )
+    )
+
+
+def _backfill_admitted_by_attribute(sync_conn) -> None:
+    # Runs recorded before runs.admitted_by_attribute_json existed: tally their accepted events once
+    from .repo import count_true_attributes
+
+    rows = sync_conn.execute(
+        text(
+            "SELECT events.run_id, events.attributes_json FROM events "
+            "JOIN runs ON runs.id = events.run_id "
+            "WHERE runs.admitted_by_attribute_json IS NULL AND events.accepted"
+        )
+    )
+    tallies: Dict[str, Dict[str, int]] = {}
+    for run_id, attributes_json in rows:
+        count_true_attributes(tallies.setdefault(run_id, {}), json.loads(attributes_json))
+    for run_id, counts in tallies.items():
+        sync_conn.execute(
+            text("UPDATE runs SET admitted_by_attribute_json = :counts WHERE id = :run_id"),
+            {"counts": json.dumps(counts), "run_id": run_id},
+        )
 
 
 async def init_db() -> None:
@@ -26,6 +129,10 @@ async def init_db() -> None:
     from . import models_v2  # noqa: F401
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_add_missing_indexes)
+        await conn.run_sync(_backfill_last_person_index)
+        await conn.run_sync(_backfill_admitted_by_attribute)
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
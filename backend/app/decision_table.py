@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .service_logic import decide_accept
+
+# Strategies whose outcome only depends on *which* deficits are still open
+_DEFICIT_MASK_STRATEGIES = {"greedy_tightness"}
+
+
+def person_mask(person_attributes: Dict[str, bool], attributes: List[str]) -> int:
+    mask = 0
+    for i, attr in enumerate(attributes):
+        if person_attributes.get(attr) is True:
+            mask |= 1 << i
+    return mask
+
+
+def _state_key(
+    *,
+    constraints: List[Dict],
+    admitted_count_by_attr: Dict[str, int],
+    admitted_count: int,
+    capacity_required: int,
+) -> Hashable:
+    open_deficits = tuple(
+        int(c["minCount"]) > int(admitted_count_by_attr.get(c["attribute"], 0)) for c in constraints
+    )
+    return (capacity_required - admitted_count > 0, open_deficits)
+
+
+class DecisionTableCache:
+    """Per-state accept/reject table indexed by the person's constraint-attribute bitmask.
+
+    With 2-6 constrained attributes there are at most 64 person types, so once a
+    state's entry is filled every further decision in that state is a list index.
+    Entries are filled lazily; the table is dropped when the state key changes.
+
+    Only strategies in ``_DEFICIT_MASK_STRATEGIES`` are tabled. The others read
+    exact counts and frequencies (which move on most steps once estimates are
+    online), so a table would be rebuilt for nearly every decision; they are
+    evaluated directly.
+    """
+
+    def __init__(self) -> None:
+        self._tables: Dict[str, Tuple[Hashable, List[Optional[bool]]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+
+    def decide(
+        self,
+        *,
+        strategy: str,
+        person_attributes: Dict[str, bool],
+        constraints: List[Dict],
+        admitted_count_by_attr: Dict[str, int],
+        admitted_count: int,
+        capacity_required: int,
+        relative_frequencies: Dict[str, float] | None = None,
+        horizon: int | None = None,
+    ) -> bool:
+        st = strategy.lower().replace("-", "_") if strategy else "greedy_tightness"
+        if st not in _DEFICIT_MASK_STRATEGIES:
+            return decide_accept(
+                strategy=st,
+                person_attributes=person_attributes,
+                constraints=constraints,
+                admitted_count_by_attr=admitted_count_by_attr,
+                admitted_count=admitted_count,
+                capacity_required=capacity_required,
+                relative_frequencies=relative_frequencies,
+                horizon=horizon,
+            )
+        attributes = [c["attribute"] for c in constraints]
+        key = _state_key(
+            constraints=constraints,
+            admitted_count_by_attr=admitted_count_by_attr,
+            admitted_count=admitted_count,
+            capacity_required=capacity_required,
+        )
+        current = self._tables.get(st)
+        if current is None or current[0] != key:
+            current = (key, [None] * (1 << len(attributes)))
+            self._tables[st] = current
+            self.builds += 1
+        entries = current[1]
+        mask = person_mask(person_attributes, attributes)
+        decision = entries[mask]
+        if decision is not None:
+            self.hits += 1
+            return decision
+        self.misses += 1
+        decision = decide_accept(
+            strategy=st,
+            person_attributes={a: bool(mask >> i & 1) for i, a in enumerate(attributes)},
+            constraints=constraints,
+            admitted_count_by_attr=admitted_count_by_attr,
+            admitted_count=admitted_count,
+            capacity_required=capacity_required,
+            relative_frequencies=relative_frequencies,
+            horizon=horizon,
+        )
+        entries[mask] = decision
+        return decision
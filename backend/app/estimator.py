@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+import math
+from typing import Dict, Iterable, List, Optional
+
+# Weight (in pseudo-persons) given to the static statistics from new_game.
+PRIOR_STRENGTH = 50.0
+
+
+def _pair_key(a: str, b: str) -> str:
+    return f"{a}|{b}" if a < b else f"{b}|{a}"
+
+
+class FrequencyEstimator:
+    """Online Beta-Bernoulli estimate of attribute frequencies and pair co-occurrence.
+
+    The static ``relativeFrequencies``/``correlations`` seed a Beta prior worth
+    ``prior_strength`` observations; each observed person updates the counts of
+    its true attributes (and pairs of true attributes) without touching the DB.
+    """
+
+    def __init__(
+        self,
+        *,
+        attributes: Iterable[str],
+        prior_frequencies: Optional[Dict[str, float]] = None,
+        prior_correlations: Optional[Dict[str, Dict[str, float]]] = None,
+        prior_strength: float = PRIOR_STRENGTH,
+    ) -> None:
+        self.attributes: List[str] = sorted(set(attributes))
+        self.prior_frequencies: Dict[str, float] = {
+            a: float((prior_frequencies or {}).get(a, 0.5)) for a in self.attributes
+        }
+        self.prior_correlations: Dict[str, Dict[str, float]] = prior_correlations or {}
+        self.prior_strength = float(prior_strength)
+        self.observed = 0
+        self.counts: Dict[str, int] = {a: 0 for a in self.attributes}
+        self.pair_counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_attribute_stats(
+        cls,
+        attribute_stats: dict,
+        *,
+        constraints: Optional[List[Dict]] = None,
+        prior_strength: float = PRIOR_STRENGTH,
+    ) -> "FrequencyEstimator":
+        stats = attribute_stats if isinstance(attribute_stats, dict) else {}
+        freqs = stats.get("relativeFrequencies", {}) or {}
+        attrs = set(freqs.keys())
+        for c in constraints or []:
+            attrs.add(c["attribute"])
+        return cls(
+            attributes=attrs,
+            prior_frequencies=freqs,
+            prior_correlations=stats.get("correlations", {}) or {},
+            prior_strength=prior_strength,
+        )
+
+    def observe(self, person_attributes: Dict[str, bool]) -> None:
+        # O(#attrs) for marginals; pairs only over the person's true attributes
+        self.observed += 1
+        present = [a for a in self.attributes if person_attributes.get(a) is True]
+        for a in present:
+            self.counts[a] += 1
+        for i, a in enumerate(present):
+            for b in present[i + 1 :]:
+                k = _pair_key(a, b)
+                self.pair_counts[k] = self.pair_counts.get(k, 0) + 1
+
+    def frequency(self, attr: str) -> float:
+        p0 = self.prior_frequencies.get(attr, 0.5)
+        alpha = self.prior_strength * p0 + self.counts.get(attr, 0)
+        return alpha / (self.prior_strength + self.observed)
+
+    def relative_frequencies(self) -> Dict[str, float]:
+        return {a: self.frequency(a) for a in self.attributes}
+
+    def _prior_joint(self, a: str, b: str) -> float:
+        pa, pb = self.prior_frequencies[a], self.prior_frequencies[b]
+        # The published matrix may carry only one triangle: read either order
+        rho = self.prior_correlations.get(a, {}).get(b)
+        if rho is None:
+            rho = self.prior_correlations.get(b, {}).get(a, 0.0)
+        rho = float(rho)
+        joint = pa * pb + rho * math.sqrt(max(0.0, pa * (1 - pa) * pb * (1 - pb)))
+        return min(max(joint, 0.0), min(pa, pb))
+
+    def joint_frequency(self, a: str, b: str) -> float:
+        alpha = self.prior_strength * self._prior_joint(a, b) + self.pair_counts.get(_pair_key(a, b), 0)
+        return alpha / (self.prior_strength + self.observed)
+
+    def correlations(self) -> Dict[str, Dict[str, float]]:
+        freqs = self.relative_frequencies()
+        out: Dict[str, Dict[str, float]] = {a: {} for a in self.attributes}
+        for a in self.attributes:
+            for b in self.attributes:
+                if a == b:
+                    out[a][b] = 1.0
+                    continue
+                pa, pb = freqs[a], freqs[b]
+                denom = math.sqrt(max(0.0, pa * (1 - pa) * pb * (1 - pb)))
+                out[a][b] = (self.joint_frequency(a, b) - pa * pb) / denom if denom > 0 else 0.0
+        return out
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "priorFrequencies": self.prior_frequencies,
+                "priorCorrelations": self.prior_correlations,
+                "priorStrength": self.prior_strength,
+                "observed": self.observed,
+                "counts": self.counts,
+                "pairCounts": self.pair_counts,
+            },
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> "FrequencyEstimator":
+        data = json.loads(text)
+        est = cls(
+            attributes=data["priorFrequencies"].keys(),
+            prior_frequencies=data["priorFrequencies"],
+            prior_correlations=data.get("priorCorrelations", {}),
+            prior_strength=data.get("priorStrength", PRIOR_STRENGTH),
+        )
+        est.observed = int(data.get("observed", 0))
+        est.counts.update({k: int(v) for k, v in data.get("counts", {}).items()})
+        est.pair_counts = {k: int(v) for k, v in data.get("pairCounts", {}).items()}
+        return est
+
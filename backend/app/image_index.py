@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from .config import settings
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@dataclass(frozen=True)
+class ImageIndex:
+    """
+    Precompiled ``signature -> content-hashed filenames`` index written by the
+    image generator (``<output>/scenario_<N>/index.json``).
+
+    Signatures are the generator's combo codes (``UV1_I0_...``): one token per
+    attribute in index order, suffixed with 0/1.
+    """
+
+    scenario: int
+    version: str
+    attributes: List[str]
+    tokens: Dict[str, str]
+    mapping: Dict[str, List[str]]
+    files_dir: Path
+    filenames: FrozenSet[str] = frozenset()
+
+    def signature(self, attributes: Dict[str, bool]) -> str:
+        return "_".join(f"{self.tokens[a]}{int(bool(attributes.get(a)))}" for a in self.attributes)
+
+    def filename_for(self, person_index: int, attributes: Dict[str, bool]) -> Optional[str]:
+        names = self.mapping.get(self.signature(attributes))
+        if not names:
+            return None
+        # Stable per person, so a re-fetched person keeps the same (cached) image
+        return names[person_index % len(names)]
+
+
+# scenario -> (index file mtime, index); reloaded when the generator rewrites it
+_indexes: Dict[int, Tuple[float, ImageIndex]] = {}
+
+
+def _scenario_dir(scenario: int) -> Optional[Path]:
+    if not settings.IMAGE_INDEX_DIR:
+        return None
+    return Path(settings.IMAGE_INDEX_DIR) / f"scenario_{scenario}"
+
+
+def get_index(scenario: int) -> Optional[ImageIndex]:
+    root = _scenario_dir(scenario)
+    if root is None:
+        return None
+    path = root / "index.json"
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        _indexes.pop(scenario, None)
+        return None
+    cached = _indexes.get(scenario)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    data = json.loads(path.read_text("utf-8"))
+    mapping = {k: list(v) for k, v in (data.get("mapping") or {}).items()}
+    index = ImageIndex(
+        scenario=int(data.get("scenario", scenario)),
+        version=str(data.get("version", "")),
+        attributes=list(data.get("attributes", [])),
+        tokens=dict(data.get("tokens", {})),
+        mapping=mapping,
+        files_dir=root / "hashed",
+        filenames=frozenset(name for names in mapping.values() for name in names),
+    )
+    _indexes[scenario] = (mtime, index)
+    return index
+
+
+def image_url(scenario: int, person_index: int, attributes: Dict[str, bool]) -> Optional[str]:
+    """URL of the image for a person, or None when no index/image is available."""
+    index = get_index(scenario)
+    if index is None:
+        return None
+    name = index.filename_for(person_index, attributes)
+    if name is None:
+        return None
+    return f"{settings.IMAGE_BASE_URL.rstrip('/')}/{scenario}/{name}"
+
+
+def image_file(scenario: int, filename: str) -> Optional[Path]:
+    """Path of a published image; only names listed in the index are served."""
+    index = get_index(scenario)
+    if index is None or filename not in index.filenames:
+        return None
+    path = index.files_dir / filename
+    return path if path.is_file() else None
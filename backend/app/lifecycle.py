@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class ShuttingDown(Exception):
+    """The process is draining for shutdown and takes no new steps."""
+
+
+class StepTracker:
+    """
+    Counts steps between "decide" and "persisted" so shutdown can wait for
+    them: once ``drain`` starts, new steps are refused and the lifespan
+    handler waits (bounded) until the running ones have committed, instead of
+    cutting a step between the external call and its event.
+    """
+
+    def __init__(self) -> None:
+        self.active = 0
+        self.closing = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @asynccontextmanager
+    async def track(self) -> AsyncIterator[None]:
+        if self.closing:
+            raise ShuttingDown("server is shutting down")
+        self.active += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            if self.active == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Refuse new steps and wait for running ones; False if some are still running at `timeout`."""
+        self.closing = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+steps = StepTracker()
@@ -1,10 +1,38 @@
 import asyncio
-from typing import Dict
+import logging
+import os
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager, suppress
+from typing import AsyncIterator, Dict, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .metrics import lock_wait_duration
+
+logger = logging.getLogger(__name__)
 
 _locks: Dict[str, asyncio.Lock] = {}
 _global_lock = asyncio.Lock()
 
 
+class LockTimeout(TimeoutError):
+    """The run lock could not be acquired in time (another worker holds it)."""
+
+
+class MisdirectedRun(Exception):
+    """Sticky mode: this worker does not own the run; it belongs to `shard`."""
+
+    def __init__(self, run_id: str, shard: int):
+        super().__init__(f"run {run_id} belongs to shard {shard}")
+        self.run_id = run_id
+        self.shard = shard
+
+
 async def get_lock(run_id: str) -> asyncio.Lock:
     # Double-checked locking
     lock = _locks.get(run_id)
@@ -15,3 +43,189 @@ async def get_lock(run_id: str) -> asyncio.Lock:
             lock = _locks[run_id]
     return lock
 
+
+class MemoryLockBackend:
+    """Per-run asyncio.Lock; only correct while one process serves every run."""
+
+    # Holding the lock excludes every other step for the run
+    exclusive = True
+    # Runs are only stepped by this process: rows read before the lock are current
+    shared = False
+
+    @asynccontextmanager
+    async def hold(self, run_id: str) -> AsyncIterator[None]:
+        lock = await get_lock(run_id)
+        async with lock:
+            yield
+
+
+class LeaseLockBackend:
+    """
+    Run lock shared by every process using the same database: a row in
+    ``run_leases`` claimed with an upsert that only succeeds while no
+    unexpired lease exists. Leases expire after ``lease_seconds`` so a crashed
+    holder cannot block a run for good; a holder renews its lease every third
+    of ``lease_seconds`` while the step runs, so a slow step keeps it. Should a
+    renewal find the lease taken anyway (e.g. the worker stalled past expiry),
+    the step's writes are still fenced by the run's version column.
+
+    Waiters inside one process queue on the in-process lock first, so only one
+    of them polls the database at a time.
+    """
+
+    exclusive = True
+    # Other workers step the same runs: re-read the run once the lease is held
+    shared = True
+
+    _CLAIM = text(
+        "INSERT INTO run_leases (run_id, owner, expires_at) VALUES (:run_id, :owner, :expires) "
+        "ON CONFLICT (run_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+        "WHERE run_leases.expires_at < :now"
+    )
+    _RENEW = text("UPDATE run_leases SET expires_at = :expires WHERE run_id = :run_id AND owner = :owner")
+    _RELEASE = text("DELETE FROM run_leases WHERE run_id = :run_id AND owner = :owner")
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        *,
+        lease_seconds: float = 60.0,
+        timeout_seconds: float = 30.0,
+        poll_seconds: float = 0.01,
+    ):
+        self.engine = engine
+        self.lease_seconds = lease_seconds
+        self.timeout_seconds = timeout_seconds
+        self.poll_seconds = poll_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+    async def _try_claim(self, run_id: str) -> bool:
+        now = time.time()
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    self._CLAIM,
+                    {"run_id": run_id, "owner": self.owner, "expires": now + self.lease_seconds, "now": now},
+                )
+        except OperationalError:
+            # SQLite "database is locked" under contention: poll again
+            return False
+        return result.rowcount == 1
+
+    async def _renew(self, run_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with self.engine.begin() as conn:
+                    result = await conn.execute(
+                        self._RENEW,
+                        {"run_id": run_id, "owner": self.owner, "expires": time.time() + self.lease_seconds},
+                    )
+            except OperationalError:
+                continue  # database busy: the lease still has two thirds left, try next tick
+            if result.rowcount != 1:
+                logger.warning("run %s: lease lost to another worker during a step", run_id)
+                return
+
+    async def _release(self, run_id: str) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(self._RELEASE, {"run_id": run_id, "owner": self.owner})
+
+    @asynccontextmanager
+    async def hold(self, run_id: str) -> AsyncIterator[None]:
+        lock = await get_lock(run_id)
+        async with lock:
+            deadline = time.monotonic() + self.timeout_seconds
+            delay = self.poll_seconds
+            while not await self._try_claim(run_id):
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"run {run_id} is locked by another worker")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.2)
+            heartbeat = asyncio.create_task(self._renew(run_id))
+            try:
+                yield
+            finally:
+                heartbeat.cancel()
+                with suppress(asyncio.CancelledError):
+                    await heartbeat
+                await self._release(run_id)
+
+
+class OptimisticLockBackend:
+    """
+    No lock at all. Concurrent steps for a run are resolved by the database:
+    the step claims the pending person with a version-guarded update of the
+    run row, and events are unique per ``(run_id, person_index)``, so the
+    loser of a race gets 409 instead of waiting.
+    """
+
+    exclusive = False
+    # Nothing is held; stale reads surface as version conflicts (409)
+    shared = False
+
+    @asynccontextmanager
+    async def hold(self, run_id: str) -> AsyncIterator[None]:
+        yield
+
+
+def shard_for(run_id: str, worker_count: int) -> int:
+    # Stable across processes and restarts, unlike hash()
+    return zlib.crc32(run_id.encode("utf-8")) % max(1, worker_count)
+
+
+class StickyLockBackend(MemoryLockBackend):
+    """
+    In-process locks behind a load balancer that routes each run to one
+    replica (hash of the run id). Replica ``worker_id`` owns the runs with
+    ``shard_for(run_id, worker_count) == worker_id`` and refuses the rest, so
+    a mis-routed step fails loudly instead of racing another replica.
+    """
+
+    def __init__(self, worker_id: int, worker_count: int):
+        self.worker_id = worker_id
+        self.worker_count = worker_count
+
+    @asynccontextmanager
+    async def hold(self, run_id: str) -> AsyncIterator[None]:
+        shard = shard_for(run_id, self.worker_count)
+        if shard != self.worker_id:
+            raise MisdirectedRun(run_id, shard)
+        async with super().hold(run_id):
+            yield
+
+
+LockBackend = Union[MemoryLockBackend, LeaseLockBackend, StickyLockBackend, OptimisticLockBackend]
+_backend: Optional[LockBackend] = None
+
+
+def get_lock_backend() -> LockBackend:
+    global _backend
+    if _backend is None:
+        kind = settings.LOCK_BACKEND
+        if kind == "memory":
+            _backend = MemoryLockBackend()
+        elif kind == "lease":
+            from .db import engine
+
+            _backend = LeaseLockBackend(
+                engine,
+                lease_seconds=settings.LOCK_LEASE_SECONDS,
+                timeout_seconds=settings.LOCK_TIMEOUT_SECONDS,
+            )
+        elif kind == "sticky":
+            _backend = StickyLockBackend(settings.WORKER_ID, settings.WORKER_COUNT)
+        elif kind == "optimistic":
+            _backend = OptimisticLockBackend()
+        else:
+            raise ValueError(f"unknown LOCK_BACKEND: {kind}")
+    return _backend
+
+
+@asynccontextmanager
+async def run_lock(run_id: str) -> AsyncIterator[None]:
+    """Hold the per-run lock, recording how long acquisition waited."""
+    start = time.perf_counter()
+    async with get_lock_backend().hold(run_id):
+        lock_wait_duration.observe(time.perf_counter() - start)
+        yield
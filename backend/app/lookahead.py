@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import random
+import time
+from collections import OrderedDict
+from itertools import product
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .config import settings
+
+Deficits = Tuple[int, ...]
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = max(1, maxsize)
+        self._data: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[float]:
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: float) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class LookaheadStats:
+    def __init__(self) -> None:
+        self.decisions = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.budget_exhausted = 0
+        # Cache lookups of evaluators since evicted from _evaluators
+        self.retired_hits = 0
+        self.retired_misses = 0
+
+    def record(self, elapsed_ms: float, exhausted: bool) -> None:
+        self.decisions += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if exhausted:
+            self.budget_exhausted += 1
+
+    def retire(self, cache: LRUCache) -> None:
+        self.retired_hits += cache.hits
+        self.retired_misses += cache.misses
+
+
+stats = LookaheadStats()
+
+
+class LookaheadEvaluator:
+    """Expected min-slack over a ``horizon``-step decision tree.
+
+    States are ``(remaining, deficits)`` with deficits in ``attributes`` order.
+    Persons are drawn from independent Bernoulli(``frequencies``); ``samples=0``
+    enumerates every person type exactly, otherwise ``samples`` persons are drawn
+    with an RNG seeded by the state so results stay deterministic and cacheable.
+    """
+
+    def __init__(
+        self,
+        *,
+        attributes: Tuple[str, ...],
+        frequencies: Tuple[float, ...],
+        horizon: int,
+        samples: int = 0,
+        cache_size: int = 50_000,
+    ) -> None:
+        self.attributes = attributes
+        self.frequencies = frequencies
+        self.horizon = max(1, horizon)
+        self.samples = max(0, samples)
+        self.cache = LRUCache(cache_size)
+        self._deadline = float("inf")
+        self._exhausted = False
+
+    def _leaf(self, remaining: int, deficits: Deficits) -> float:
+        best = float("inf")
+        for p, deficit in zip(self.frequencies, deficits):
+            if deficit <= 0:
+                continue
+            slack = p * remaining - deficit
+            if slack < best:
+                best = slack
+        return 1e9 if best == float("inf") else best
+
+    def _person_types(self, remaining: int, deficits: Deficits) -> List[Tuple[float, Tuple[bool, ...]]]:
+        active = [i for i, d in enumerate(deficits) if d > 0]
+        n = len(deficits)
+        if self.samples:
+            rng = random.Random(hash((remaining, deficits)))
+            weight = 1.0 / self.samples
+            out = []
+            for _ in range(self.samples):
+                has = [False] * n
+                for i in active:
+                    has[i] = rng.random() < self.frequencies[i]
+                out.append((weight, tuple(has)))
+            return out
+        out = []
+        for combo in product((False, True), repeat=len(active)):
+            prob = 1.0
+            has = [False] * n
+            for i, flag in zip(active, combo):
+                p = self.frequencies[i]
+                prob *= p if flag else (1.0 - p)
+                has[i] = flag
+            if prob > 0:
+                out.append((prob, tuple(has)))
+        return out
+
+    @staticmethod
+    def _after_accept(deficits: Deficits, has: Tuple[bool, ...]) -> Deficits:
+        return tuple(d - 1 if flag and d > 0 else d for d, flag in zip(deficits, has))
+
+    def _value(self, depth: int, remaining: int, deficits: Deficits) -> float:
+        if depth <= 0 or remaining <= 0 or not any(d > 0 for d in deficits):
+            return self._leaf(remaining, deficits)
+        key = (depth, remaining, deficits)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if time.perf_counter() > self._deadline:
+            # Out of budget: degrade to the one-step estimate, and don't cache it
+            self._exhausted = True
+            return self._leaf(remaining, deficits)
+        exhausted_before = self._exhausted
+        self._exhausted = False
+        total = 0.0
+        for prob, has in self._person_types(remaining, deficits):
+            v_accept = self._value(depth - 1, remaining - 1, self._after_accept(deficits, has))
+            v_reject = self._value(depth - 1, remaining, deficits)
+            total += prob * max(v_accept, v_reject)
+        if not self._exhausted:
+            self.cache.put(key, total)
+        self._exhausted = self._exhausted or exhausted_before
+        return total
+
+    def decide(
+        self,
+        *,
+        person_has: Tuple[bool, ...],
+        remaining: int,
+        deficits: Deficits,
+        time_budget_ms: float,
+    ) -> bool:
+        start = time.perf_counter()
+        self._deadline = start + time_budget_ms / 1000.0
+        self._exhausted = False
+        try:
+            s_accept = self._value(self.horizon - 1, remaining - 1, self._after_accept(deficits, person_has))
+            s_reject = self._value(self.horizon - 1, remaining, deficits)
+        finally:
+            stats.record((time.perf_counter() - start) * 1000.0, self._exhausted)
+            self._deadline = float("inf")
+        if s_accept > s_reject + 1e-9:
+            return True
+        if s_reject > s_accept + 1e-9:
+            return False
+        # Tie-break: accept if helps any deficit
+        return any(flag and d > 0 for d, flag in zip(deficits, person_has))
+
+
+_MAX_EVALUATORS = 32
+_evaluators: "OrderedDict[tuple, LookaheadEvaluator]" = OrderedDict()
+
+
+def get_evaluator(
+    *,
+    relative_frequencies: Dict[str, float],
+    attributes: List[str],
+    horizon: int,
+    samples: int,
+) -> LookaheadEvaluator:
+    freqs = tuple(float(relative_frequencies.get(a, 0.0)) for a in attributes)
+    # Round only the key so slowly drifting online estimates still share a cache;
+    # the evaluator itself samples from the exact frequencies it was built with
+    key = (tuple(attributes), tuple(round(f, 2) for f in freqs), horizon, samples)
+    ev = _evaluators.get(key)
+    if ev is None:
+        ev = LookaheadEvaluator(
+            attributes=tuple(attributes),
+            frequencies=freqs,
+            horizon=horizon,
+            samples=samples,
+            cache_size=settings.LOOKAHEAD_CACHE_SIZE,
+        )
+        _evaluators[key] = ev
+        if len(_evaluators) > _MAX_EVALUATORS:
+            _, evicted = _evaluators.popitem(last=False)
+            stats.retire(evicted.cache)
+    else:
+        _evaluators.move_to_end(key)
+    return ev
+
+
+def lookahead_stats() -> Dict[str, float]:
+    hits = stats.retired_hits + sum(ev.cache.hits for ev in _evaluators.values())
+    misses = stats.retired_misses + sum(ev.cache.misses for ev in _evaluators.values())
+    lookups = hits + misses
+    return {
+        "decisions": stats.decisions,
+        "avgDecisionMs": (stats.total_ms / stats.decisions) if stats.decisions else 0.0,
+        "maxDecisionMs": stats.max_ms,
+        "budgetExhausted": stats.budget_exhausted,
+        "cacheHits": hits,
+        "cacheMisses": misses,
+        "cacheHitRate": (hits / lookups) if lookups else 0.0,
+        "cacheEntries": sum(len(ev.cache) for ev in _evaluators.values()),
+        "evaluators": len(_evaluators),
+    }
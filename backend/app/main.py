@@ -1,19 +1,53 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import logging
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from sqlalchemy.orm.exc import StaleDataError
 
 from .config import settings
-from .db import init_db
+from .db import engine, init_db
+from .lifecycle import ShuttingDown, steps
+from .locks import LockTimeout, MisdirectedRun
+from .metrics import REGISTRY, begin_query_count, db_queries_per_request, http_request_duration
 from .router_public import router as public_router
 from .router_v2 import router_v2
 
-# Import models to register with SQLAlchemy Base
-from . import models  # noqa: F401
-from . import models_v2  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Deployments run `python -m app.migrate` before starting and disable this
+    if settings.MIGRATE_ON_STARTUP:
+        await init_db()
+    yield
+    # uvicorn runs this only after its own drain (--timeout-graceful-shutdown, set to
+    # SHUTDOWN_DRAIN_SECONDS in deployments) has let in-flight requests finish or
+    # cancelled them. Refuse new steps and wait out any step still unwinding, then
+    # close pools. Every step writes its event, counters and estimator checkpoint in
+    # one commit, so nothing is left buffered once the drain completes.
+    if not await steps.drain(settings.SHUTDOWN_DRAIN_SECONDS):
+        logger.warning("shutdown: %d step(s) still running after %.0fs", steps.active, settings.SHUTDOWN_DRAIN_SECONDS)
+    external = sys.modules.get(f"{__package__}.service_external")
+    if external is not None:  # only loaded if an external call was made
+        await external.close_client()
+    await engine.dispose()
 
 
-app = FastAPI(title="Berghain Challenge Backend", version="0.1.0")
+app = FastAPI(
+    title="Berghain Challenge Backend",
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 # CORS
 origins = [o.strip() for o in settings.CORS_ORIGINS.split(",") if o.strip()]
@@ -26,9 +60,49 @@ app.add_middleware(
 )
 
 
-@app.on_event("startup")
-async def on_startup() -> None:
-    await init_db()
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    queries = begin_query_count()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        http_request_duration.observe(
+            time.perf_counter() - start, method=request.method, route=path, status=str(status)
+        )
+        db_queries_per_request.observe(queries[0], route=path)
+
+
+@app.exception_handler(LockTimeout)
+async def lock_timeout_handler(request: Request, exc: LockTimeout) -> ORJSONResponse:
+    return ORJSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(ShuttingDown)
+async def shutting_down_handler(request: Request, exc: ShuttingDown) -> ORJSONResponse:
+    return ORJSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "5"})
+
+
+@app.exception_handler(MisdirectedRun)
+async def misdirected_run_handler(request: Request, exc: MisdirectedRun) -> ORJSONResponse:
+    # Sticky mode: tell the router which shard owns the run
+    return ORJSONResponse({"detail": str(exc)}, status_code=421, headers={"X-Run-Shard": str(exc.shard)})
+
+
+@app.exception_handler(StaleDataError)
+async def stale_run_handler(request: Request, exc: StaleDataError) -> ORJSONResponse:
+    # Version-guarded run update lost a race (e.g. pause during a step)
+    return ORJSONResponse({"detail": "run was modified concurrently"}, status_code=409)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 app.include_router(public_router)
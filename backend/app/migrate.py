@@ -0,0 +1,30 @@
+"""
+Schema migrations, run out-of-band before the API starts:
+
+    python -m app.migrate            # Render: start of startCommand (disk-backed SQLite); Docker: one-off container
+    uvicorn app.main:app             # web process
+
+Creates missing tables and indexes, adds new columns and backfills derived
+ones (see ``db.init_db``). Safe to run repeatedly.
+"""
+from __future__ import annotations
+
+import asyncio
+
+from .db import engine, init_db
+
+
+async def _migrate() -> None:
+    try:
+        await init_db()
+    finally:
+        await engine.dispose()
+
+
+def main() -> int:
+    asyncio.run(_migrate())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
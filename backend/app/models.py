@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -30,8 +30,32 @@ class Run(Base):
     pending_person_index: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     pending_attributes_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
+    # Highest decided person index, written with each event; the step path
+    # validates ordering against it instead of querying events
+    last_person_index: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    # Accepted people per attribute, updated with each event; steps read it
+    # instead of aggregating events (db.py backfills runs recorded before it)
+    admitted_by_attribute_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # Write-ahead intent: the decision being sent to the external API. Set by
+    # the step's claim, cleared when its event commits; one left behind by a
+    # crash is settled by recovery.py
+    inflight_person_index: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    inflight_accept: Mapped[Optional[bool]] = mapped_column(Boolean, nullable=True)
+    inflight_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    # Checkpoint of the online frequency estimator (see estimator.py)
+    estimator_json: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # Optimistic concurrency: every ORM update of a run is guarded by
+    # "WHERE version = <read version>" and bumps it (StaleDataError on conflict)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
     events: Mapped[list[Event]] = relationship("Event", back_populates="run", cascade="all, delete-orphan")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Event(Base):
     __tablename__ = "events"
@@ -48,5 +72,15 @@ class Event(Base):
     run: Mapped[Run] = relationship("Run", back_populates="events")
 
 
-Index("ix_event_run_person", Event.run_id, Event.person_index)
+# One event per person: a duplicate decision fails on insert instead of being recorded twice
+Index("ux_event_run_person", Event.run_id, Event.person_index, unique=True)
+
+
+class RunLease(Base):
+    """Cross-process run lock (LOCK_BACKEND=lease): one row per held run."""
+
+    __tablename__ = "run_leases"
 
+    run_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(64), nullable=False)
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False)  # unix time
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .locks import get_lock_backend
+from .metrics import step_recoveries
+from .models import Run
+from .repo import get_event, record_step, update_run_counts_and_status
+from .run_cache import drop_run_state, get_run_state, sync_run_state
+
+
+logger = logging.getLogger(__name__)
+
+Decide = Callable[..., Awaitable[Dict[str, Any]]]
+
+REPLAYED = "replayed"
+RESYNCED = "resynced"
+FAILED = "failed"
+
+
+def needs_recovery(run: Run) -> bool:
+    """
+    A step was cut short: either its write-ahead intent is still set, or (runs
+    written before the intent existed) the pending person already has an event.
+    """
+    if run.inflight_person_index is not None:
+        return True
+    return (
+        run.pending_person_index is not None
+        and run.last_person_index is not None
+        and run.pending_person_index <= run.last_person_index
+    )
+
+
+def is_abandoned(run: Run, *, now: Optional[datetime] = None) -> bool:
+    """
+    Whether the step that left this state is gone. Callers hold the run lock,
+    so with an exclusive backend no other step can be mid-flight; in
+    optimistic mode the intent must be older than RECOVERY_AFTER_SECONDS.
+    """
+    if run.inflight_person_index is None or get_lock_backend().exclusive:
+        return True
+    if run.inflight_at is None:
+        return True
+    age = ((now or datetime.utcnow()) - run.inflight_at).total_seconds()
+    return age >= settings.RECOVERY_AFTER_SECONDS
+
+
+async def _mark_failed(session: AsyncSession, run: Run, reason: str, ext: Optional[dict] = None) -> str:
+    logger.warning("run %s: marking failed after interrupted step: %s", run.id, reason)
+    await update_run_counts_and_status(
+        session,
+        run,
+        admitted_count=int((ext or {}).get("admittedCount", run.admitted_count)),
+        rejected_count=int((ext or {}).get("rejectedCount", run.rejected_count)),
+        status="failed",
+        pending_person_index=None,
+        pending_attributes_json=None,
+        clear_in_flight=True,
+    )
+    step_recoveries.inc(outcome=FAILED)
+    return FAILED
+
+
+async def recover_run(session: AsyncSession, run: Run, decide: Decide) -> str:
+    """
+    Settle a step interrupted between the external call and its commit.
+
+    The external API has no read-only state endpoint, so the recorded decision
+    is re-sent for the same person and the reply is checked against what that
+    decision implies: ``admittedCount + rejectedCount`` must equal
+    ``person_index + 1`` and the next person must be ``person_index + 1``.
+    If it is consistent the step is completed locally (``replayed``: the
+    event is written; ``resynced``: the event existed, only the pending
+    person and counters are restored). A refusal (4xx) or an inconsistent
+    reply means the remote game moved on in a way we cannot reconstruct, and
+    the run is marked failed rather than guessed.
+    """
+    if run.inflight_person_index is not None:
+        person_index = run.inflight_person_index
+        accept = bool(run.inflight_accept)
+        attributes_json = run.pending_attributes_json
+        event_exists = False
+    else:
+        person_index = run.last_person_index
+        ev = await get_event(session, run.id, person_index)
+        if ev is None:
+            return await _mark_failed(session, run, f"no event for person {person_index}")
+        accept = bool(ev.accepted)
+        attributes_json = ev.attributes_json
+        event_exists = True
+
+    try:
+        ext = await decide(game_id=run.game_id, person_index=person_index, accept=accept)
+    except Exception as exc:
+        status_code = getattr(getattr(exc, "response", None), "status_code", None)
+        if status_code is None or status_code >= 500:
+            raise  # external API unavailable: keep the intent and retry on the next step
+        return await _mark_failed(session, run, f"replay of person {person_index} refused ({status_code})")
+
+    if ext.get("status") == "failed":
+        return await _mark_failed(session, run, ext.get("reason", "external failed"), ext)
+
+    admitted = int(ext.get("admittedCount", 0))
+    rejected = int(ext.get("rejectedCount", 0))
+    next_p = ext.get("nextPerson")
+    consistent = admitted + rejected == person_index + 1 and (
+        next_p["personIndex"] == person_index + 1 if next_p else ext.get("status") == "completed"
+    )
+    if not consistent or not attributes_json:
+        return await _mark_failed(
+            session, run, f"remote counters {admitted}+{rejected} do not follow person {person_index}", ext
+        )
+
+    # Rebuild the cached state from the last checkpoint before observing the person
+    drop_run_state(run.id)
+    pending_index = next_p["personIndex"] if next_p else None
+    pending_json = json.dumps(next_p["attributes"]) if next_p else None
+    if event_exists:
+        await update_run_counts_and_status(
+            session,
+            run,
+            admitted_count=admitted,
+            rejected_count=rejected,
+            status=ext.get("status", run.status),
+            pending_person_index=pending_index,
+            pending_attributes_json=pending_json,
+        )
+        outcome = RESYNCED
+    else:
+        estimator = get_run_state(run).estimator
+        estimator.observe(json.loads(attributes_json))
+        try:
+            await record_step(
+                session,
+                run,
+                person_index=person_index,
+                attributes_json=attributes_json,
+                accepted=accept,
+                admitted_count=admitted,
+                rejected_count=rejected,
+                status=ext.get("status", run.status),
+                pending_person_index=pending_index,
+                pending_attributes_json=pending_json,
+                estimator_json=estimator.to_json(),
+            )
+        except Exception:
+            # The cached estimator observed a person that was not committed
+            drop_run_state(run.id)
+            raise
+        sync_run_state(run, estimator)
+        outcome = REPLAYED
+    logger.info("run %s: %s interrupted step for person %d", run.id, outcome, person_index)
+    step_recoveries.inc(outcome=outcome)
+    return outcome
@@ -0,0 +1,228 @@
+"""Counterfactual replay of stored runs.
+
+Streams the persons recorded in ``events`` for a run and re-decides them with
+other strategies, reporting how many rejections each would have needed. The
+external game API is never called, so the DB doubles as an evaluation set::
+
+    python -m app.replay --strategy lookahead_k --strategy expected_feasible --workers 4
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from .config import settings
+from .decision_table import DecisionTableCache
+from .estimator import FrequencyEstimator
+from .repo import get_run, list_run_ids, stream_events
+from .service_logic import is_known_strategy
+
+
+@dataclass
+class ReplayResult:
+    run_id: str
+    strategy: str
+    persons_seen: int
+    admitted: int
+    rejected: int
+    completed: bool
+    constraints_met: bool
+    original_admitted: int
+    original_rejected: int
+    original_status: str
+
+
+@dataclass
+class _Simulation:
+    strategy: str
+    admitted: int = 0
+    rejected: int = 0
+    persons_seen: int = 0
+    done: bool = False
+    counts: Dict[str, int] = field(default_factory=dict)
+    table: DecisionTableCache = field(default_factory=DecisionTableCache)
+
+
+async def replay_run(
+    session: AsyncSession,
+    run_id: str,
+    strategies: Sequence[str],
+    *,
+    use_online_estimates: bool = False,
+    horizon: Optional[int] = None,
+) -> List[ReplayResult]:
+    for st in strategies:
+        if not is_known_strategy(st):
+            raise ValueError(f"unknown strategy: {st}")
+    run = await get_run(session, run_id)
+    if run is None:
+        raise ValueError(f"run not found: {run_id}")
+    constraints = json.loads(run.constraints_json)
+    attr_stats = json.loads(run.attribute_stats_json)
+    static_freqs = attr_stats.get("relativeFrequencies", {}) if isinstance(attr_stats, dict) else {}
+    capacity = run.capacity_required
+    # The observed stream is the same for every strategy, so one estimator serves all
+    estimator = FrequencyEstimator.from_attribute_stats(attr_stats, constraints=constraints)
+
+    sims = [_Simulation(strategy=st) for st in strategies]
+    async for ev in stream_events(session, run_id):
+        person = json.loads(ev.attributes_json)
+        rel_freqs = estimator.relative_frequencies() if use_online_estimates else static_freqs
+        pending = 0
+        for sim in sims:
+            if sim.done:
+                continue
+            sim.persons_seen += 1
+            accept = sim.table.decide(
+                strategy=sim.strategy,
+                person_attributes=person,
+                constraints=constraints,
+                admitted_count_by_attr=sim.counts,
+                admitted_count=sim.admitted,
+                capacity_required=capacity,
+                relative_frequencies=rel_freqs,
+                horizon=horizon,
+            )
+            if accept:
+                sim.admitted += 1
+                for k, v in person.items():
+                    if v is True:
+                        sim.counts[k] = sim.counts.get(k, 0) + 1
+                sim.done = sim.admitted >= capacity
+            else:
+                sim.rejected += 1
+            if not sim.done:
+                pending += 1
+        if use_online_estimates:
+            estimator.observe(person)
+        if pending == 0:
+            break
+
+    results = []
+    for sim in sims:
+        met = all(sim.counts.get(c["attribute"], 0) >= int(c["minCount"]) for c in constraints)
+        results.append(
+            ReplayResult(
+                run_id=run_id,
+                strategy=sim.strategy,
+                persons_seen=sim.persons_seen,
+                admitted=sim.admitted,
+                rejected=sim.rejected,
+                completed=sim.done,
+                constraints_met=met,
+                original_admitted=run.admitted_count,
+                original_rejected=run.rejected_count,
+                original_status=run.status,
+            )
+        )
+    return results
+
+
+async def _replay_with_url(
+    database_url: str,
+    run_ids: Sequence[str],
+    strategies: Sequence[str],
+    use_online_estimates: bool,
+    horizon: Optional[int],
+) -> List[ReplayResult]:
+    engine = create_async_engine(database_url, future=True, echo=False)
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+    try:
+        out: List[ReplayResult] = []
+        async with sessions() as session:
+            for run_id in run_ids:
+                out.extend(
+                    await replay_run(
+                        session,
+                        run_id,
+                        strategies,
+                        use_online_estimates=use_online_estimates,
+                        horizon=horizon,
+                    )
+                )
+        return out
+    finally:
+        await engine.dispose()
+
+
+def _replay_worker(
+    database_url: str,
+    run_id: str,
+    strategies: Sequence[str],
+    use_online_estimates: bool,
+    horizon: Optional[int],
+) -> List[dict]:
+    results = asyncio.run(_replay_with_url(database_url, [run_id], strategies, use_online_estimates, horizon))
+    return [asdict(r) for r in results]
+
+
+async def _all_run_ids(database_url: str) -> List[str]:
+    engine = create_async_engine(database_url, future=True, echo=False)
+    try:
+        async with AsyncSession(engine) as session:
+            return await list_run_ids(session)
+    finally:
+        await engine.dispose()
+
+
+def replay_runs(
+    strategies: Sequence[str],
+    *,
+    run_ids: Optional[Sequence[str]] = None,
+    database_url: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    use_online_estimates: bool = False,
+    horizon: Optional[int] = None,
+) -> List[ReplayResult]:
+    """Replay stored runs in a process pool (one run per task)."""
+    for st in strategies:
+        if not is_known_strategy(st):
+            raise ValueError(f"unknown strategy: {st}")
+    url = database_url or settings.DATABASE_URL_ASYNC
+    ids = list(run_ids) if run_ids is not None else asyncio.run(_all_run_ids(url))
+    if not ids:
+        return []
+    if max_workers == 1 or len(ids) == 1:
+        return asyncio.run(_replay_with_url(url, ids, strategies, use_online_estimates, horizon))
+    results: List[ReplayResult] = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_replay_worker, url, run_id, list(strategies), use_online_estimates, horizon)
+            for run_id in ids
+        ]
+        for fut in futures:
+            results.extend(ReplayResult(**r) for r in fut.result())
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay stored runs under alternative strategies.")
+    parser.add_argument("--strategy", action="append", required=True, help="Strategy to evaluate (repeatable)")
+    parser.add_argument("--run", action="append", dest="run_ids", help="Run id to replay (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size")
+    parser.add_argument("--database-url", default=None, help="Async SQLAlchemy URL (default: settings)")
+    parser.add_argument("--online-estimates", action="store_true", help="Decide with online frequency estimates")
+    parser.add_argument("--horizon", type=int, default=None, help="Horizon for lookahead_k")
+    args = parser.parse_args(argv)
+
+    results = replay_runs(
+        args.strategy,
+        run_ids=args.run_ids,
+        database_url=args.database_url,
+        max_workers=args.workers,
+        use_online_estimates=args.online_estimates,
+        horizon=args.horizon,
+    )
+    for r in results:
+        print(json.dumps(asdict(r)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
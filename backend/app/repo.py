@@ -2,9 +2,9 @@ from __future__ import annotations
 
 import json
 from datetime import datetime
-from typing import Iterable, List, Optional, Tuple
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import select, desc
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .models import Event, Run
@@ -50,6 +50,8 @@ async def update_run_counts_and_status(
     status: Optional[str] = None,
     pending_person_index: Optional[int] | None = None,
     pending_attributes_json: Optional[str] | None = None,
+    estimator_json: Optional[str] = None,
+    clear_in_flight: bool = False,
 ) -> Run:
     run.admitted_count = admitted_count
     run.rejected_count = rejected_count
@@ -57,6 +59,10 @@ async def update_run_counts_and_status(
         run.status = status
     run.pending_person_index = pending_person_index
     run.pending_attributes_json = pending_attributes_json
+    if estimator_json is not None:
+        run.estimator_json = estimator_json
+    if clear_in_flight:
+        _clear_in_flight(run)
     run.updated_at = datetime.utcnow()
     await session.commit()
     await session.refresh(run)
@@ -78,6 +84,98 @@ async def set_run_pending_person(
     return run
 
 
+def _clear_in_flight(run: Run) -> None:
+    run.inflight_person_index = None
+    run.inflight_accept = None
+    run.inflight_at = None
+
+
+async def claim_pending_person(session: AsyncSession, run: Run, *, accept: bool) -> Run:
+    """
+    Record the decision for the pending person before sending it (write-ahead
+    intent). The update is version-guarded, so of two concurrent steps only
+    one claims the person; the loser's commit raises StaleDataError.
+    """
+    run.inflight_person_index = run.pending_person_index
+    run.inflight_accept = accept
+    run.inflight_at = datetime.utcnow()
+    run.updated_at = run.inflight_at
+    await session.commit()
+    return run
+
+
+async def release_pending_person(session: AsyncSession, run: Run) -> Run:
+    """Undo a claim whose decision never reached the external API."""
+    _clear_in_flight(run)
+    run.updated_at = datetime.utcnow()
+    await session.commit()
+    return run
+
+
+def count_true_attributes(counts: Dict[str, int], attributes: Dict[str, object]) -> None:
+    for k, v in attributes.items():
+        if v is True:
+            counts[k] = counts.get(k, 0) + 1
+
+
+def admitted_by_attribute(run: Run) -> Dict[str, int]:
+    """Accepted people per attribute, as of the run's last recorded event."""
+    return json.loads(run.admitted_by_attribute_json) if run.admitted_by_attribute_json else {}
+
+
+async def record_step(
+    session: AsyncSession,
+    run: Run,
+    *,
+    person_index: int,
+    attributes_json: str,
+    accepted: bool,
+    admitted_count: int,
+    rejected_count: int,
+    status: str,
+    pending_person_index: Optional[int],
+    pending_attributes_json: Optional[str],
+    estimator_json: Optional[str] = None,
+) -> Event:
+    """
+    Persist a decision and the run's new state in one transaction. The event
+    insert is guarded by the unique (run_id, person_index) index and the run
+    update by its version, so a duplicate or stale step raises instead of
+    being recorded.
+    """
+    ev = Event(
+        run_id=run.id,
+        person_index=person_index,
+        attributes_json=attributes_json,
+        accepted=accepted,
+        admitted_count=admitted_count,
+        rejected_count=rejected_count,
+    )
+    session.add(ev)
+    run.last_person_index = person_index
+    if accepted:
+        counts = admitted_by_attribute(run)
+        count_true_attributes(counts, json.loads(attributes_json))
+        run.admitted_by_attribute_json = json.dumps(counts)
+    _clear_in_flight(run)
+    run.admitted_count = admitted_count
+    run.rejected_count = rejected_count
+    run.status = status
+    run.pending_person_index = pending_person_index
+    run.pending_attributes_json = pending_attributes_json
+    if estimator_json is not None:
+        run.estimator_json = estimator_json
+    run.updated_at = datetime.utcnow()
+    await session.commit()
+    return ev
+
+
+async def get_event(session: AsyncSession, run_id: str, person_index: int) -> Optional[Event]:
+    stmt = select(Event).where(Event.run_id == run_id, Event.person_index == person_index)
+    res = await session.execute(stmt)
+    return res.scalar_one_or_none()
+
+
 async def add_event(
     session: AsyncSession,
     *,
@@ -102,13 +200,6 @@ async def add_event(
     return ev
 
 
-async def get_last_event(session: AsyncSession, run_id: str) -> Optional[Event]:
-    stmt = select(Event).where(Event.run_id == run_id).order_by(desc(Event.person_index)).limit(1)
-    res = await session.execute(stmt)
-    row = res.scalar_one_or_none()
-    return row
-
-
 async def list_events(
     session: AsyncSession, run_id: str, *, offset: int = 0, limit: int = 200
 ) -> List[Event]:
@@ -128,3 +219,22 @@ async def list_all_events(session: AsyncSession, run_id: str) -> List[Event]:
     res = await session.execute(stmt)
     return list(res.scalars().all())
 
+
+async def stream_events(session: AsyncSession, run_id: str, *, batch_size: int = 500) -> AsyncIterator[Event]:
+    stmt = (
+        select(Event)
+        .where(Event.run_id == run_id)
+        .order_by(Event.person_index)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await session.stream_scalars(stmt)
+    async for ev in result:
+        yield ev
+
+
+async def list_run_ids(session: AsyncSession, *, status: Optional[str] = None) -> List[str]:
+    stmt = select(Run.id).order_by(Run.created_at)
+    if status is not None:
+        stmt = stmt.where(Run.status == status)
+    res = await session.execute(stmt)
+    return list(res.scalars().all())
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import uuid
 from typing import Optional, List
-from sqlalchemy import select, func, and_
+from sqlalchemy import DateTime, select, func, and_, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from .models_v2 import Profile, RunCompletion
 from .models import Run
@@ -93,7 +93,7 @@ async def record_run_completion(
 async def get_leaderboard(session: AsyncSession) -> List[dict]:
     """Get global leaderboard data"""
     # Complex query to get leaderboard data
-    stmt = """
+    stmt = text("""
     WITH completed_scenarios AS (
         SELECT 
             p.guest_id,
@@ -124,7 +124,7 @@ async def get_leaderboard(session: AsyncSession) -> List[dict]:
         scenarios_completed DESC,
         total_rejections ASC,
         last_completion DESC
-    """
+    """).columns(last_completion=DateTime)  # SQLite returns MAX(...) as a string otherwise
     
     result = await session.execute(stmt)
     rows = result.fetchall()
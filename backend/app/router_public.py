@@ -4,27 +4,40 @@ import json
 import uuid
 from typing import Optional
 
+import orjson
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, ORJSONResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 
 from .config import settings
 from .db import get_session
-from .locks import get_lock
+from .image_index import IMMUTABLE_CACHE_CONTROL, image_file, image_url
+from .lifecycle import steps
+from .locks import get_lock_backend, run_lock
+from .metrics import step_phase_duration, timed
 from .repo import (
-    add_event,
+    admitted_by_attribute,
+    claim_pending_person,
     create_run,
-    get_last_event,
     get_run,
     list_all_events,
     list_events,
+    record_step,
+    release_pending_person,
     set_run_pending_person,
     update_run_counts_and_status,
 )
 from .schemas import (
+    AttributeStatistics,
     AutoStepRequest,
+    Constraint,
     EventOut,
     ExportResponse,
     AdmittedByAttributeResponse,
+    EstimatesResponse,
+    LookaheadStatsResponse,
     NewRunRequest,
     NextPerson,
     EventsPage,
@@ -32,10 +45,10 @@ from .schemas import (
     StepRequest,
     StepResponse,
 )
-from .service_external import decide_and_next, new_game
+from .lookahead import lookahead_stats
+from .recovery import is_abandoned, needs_recovery, recover_run
+from .run_cache import drop_run_state, get_run_state, get_run_static, sync_run_state
 from .service_logic import (
-    count_admitted_by_attribute,
-    decide_accept,
     validate_next_person_index,
 )
 from .utils import from_json, to_json, utc_iso
@@ -44,7 +57,25 @@ from .utils import from_json, to_json, utc_iso
 router = APIRouter(prefix="/api", tags=["public"])
 
 
+async def new_game(*, scenario: int) -> dict:
+    # httpx/tenacity are imported on the first external call, not at boot
+    from .service_external import new_game as call
+
+    return await call(scenario=scenario)
+
+
+async def decide_and_next(*, game_id: str, person_index: int, accept: Optional[bool]) -> dict:
+    from .service_external import decide_and_next as call
+
+    return await call(game_id=game_id, person_index=person_index, accept=accept)
+
+
+def _phase(name: str):
+    return timed(step_phase_duration, route="auto_step", phase=name)
+
+
 def _run_to_summary(run) -> RunSummary:
+    static = get_run_static(run)
     return RunSummary(
         id=run.id,
         scenario=run.scenario,
@@ -53,12 +84,142 @@ def _run_to_summary(run) -> RunSummary:
         admittedCount=run.admitted_count,
         rejectedCount=run.rejected_count,
         capacityRequired=run.capacity_required,
-        constraints=json.loads(run.constraints_json),
-        attributeStatistics=json.loads(run.attribute_stats_json),
+        constraints=static.constraint_models,
+        attributeStatistics=static.stats_model,
         pendingPersonIndex=run.pending_person_index,
     )
 
 
+def _run_summary_dict(run) -> dict:
+    """RunSummary as a plain dict for ORJSONResponse; constraints and statistics
+    are embedded as fragments serialized once per run."""
+    static = get_run_static(run)
+    return {
+        "id": run.id,
+        "scenario": run.scenario,
+        "gameId": run.game_id,
+        "status": run.status,
+        "admittedCount": run.admitted_count,
+        "rejectedCount": run.rejected_count,
+        "capacityRequired": run.capacity_required,
+        "constraints": static.constraints_fragment,
+        "attributeStatistics": static.stats_fragment,
+        "pendingPersonIndex": run.pending_person_index,
+    }
+
+
+def _event_dict(ev) -> dict:
+    return {
+        "id": ev.id,
+        "personIndex": ev.person_index,
+        "attributes": orjson.Fragment(ev.attributes_json),
+        "accepted": ev.accepted,
+        "admittedCount": ev.admitted_count,
+        "rejectedCount": ev.rejected_count,
+        "createdAt": utc_iso(ev.created_at),
+    }
+
+
+def _next_person_dict(run, next_p: Optional[dict]) -> Optional[dict]:
+    if not next_p:
+        return None
+    return {
+        "personIndex": next_p["personIndex"],
+        "attributes": next_p["attributes"],
+        "imageUrl": image_url(run.scenario, next_p["personIndex"], next_p["attributes"]),
+    }
+
+
+def _step_response(run, ev=None, next_p: Optional[dict] = None, counts: Optional[dict] = None) -> ORJSONResponse:
+    # Hot path: serialized once by orjson, skipping response_model revalidation
+    return ORJSONResponse({
+        "run": _run_summary_dict(run),
+        "event": _event_dict(ev) if ev is not None else None,
+        "nextPerson": _next_person_dict(run, next_p),
+        "admittedByAttribute": counts,
+    })
+
+
+async def _refresh_if_shared(session: AsyncSession, run) -> None:
+    # The run was read before the lock; with a lease another worker may have stepped it meanwhile
+    if get_lock_backend().shared:
+        await session.refresh(run)
+
+
+async def _settle_interrupted_step(session: AsyncSession, run) -> None:
+    """Recover a step a crash (or a killed worker) left between the external call and its commit."""
+    if not needs_recovery(run):
+        return
+    # The run was read before taking the lock
+    await session.refresh(run)
+    if not needs_recovery(run):
+        return
+    if not is_abandoned(run):
+        raise HTTPException(status_code=409, detail="a step for this run is in progress")
+    await recover_run(session, run, decide_and_next)
+
+
+async def _claim(session: AsyncSession, run, accept: bool) -> None:
+    try:
+        await claim_pending_person(session, run, accept=accept)
+    except StaleDataError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="concurrent step for this run")
+
+
+async def _decide_claimed(session: AsyncSession, run, person_index: int, accept: bool) -> dict:
+    try:
+        return await decide_and_next(game_id=run.game_id, person_index=person_index, accept=accept)
+    except Exception:
+        # The decision never landed: drop the intent
+        await release_pending_person(session, run)
+        raise
+
+
+async def _record(session: AsyncSession, run, estimator, **fields):
+    try:
+        ev = await record_step(session, run, estimator_json=estimator.to_json(), **fields)
+    except (StaleDataError, IntegrityError):
+        await session.rollback()
+        # The cached estimator already observed this person
+        drop_run_state(run.id)
+        raise HTTPException(status_code=409, detail="concurrent step for this run")
+    sync_run_state(run, estimator)
+    return ev
+
+
+async def _set_status(session: AsyncSession, run_id: str, status: str) -> RunSummary:
+    run = await get_run(session, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="run not found")
+    # Serialized with steps: a write between a step's claim and its record would fail the step's version check
+    async with run_lock(run_id):
+        # The run was read before the lock: a step may have committed meanwhile
+        await session.refresh(run)
+        try:
+            run = await update_run_counts_and_status(
+                session,
+                run,
+                admitted_count=run.admitted_count,
+                rejected_count=run.rejected_count,
+                status=status,
+                pending_person_index=run.pending_person_index,
+                pending_attributes_json=run.pending_attributes_json,
+            )
+        except StaleDataError:
+            # Optimistic backend: a step committed between the refresh and this write
+            await session.rollback()
+            raise HTTPException(status_code=409, detail="concurrent step for this run")
+    return _run_to_summary(run)
+
+
+def _next_person(run, next_p: dict) -> NextPerson:
+    return NextPerson(
+        **next_p,
+        imageUrl=image_url(run.scenario, next_p["personIndex"], next_p["attributes"]),
+    )
+
+
 def _event_to_out(ev) -> EventOut:
     return EventOut(
         id=ev.id,
@@ -84,8 +245,9 @@ async def create_new_run(data: NewRunRequest, session: AsyncSession = Depends(ge
         run_id=run_id,
         scenario=data.scenario,
         game_id=ext["gameId"],
-        constraints=ext.get("constraints", []),
-        attribute_stats=ext.get("attributeStatistics", {}),
+        # Stored in schema shape: fast paths embed these columns verbatim
+        constraints=[Constraint.model_validate(c).model_dump() for c in ext.get("constraints", [])],
+        attribute_stats=AttributeStatistics.model_validate(ext.get("attributeStatistics") or {}).model_dump(),
         capacity_required=settings.CAPACITY_REQUIRED,
     )
     return _run_to_summary(run)
@@ -110,7 +272,7 @@ async def get_events(
     if not run:
         raise HTTPException(status_code=404, detail="run not found")
     items = await list_events(session, run_id, offset=offset, limit=limit)
-    return {"items": [_event_to_out(e).model_dump() for e in items], "offset": offset, "limit": limit}
+    return ORJSONResponse({"items": [_event_dict(e) for e in items], "offset": offset, "limit": limit})
 
 
 @router.post("/runs/{run_id}/step", response_model=StepResponse)
@@ -122,12 +284,11 @@ async def step_run(
     run = await get_run(session, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="run not found")
-    lock = await get_lock(run_id)
-    async with lock:
+    async with steps.track(), run_lock(run_id):
+        await _refresh_if_shared(session, run)
+        await _settle_interrupted_step(session, run)
         # Validate person index order
-        last_event = await get_last_event(session, run_id)
-        last_index = last_event.person_index if last_event else None
-        validate_next_person_index(last_index, data.personIndex)
+        validate_next_person_index(run.last_person_index, data.personIndex)
 
         # First fetch only: personIndex == 0 and accept is None
         if data.personIndex == 0 and data.accept is None:
@@ -165,7 +326,7 @@ async def step_run(
                 pending_person_index=next_p["personIndex"],
                 pending_attributes_json=json.dumps(next_p["attributes"]),
             )
-            return StepResponse(run=_run_to_summary(run), event=None, nextPerson=NextPerson(**next_p))
+            return StepResponse(run=_run_to_summary(run), event=None, nextPerson=_next_person(run, next_p))
 
         # For decisions (personIndex > 0 or ==0 with accept present)
         if data.accept is None:
@@ -175,10 +336,12 @@ async def step_run(
         if run.pending_person_index != data.personIndex or not run.pending_attributes_json:
             raise HTTPException(status_code=409, detail="pending person mismatch or missing")
 
-        # Decide and call external
-        ext = await decide_and_next(
-            game_id=run.game_id, person_index=data.personIndex, accept=data.accept
-        )
+        # Taken before the claim moves the run version past the cached estimator's
+        estimator = get_run_state(run).estimator
+
+        # Claim the person, then decide and call external
+        await _claim(session, run, bool(data.accept))
+        ext = await _decide_claimed(session, run, data.personIndex, bool(data.accept))
         if ext.get("status") == "failed":
             await update_run_counts_and_status(
                 session,
@@ -188,25 +351,21 @@ async def step_run(
                 status="failed",
                 pending_person_index=None,
                 pending_attributes_json=None,
+                clear_in_flight=True,
             )
             raise HTTPException(status_code=502, detail=ext.get("reason", "external failed"))
 
-        # Persist event for current person
-        ev = await add_event(
-            session,
-            run_id=run_id,
-            person_index=data.personIndex,
-            attributes_json=run.pending_attributes_json,
-            accepted=bool(data.accept),
-            admitted_count=int(ext.get("admittedCount", 0)),
-            rejected_count=int(ext.get("rejectedCount", 0)),
-        )
+        estimator.observe(json.loads(run.pending_attributes_json))
 
-        # Update run counts and pending next person
+        # Persist the event, counts and next pending person together
         next_p = ext.get("nextPerson")
-        run = await update_run_counts_and_status(
+        ev = await _record(
             session,
             run,
+            estimator,
+            person_index=data.personIndex,
+            attributes_json=run.pending_attributes_json,
+            accepted=bool(data.accept),
             admitted_count=int(ext.get("admittedCount", 0)),
             rejected_count=int(ext.get("rejectedCount", 0)),
             status=ext.get("status", run.status),
@@ -214,12 +373,11 @@ async def step_run(
             pending_attributes_json=(json.dumps(next_p["attributes"]) if next_p else None),
         )
 
-        # Compute updated admitted-by-attribute for convenience
-        counts = await count_admitted_by_attribute(session, run_id)
+        counts = admitted_by_attribute(run)
         return StepResponse(
             run=_run_to_summary(run),
             event=_event_to_out(ev),
-            nextPerson=(NextPerson(**next_p) if next_p else None),
+            nextPerson=(_next_person(run, next_p) if next_p else None),
             admittedByAttribute=counts,
         )
 
@@ -230,15 +388,17 @@ async def auto_step_run(
     data: AutoStepRequest,
     session: AsyncSession = Depends(get_session),
 ):
-    run = await get_run(session, run_id)
+    with _phase("db_read"):
+        run = await get_run(session, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="run not found")
-    lock = await get_lock(run_id)
-    async with lock:
-        # Validate person index order versus last event
-        last_event = await get_last_event(session, run_id)
-        last_index = last_event.person_index if last_event else None
-        validate_next_person_index(last_index, data.personIndex)
+    async with steps.track(), run_lock(run_id):
+        with _phase("db_read"):
+            await _refresh_if_shared(session, run)
+        with _phase("recovery"):
+            await _settle_interrupted_step(session, run)
+        # Validate person index order versus the last recorded event
+        validate_next_person_index(run.last_person_index, data.personIndex)
 
         # If personIndex == 0 and no pending, fetch first person and cache
         if data.personIndex == 0 and run.pending_person_index is None:
@@ -265,40 +425,46 @@ async def auto_step_run(
                     pending_person_index=None,
                     pending_attributes_json=None,
                 )
-                return StepResponse(run=_run_to_summary(run), event=None, nextPerson=None)
+                return _step_response(run)
             run = await set_run_pending_person(
                 session,
                 run,
                 pending_person_index=next_p["personIndex"],
                 pending_attributes_json=json.dumps(next_p["attributes"]),
             )
-            return StepResponse(run=_run_to_summary(run), event=None, nextPerson=NextPerson(**next_p))
+            return _step_response(run, next_p=next_p)
 
         # We must have a pending person for this index
         if run.pending_person_index != data.personIndex or not run.pending_attributes_json:
             raise HTTPException(status_code=409, detail="pending person mismatch or missing")
 
         # Decide using selected strategy
-        constraints = json.loads(run.constraints_json)
-        admitted_by_attr = await count_admitted_by_attribute(session, run_id)
+        run_state = get_run_state(run)
+        constraints = run_state.static.constraints
+        admitted_by_attr = admitted_by_attribute(run)
         person_attrs = json.loads(run.pending_attributes_json)
-        attr_stats = json.loads(run.attribute_stats_json)
-        rel_freqs = attr_stats.get("relativeFrequencies", {}) if isinstance(attr_stats, dict) else {}
+        rel_freqs = run_state.static.relative_frequencies
+        estimator = run_state.estimator
+        if data.useOnlineEstimates:
+            rel_freqs = estimator.relative_frequencies()
         strategy = data.strategy or "greedy_tightness"
-        accept = decide_accept(
-            strategy=strategy,
-            person_attributes=person_attrs,
-            constraints=constraints,
-            admitted_count_by_attr=admitted_by_attr,
-            admitted_count=run.admitted_count,
-            capacity_required=run.capacity_required,
-            relative_frequencies=rel_freqs,
-        )
+        with _phase("strategy"):
+            accept = run_state.decisions.decide(
+                strategy=strategy,
+                person_attributes=person_attrs,
+                constraints=constraints,
+                admitted_count_by_attr=admitted_by_attr,
+                admitted_count=run.admitted_count,
+                capacity_required=run.capacity_required,
+                relative_frequencies=rel_freqs,
+                horizon=data.horizon,
+            )
 
-        # Call external with decision
-        ext = await decide_and_next(
-            game_id=run.game_id, person_index=data.personIndex, accept=accept
-        )
+        # Claim the person, then call external with the decision
+        with _phase("db_write"):
+            await _claim(session, run, accept)
+        with _phase("external_call"):
+            ext = await _decide_claimed(session, run, data.personIndex, accept)
         if ext.get("status") == "failed":
             await update_run_counts_and_status(
                 session,
@@ -308,74 +474,40 @@ async def auto_step_run(
                 status="failed",
                 pending_person_index=None,
                 pending_attributes_json=None,
+                clear_in_flight=True,
             )
             raise HTTPException(status_code=502, detail=ext.get("reason", "external failed"))
 
-        # Persist current event
-        ev = await add_event(
-            session,
-            run_id=run_id,
-            person_index=data.personIndex,
-            attributes_json=run.pending_attributes_json,
-            accepted=bool(accept),
-            admitted_count=int(ext.get("admittedCount", 0)),
-            rejected_count=int(ext.get("rejectedCount", 0)),
-        )
-
-        # Update run and pending
-        next_p = ext.get("nextPerson")
-        run = await update_run_counts_and_status(
-            session,
-            run,
-            admitted_count=int(ext.get("admittedCount", 0)),
-            rejected_count=int(ext.get("rejectedCount", 0)),
-            status=ext.get("status", run.status),
-            pending_person_index=(next_p["personIndex"] if next_p else None),
-            pending_attributes_json=(json.dumps(next_p["attributes"]) if next_p else None),
-        )
+        # Persist the event, counts and next pending person together
+        with _phase("event_persist"):
+            estimator.observe(person_attrs)
+            next_p = ext.get("nextPerson")
+            ev = await _record(
+                session,
+                run,
+                estimator,
+                person_index=data.personIndex,
+                attributes_json=run.pending_attributes_json,
+                accepted=bool(accept),
+                admitted_count=int(ext.get("admittedCount", 0)),
+                rejected_count=int(ext.get("rejectedCount", 0)),
+                status=ext.get("status", run.status),
+                pending_person_index=(next_p["personIndex"] if next_p else None),
+                pending_attributes_json=(json.dumps(next_p["attributes"]) if next_p else None),
+            )
 
-        # Compute updated admitted-by-attribute for convenience
-        counts = await count_admitted_by_attribute(session, run_id)
-        return StepResponse(
-            run=_run_to_summary(run),
-            event=_event_to_out(ev),
-            nextPerson=(NextPerson(**next_p) if next_p else None),
-            admittedByAttribute=counts,
-        )
+        with _phase("serialize"):
+            return _step_response(run, ev, next_p, admitted_by_attribute(run))
 
 
 @router.post("/runs/{run_id}/pause", response_model=RunSummary)
 async def pause_run(run_id: str, session: AsyncSession = Depends(get_session)):
-    run = await get_run(session, run_id)
-    if not run:
-        raise HTTPException(status_code=404, detail="run not found")
-    run = await update_run_counts_and_status(
-        session,
-        run,
-        admitted_count=run.admitted_count,
-        rejected_count=run.rejected_count,
-        status="paused",
-        pending_person_index=run.pending_person_index,
-        pending_attributes_json=run.pending_attributes_json,
-    )
-    return _run_to_summary(run)
+    return await _set_status(session, run_id, "paused")
 
 
 @router.post("/runs/{run_id}/resume", response_model=RunSummary)
 async def resume_run(run_id: str, session: AsyncSession = Depends(get_session)):
-    run = await get_run(session, run_id)
-    if not run:
-        raise HTTPException(status_code=404, detail="run not found")
-    run = await update_run_counts_and_status(
-        session,
-        run,
-        admitted_count=run.admitted_count,
-        rejected_count=run.rejected_count,
-        status="running",
-        pending_person_index=run.pending_person_index,
-        pending_attributes_json=run.pending_attributes_json,
-    )
-    return _run_to_summary(run)
+    return await _set_status(session, run_id, "running")
 
 
 @router.get("/runs/{run_id}/export", response_model=ExportResponse)
@@ -384,10 +516,7 @@ async def export_run(run_id: str, session: AsyncSession = Depends(get_session)):
     if not run:
         raise HTTPException(status_code=404, detail="run not found")
     events = await list_all_events(session, run_id)
-    return ExportResponse(
-        run=_run_to_summary(run),
-        events=[_event_to_out(e) for e in events],
-    )
+    return ORJSONResponse({"run": _run_summary_dict(run), "events": [_event_dict(e) for e in events]})
 
 
 @router.get("/runs/{run_id}/admitted-by-attribute", response_model=AdmittedByAttributeResponse)
@@ -395,5 +524,31 @@ async def get_admitted_by_attribute(run_id: str, session: AsyncSession = Depends
     run = await get_run(session, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="run not found")
-    counts = await count_admitted_by_attribute(session, run_id)
-    return {"counts": counts}
+    return {"counts": admitted_by_attribute(run)}
+
+
+@router.get("/runs/{run_id}/estimates", response_model=EstimatesResponse)
+async def get_estimates(run_id: str, session: AsyncSession = Depends(get_session)):
+    run = await get_run(session, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="run not found")
+    estimator = get_run_state(run).estimator
+    return EstimatesResponse(
+        observed=estimator.observed,
+        relativeFrequencies=estimator.relative_frequencies(),
+        correlations=estimator.correlations(),
+    )
+
+
+@router.get("/images/{scenario}/{filename}")
+async def get_person_image(scenario: int, filename: str):
+    path = image_file(scenario, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="image not found")
+    # Filenames are content-hashed, so a URL never changes content
+    return FileResponse(path, headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+
+
+@router.get("/strategies/lookahead/stats", response_model=LookaheadStatsResponse)
+async def get_lookahead_stats():
+    return lookahead_stats()
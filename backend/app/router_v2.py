@@ -3,13 +3,14 @@ from __future__ import annotations
 import uuid
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .db import get_session
-from .repo_v2 import get_or_create_profile, update_display_name, get_leaderboard, record_run_completion
 from .schemas import ProfileResponse, UpdateDisplayNameRequest, LeaderboardResponse, LeaderboardEntry
 from .repo import get_run
 
+# repo_v2 (and models_v2) load on the first profile/leaderboard request
 
 router_v2 = APIRouter(prefix="/api", tags=["v2"])
 
@@ -39,6 +40,8 @@ async def get_profile(
     session: AsyncSession = Depends(get_session)
 ):
     """Get or create user profile"""
+    from .repo_v2 import get_or_create_profile
+
     guest_id = get_guest_id(request, response)
     profile = await get_or_create_profile(session, guest_id)
     
@@ -56,6 +59,8 @@ async def update_profile_name(
     session: AsyncSession = Depends(get_session)
 ):
     """Update display name"""
+    from .repo_v2 import update_display_name
+
     guest_id = get_guest_id(request, response)
     
     try:
@@ -76,8 +81,11 @@ async def update_profile_name(
 @router_v2.get("/leaderboard", response_model=LeaderboardResponse)
 async def get_leaderboard_data(session: AsyncSession = Depends(get_session)):
     """Get global leaderboard"""
+    from .repo_v2 import get_leaderboard
+
     entries = await get_leaderboard(session)
-    return LeaderboardResponse(entries=entries)
+    # Rows are already in LeaderboardEntry shape; skip per-entry model validation
+    return ORJSONResponse({"entries": entries})
 
 
 @router_v2.post("/runs/{run_id}/complete")
@@ -88,6 +96,8 @@ async def complete_run(
     session: AsyncSession = Depends(get_session)
 ):
     """Mark a run as completed and record it for leaderboard"""
+    from .repo_v2 import record_run_completion
+
     guest_id = get_guest_id(request, response)
     
     # Get run details
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+from .config import settings
+from .decision_table import DecisionTableCache
+from .estimator import FrequencyEstimator
+from .models import Run
+from .schemas import AttributeStatistics, Constraint
+
+
+@dataclass(frozen=True)
+class RunStatic:
+    """
+    Run fields fixed at creation (constraints, attribute statistics), parsed
+    and validated once, plus their pre-serialized RunSummary fragments.
+    """
+
+    constraints: List[Dict[str, Any]]
+    attribute_stats: Dict[str, Any]
+    constraint_models: List[Constraint]
+    stats_model: AttributeStatistics
+    constraints_fragment: orjson.Fragment
+    stats_fragment: orjson.Fragment
+
+    @property
+    def relative_frequencies(self) -> Dict[str, float]:
+        return self.attribute_stats["relativeFrequencies"]
+
+    @classmethod
+    def from_run(cls, run: Run) -> "RunStatic":
+        models = [Constraint.model_validate(c) for c in json.loads(run.constraints_json)]
+        stats = AttributeStatistics.model_validate(json.loads(run.attribute_stats_json) or {})
+        constraints = [c.model_dump() for c in models]
+        attribute_stats = stats.model_dump()
+        return cls(
+            constraints=constraints,
+            attribute_stats=attribute_stats,
+            constraint_models=models,
+            stats_model=stats,
+            constraints_fragment=orjson.Fragment(orjson.dumps(constraints)),
+            stats_fragment=orjson.Fragment(orjson.dumps(attribute_stats)),
+        )
+
+
+@dataclass
+class RunState:
+    """
+    In-process state derived from a Run row, rehydrated lazily after restarts.
+
+    ``version`` is the ``runs.version`` the estimator is known to match. A row
+    at another version was written elsewhere (another worker, or a step that
+    did not complete here), so the estimator is reloaded from its checkpoint.
+    """
+
+    estimator: FrequencyEstimator
+    static: RunStatic
+    decisions: DecisionTableCache = field(default_factory=DecisionTableCache)
+    version: Optional[int] = None
+
+
+def _load_estimator(run: Run, static: RunStatic) -> FrequencyEstimator:
+    if run.estimator_json:
+        return FrequencyEstimator.from_json(run.estimator_json)
+    return FrequencyEstimator.from_attribute_stats(static.attribute_stats, constraints=static.constraints)
+
+
+# LRU over active runs; an evicted run is rebuilt from its row (estimator checkpoint included)
+_states: "OrderedDict[str, RunState]" = OrderedDict()
+
+
+def get_run_state(run: Run) -> RunState:
+    state = _states.get(run.id)
+    if state is not None:
+        _states.move_to_end(run.id)
+        if state.version != run.version:
+            state.estimator = _load_estimator(run, state.static)
+            state.version = run.version
+    else:
+        static = RunStatic.from_run(run)
+        state = RunState(estimator=_load_estimator(run, static), static=static, version=run.version)
+        _states[run.id] = state
+        if len(_states) > settings.RUN_STATE_CACHE_SIZE:
+            _states.popitem(last=False)
+    return state
+
+
+def get_run_static(run: Run) -> RunStatic:
+    """Fixed-at-creation fields only: never stale, so no version check."""
+    state = _states.get(run.id)
+    return state.static if state is not None else get_run_state(run).static
+
+
+def sync_run_state(run: Run, estimator: FrequencyEstimator) -> None:
+    """
+    ``estimator`` was just checkpointed with ``run``. Store it with the row's new
+    version: a reader between the step's claim and its commit may have swapped
+    in a reload that never saw the step's person.
+    """
+    state = _states.get(run.id)
+    if state is not None:
+        state.estimator = estimator
+        state.version = run.version
+
+
+def drop_run_state(run_id: str) -> Optional[RunState]:
+    return _states.pop(run_id, None)
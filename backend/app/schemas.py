@@ -34,6 +34,8 @@ class RunSummary(BaseModel):
 class NextPerson(BaseModel):
     personIndex: int
     attributes: Dict[str, bool]
+    # Resolved from the generator's image index; immutable, cache forever
+    imageUrl: Optional[str] = None
 
 
 class StepRequest(BaseModel):
@@ -44,6 +46,8 @@ class StepRequest(BaseModel):
 class AutoStepRequest(BaseModel):
     personIndex: int
     strategy: str | None = None
+    useOnlineEstimates: bool = False
+    horizon: int | None = Field(default=None, ge=1, le=6)
 
 
 class EventOut(BaseModel):
@@ -78,6 +82,24 @@ class AdmittedByAttributeResponse(BaseModel):
     counts: Dict[str, int]
 
 
+class LookaheadStatsResponse(BaseModel):
+    decisions: int
+    avgDecisionMs: float
+    maxDecisionMs: float
+    budgetExhausted: int
+    cacheHits: int
+    cacheMisses: int
+    cacheHitRate: float
+    cacheEntries: int
+    evaluators: int
+
+
+class EstimatesResponse(BaseModel):
+    observed: int
+    relativeFrequencies: Dict[str, float]
+    correlations: Dict[str, Dict[str, float]]
+
+
 # V2 Schemas for new features
 class ProfileResponse(BaseModel):
     guest_id: str
@@ -3,9 +3,10 @@ from __future__ import annotations
 from typing import Any, Dict, Optional
 
 import httpx
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+from tenacity import RetryCallState, retry, stop_after_attempt, wait_fixed, retry_if_exception_type
 
 from .config import settings
+from .metrics import external_requests, external_retries
 
 
 _client: Optional[httpx.AsyncClient] = None
@@ -18,23 +19,49 @@ def get_client() -> httpx.AsyncClient:
     return _client
 
 
-@retry(wait=wait_fixed(0.2), stop=stop_after_attempt(3), retry=retry_if_exception_type(httpx.TransportError))
-async def new_game(*, scenario: int) -> Dict[str, Any]:
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _count_retry(retry_state: RetryCallState) -> None:
+    external_retries.inc(endpoint=retry_state.fn.__name__ if retry_state.fn else "unknown")
+
+
+async def _get(endpoint: str, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
     client = get_client()
-    resp = await client.get("/new-game", params={"scenario": scenario, "playerId": settings.PLAYER_ID})
-    resp.raise_for_status()
+    try:
+        resp = await client.get(path, params=params)
+        resp.raise_for_status()
+    except httpx.HTTPError:
+        external_requests.inc(endpoint=endpoint, outcome="error")
+        raise
+    external_requests.inc(endpoint=endpoint, outcome="ok")
     return resp.json()
 
 
-@retry(wait=wait_fixed(0.2), stop=stop_after_attempt(3), retry=retry_if_exception_type(httpx.TransportError))
+@retry(
+    wait=wait_fixed(0.2),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(httpx.TransportError),
+    before_sleep=_count_retry,
+)
+async def new_game(*, scenario: int) -> Dict[str, Any]:
+    return await _get("new_game", "/new-game", {"scenario": scenario, "playerId": settings.PLAYER_ID})
+
+
+@retry(
+    wait=wait_fixed(0.2),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(httpx.TransportError),
+    before_sleep=_count_retry,
+)
 async def decide_and_next(
     *, game_id: str, person_index: int, accept: Optional[bool]
 ) -> Dict[str, Any]:
-    client = get_client()
     params = {"gameId": game_id, "personIndex": person_index}
     if accept is not None:
         params["accept"] = "true" if accept else "false"
-    resp = await client.get("/decide-and-next", params=params)
-    resp.raise_for_status()
-    return resp.json()
-
+    return await _get("decide_and_next", "/decide-and-next", params)
@@ -7,10 +7,28 @@ from typing import Dict, List, Optional
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .config import settings
+from .lookahead import get_evaluator
 from .models import Event, Run
+from .repo import count_true_attributes
 from .utils import from_json
 
 
+STRATEGIES = (
+    "greedy_tightness",
+    "expected_feasible",
+    "risk_adjusted_feasible",
+    "proportional_control",
+    "lookahead_1",
+    "lookahead_k",
+)
+
+
+def is_known_strategy(strategy: str) -> bool:
+    st = strategy.lower().replace("-", "_")
+    return st in STRATEGIES or _lookahead_horizon(st, None) is not None
+
+
 def validate_next_person_index(last_index: Optional[int], incoming_index: int) -> None:
     if last_index is None:
         if incoming_index != 0:
@@ -224,6 +242,55 @@ def decide_accept_lookahead_1(
     return False
 
 
+def decide_accept_lookahead_k(
+    *,
+    person_attributes: Dict[str, bool],
+    constraints: List[Dict],
+    admitted_count_by_attr: Dict[str, int],
+    admitted_count: int,
+    capacity_required: int,
+    relative_frequencies: Dict[str, float],
+    horizon: int,
+    samples: int = 0,
+    time_budget_ms: float | None = None,
+) -> bool:
+    remaining = max(0, capacity_required - admitted_count)
+    if remaining == 0:
+        return False
+    deficits = _compute_deficits(constraints=constraints, admitted_count_by_attr=admitted_count_by_attr)
+    if not _has_any_deficits(deficits):
+        return True
+    attrs = list(deficits.keys())
+    evaluator = get_evaluator(
+        relative_frequencies=relative_frequencies,
+        attributes=attrs,
+        horizon=horizon,
+        samples=samples,
+    )
+    return evaluator.decide(
+        person_has=tuple(person_attributes.get(a) is True for a in attrs),
+        remaining=remaining,
+        deficits=tuple(deficits[a] for a in attrs),
+        time_budget_ms=settings.LOOKAHEAD_TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms,
+    )
+
+
+# Same bound as AutoStepRequest.horizon: the search is exponential in the horizon
+MAX_LOOKAHEAD_HORIZON = 6
+
+
+def _lookahead_horizon(strategy: str, horizon: int | None) -> int | None:
+    # "lookahead_k" uses the requested/default horizon; "lookahead_<n>" pins it
+    if strategy == "lookahead_k":
+        return horizon or settings.LOOKAHEAD_HORIZON
+    prefix = "lookahead_"
+    if strategy.startswith(prefix) and strategy[len(prefix):].isdigit():
+        k = int(strategy[len(prefix):])
+        # Out-of-range horizons are not a strategy (unknown, like any other name)
+        return k if 1 <= k <= MAX_LOOKAHEAD_HORIZON else None
+    return None
+
+
 def decide_accept(
     *,
     strategy: str,
@@ -233,6 +300,7 @@ def decide_accept(
     admitted_count: int,
     capacity_required: int,
     relative_frequencies: Dict[str, float] | None = None,
+    horizon: int | None = None,
 ) -> bool:
     st = strategy.lower().replace("-", "_") if strategy else "greedy_tightness"
     if st == "greedy_tightness":
@@ -279,6 +347,18 @@ def decide_accept(
             capacity_required=capacity_required,
             relative_frequencies=relative_frequencies or {},
         )
+    k = _lookahead_horizon(st, horizon)
+    if k is not None:
+        return decide_accept_lookahead_k(
+            person_attributes=person_attributes,
+            constraints=constraints,
+            admitted_count_by_attr=admitted_count_by_attr,
+            admitted_count=admitted_count,
+            capacity_required=capacity_required,
+            relative_frequencies=relative_frequencies or {},
+            horizon=k,
+            samples=settings.LOOKAHEAD_SAMPLES,
+        )
     # Fallback
     return decide_accept_greedy(
         person_attributes=person_attributes,
@@ -298,8 +378,5 @@ async def count_admitted_by_attribute(session: AsyncSession, run_id: str) -> Dic
     res = await session.execute(stmt)
     counts: Dict[str, int] = {}
     for ev in res.scalars():
-        attrs = json.loads(ev.attributes_json)
-        for k, v in attrs.items():
-            if v is True:
-                counts[k] = counts.get(k, 0) + 1
+        count_true_attributes(counts, json.loads(ev.attributes_json))
     return counts
@@ -0,0 +1,75 @@
+from itertools import product
+
+from app.decision_table import DecisionTableCache, person_mask
+from app.service_logic import decide_accept
+
+
+CONSTRAINTS = [
+    {"attribute": "berlin", "minCount": 400},
+    {"attribute": "black", "minCount": 600},
+    {"attribute": "techno", "minCount": 300},
+]
+REL = {"berlin": 0.4, "black": 0.6, "techno": 0.3}
+
+
+def test_person_mask_uses_attribute_order():
+    attrs = ["berlin", "black", "techno"]
+    assert person_mask({"berlin": True, "techno": True, "other": True}, attrs) == 0b101
+    assert person_mask({}, attrs) == 0
+
+
+def test_table_matches_direct_strategy_for_every_person_type():
+    counts = {"berlin": 350, "black": 500, "techno": 300}
+    for strategy in ("greedy_tightness", "expected_feasible", "risk_adjusted_feasible", "proportional_control", "lookahead_1"):
+        cache = DecisionTableCache()
+        for flags in product((False, True), repeat=3):
+            person = dict(zip(["berlin", "black", "techno"], flags))
+            kwargs = dict(
+                person_attributes=person,
+                constraints=CONSTRAINTS,
+                admitted_count_by_attr=counts,
+                admitted_count=900,
+                capacity_required=1000,
+                relative_frequencies=REL,
+            )
+            assert cache.decide(strategy=strategy, **kwargs) == decide_accept(strategy=strategy, **kwargs)
+
+
+def test_greedy_table_survives_until_a_deficit_closes():
+    cache = DecisionTableCache()
+    person = {"berlin": True, "black": False, "techno": False}
+    for admitted in (100, 101, 102):
+        cache.decide(
+            strategy="greedy_tightness",
+            person_attributes=person,
+            constraints=CONSTRAINTS,
+            admitted_count_by_attr={"berlin": 10, "black": 10, "techno": 10},
+            admitted_count=admitted,
+            capacity_required=1000,
+        )
+    assert cache.builds == 1
+    assert cache.hits == 2
+    cache.decide(
+        strategy="greedy_tightness",
+        person_attributes=person,
+        constraints=CONSTRAINTS,
+        admitted_count_by_attr={"berlin": 10, "black": 10, "techno": 300},
+        admitted_count=103,
+        capacity_required=1000,
+    )
+    assert cache.builds == 2
+
+
+def test_strategies_reading_exact_state_are_not_tabled():
+    cache = DecisionTableCache()
+    for admitted in (100, 101):
+        cache.decide(
+            strategy="expected_feasible",
+            person_attributes={"berlin": False, "black": False, "techno": False},
+            constraints=CONSTRAINTS,
+            admitted_count_by_attr={"berlin": 10, "black": 10, "techno": 10},
+            admitted_count=admitted,
+            capacity_required=1000,
+            relative_frequencies=REL,
+        )
+    assert cache.builds == cache.hits == cache.misses == 0
@@ -0,0 +1,44 @@
+from app.estimator import FrequencyEstimator
+
+
+def _stats():
+    return {
+        "relativeFrequencies": {"berlin": 0.4, "black": 0.6},
+        "correlations": {"berlin": {"black": 0.0}, "black": {"berlin": 0.0}},
+    }
+
+
+def test_prior_matches_static_frequencies_before_observations():
+    est = FrequencyEstimator.from_attribute_stats(_stats())
+    freqs = est.relative_frequencies()
+    assert abs(freqs["berlin"] - 0.4) < 1e-9
+    assert abs(freqs["black"] - 0.6) < 1e-9
+
+
+def test_observations_shift_posterior_towards_data():
+    est = FrequencyEstimator.from_attribute_stats(_stats(), prior_strength=10)
+    for _ in range(90):
+        est.observe({"berlin": True, "black": True})
+    freqs = est.relative_frequencies()
+    # (10 * 0.4 + 90) / (10 + 90)
+    assert abs(freqs["berlin"] - 0.94) < 1e-9
+    assert est.correlations()["berlin"]["black"] > 0
+
+
+def test_checkpoint_round_trip():
+    est = FrequencyEstimator.from_attribute_stats(
+        _stats(), constraints=[{"attribute": "techno", "minCount": 10}]
+    )
+    est.observe({"berlin": True, "black": False, "techno": True})
+    restored = FrequencyEstimator.from_json(est.to_json())
+    assert restored.observed == 1
+    assert restored.relative_frequencies() == est.relative_frequencies()
+    assert restored.correlations() == est.correlations()
+
+
+def test_one_sided_prior_correlation_applies_to_both_orders():
+    stats = {"relativeFrequencies": {"berlin": 0.4, "black": 0.6}, "correlations": {"black": {"berlin": -0.5}}}
+    est = FrequencyEstimator.from_attribute_stats(stats)
+    corr = est.correlations()
+    assert abs(corr["berlin"]["black"] + 0.5) < 1e-9
+    assert corr["berlin"]["black"] == corr["black"]["berlin"]
@@ -0,0 +1,83 @@
+import json
+from datetime import datetime
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+from app.models import Event, Run
+from app.run_cache import drop_run_state
+from app.router_public import _event_dict, _event_to_out, _run_summary_dict, _run_to_summary, _step_response
+from app.schemas import EventsPage, LeaderboardResponse, NextPerson, StepResponse
+
+
+def _run():
+    return Run(
+        id="r1",
+        scenario=1,
+        game_id="g1",
+        status="running",
+        constraints_json=json.dumps([{"attribute": "berlin", "minCount": 300}]),
+        attribute_stats_json=json.dumps({
+            "relativeFrequencies": {"berlin": 0.4, "black": 0.6},
+            "correlations": {"berlin": {"black": -0.2}},
+        }),
+        admitted_count=3,
+        rejected_count=2,
+        capacity_required=1000,
+        pending_person_index=6,
+    )
+
+
+def _event(i=5):
+    return Event(
+        id=i,
+        run_id="r1",
+        person_index=i,
+        attributes_json=json.dumps({"berlin": True, "black": False}),
+        accepted=True,
+        admitted_count=3,
+        rejected_count=2,
+        created_at=datetime(2024, 1, 2, 3, 4, 5, 678),
+    )
+
+
+def _body(content):
+    return orjson.loads(ORJSONResponse(content).body)
+
+
+def test_run_and_event_fast_paths_match_schemas():
+    run, ev = _run(), _event()
+    assert _body(_run_summary_dict(run)) == _run_to_summary(run).model_dump(mode="json")
+    assert _body(_event_dict(ev)) == _event_to_out(ev).model_dump(mode="json")
+    page = {"items": [_event_dict(ev)], "offset": 0, "limit": 200}
+    assert _body(page) == EventsPage(items=[_event_to_out(ev)], offset=0, limit=200).model_dump(mode="json")
+
+
+def test_step_response_fast_path_matches_schema():
+    run, ev = _run(), _event()
+    next_p = {"personIndex": 6, "attributes": {"berlin": False, "black": True}}
+    expected = StepResponse(
+        run=_run_to_summary(run),
+        event=_event_to_out(ev),
+        nextPerson=NextPerson(**next_p),
+        admittedByAttribute={"berlin": 1},
+    )
+    assert orjson.loads(_step_response(run, ev, next_p, {"berlin": 1}).body) == expected.model_dump(mode="json")
+    bare = StepResponse(run=_run_to_summary(run)).model_dump(mode="json")
+    assert orjson.loads(_step_response(run).body) == bare
+
+
+def test_leaderboard_rows_match_schema():
+    entries = [{"name": "a", "scenarios_completed": 2, "total_rejections": 900, "last_completion": "2024-01-01T00:00:00", "best_run_id": None}]
+    assert _body({"entries": entries}) == LeaderboardResponse(entries=entries).model_dump(mode="json")
+
+
+def test_static_run_fields_are_parsed_once_per_run():
+    run = _run()
+    run.id = "r-static"
+    first = _run_summary_dict(run)
+    run.constraints_json = "not json"  # never re-read while the run state is cached
+    second = _run_summary_dict(run)
+    assert second["constraints"] is first["constraints"]
+    assert _run_to_summary(run).constraints[0].minCount == 300
+    drop_run_state(run.id)
@@ -0,0 +1,42 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.image_index import image_file, image_url
+from app.main import app
+
+
+def _write_index(root, scenario=3):
+    d = root / f"scenario_{scenario}"
+    (d / "hashed").mkdir(parents=True)
+    (d / "hashed" / "a__UV1_I0.abc123.webp").write_bytes(b"RIFF0000WEBP")
+    (d / "hashed" / "b__UV1_I0.def456.webp").write_bytes(b"RIFF0000WEBP")
+    (d / "index.json").write_text(json.dumps({
+        "scenario": scenario,
+        "version": "v1",
+        "attributes": ["underground_veteran", "international"],
+        "tokens": {"underground_veteran": "UV", "international": "I"},
+        "mapping": {"UV1_I0": ["a__UV1_I0.abc123.webp", "b__UV1_I0.def456.webp"]},
+    }))
+
+
+def test_image_url_resolves_signature_and_is_stable_per_person(tmp_path, monkeypatch):
+    _write_index(tmp_path)
+    monkeypatch.setattr(settings, "IMAGE_INDEX_DIR", str(tmp_path))
+    attrs = {"underground_veteran": True, "international": False}
+    assert image_url(3, 4, attrs) == "/api/images/3/a__UV1_I0.abc123.webp"
+    assert image_url(3, 5, attrs) == "/api/images/3/b__UV1_I0.def456.webp"
+    assert image_url(3, 4, {"underground_veteran": False}) is None
+    assert image_url(1, 4, attrs) is None
+    assert image_file(3, "../index.json") is None
+
+
+def test_image_endpoint_sets_immutable_cache_headers(tmp_path, monkeypatch):
+    _write_index(tmp_path)
+    monkeypatch.setattr(settings, "IMAGE_INDEX_DIR", str(tmp_path))
+    client = TestClient(app)
+    r = client.get("/api/images/3/a__UV1_I0.abc123.webp")
+    assert r.status_code == 200
+    assert r.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get("/api/images/3/missing.webp").status_code == 404
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+# Loaded on first use (external call, profile/leaderboard request), never at boot
+LAZY_MODULES = {"httpx", "tenacity", "app.service_external", "app.repo_v2", "app.models_v2"}
+
+# Cumulative import time of app.main (measured ~0.9 s warm, ~1.5 s cold); a
+# regression such as an eager heavy import should not fit in the margin
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "2000"))
+
+
+def _import_profile():
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cum) / 1000.0
+    return cumulative
+
+
+def test_app_import_stays_lean():
+    profile = _import_profile()
+    assert not LAZY_MODULES & profile.keys()
+    assert profile["app.main"] < BUDGET_MS, f"app.main imports in {profile['app.main']:.0f} ms"
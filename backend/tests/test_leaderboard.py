@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.db import Base, get_session
+from app.main import app
+from app.models_v2 import Profile, RunCompletion
+
+
+def _completion(guest_id, run_id, scenario, rejected, completed_at, success=True):
+    return dict(
+        guest_id=guest_id,
+        run_id=run_id,
+        scenario=scenario,
+        completed_at=completed_at,
+        admitted_count=1000,
+        rejected_count=rejected,
+        capacity_required=1000,
+        success=success,
+    )
+
+
+def test_leaderboard_ranks_by_scenarios_then_rejections(tmp_path, monkeypatch):
+    sync_engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite3'}")
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(
+            Profile.__table__.insert(),
+            [
+                {"guest_id": "g1", "display_name": "Guest0001"},
+                {"guest_id": "g2", "display_name": "Guest0002"},
+                {"guest_id": "g3", "display_name": "Guest0003"},
+            ],
+        )
+        conn.execute(
+            RunCompletion.__table__.insert(),
+            [
+                _completion("g1", "a", 1, 900, datetime(2025, 1, 1)),
+                _completion("g2", "b", 1, 500, datetime(2025, 1, 2)),
+                _completion("g2", "c", 2, 700, datetime(2025, 1, 3)),
+                _completion("g1", "d", 2, 100, datetime(2025, 1, 4)),
+                _completion("g3", "e", 1, 10, datetime(2025, 1, 5), success=False),
+            ],
+        )
+    sync_engine.dispose()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}", poolclass=NullPool)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def session_override():
+        async with Session() as session:
+            yield session
+
+    monkeypatch.setitem(app.dependency_overrides, get_session, session_override)
+    r = TestClient(app).get("/api/leaderboard")
+    assert r.status_code == 200
+    assert r.json()["entries"] == [
+        {
+            "name": "Guest0001",
+            "scenarios_completed": 2,
+            "total_rejections": 1000,
+            "last_completion": "2025-01-04T00:00:00",
+            "best_run_id": "d",
+        },
+        {
+            "name": "Guest0002",
+            "scenarios_completed": 2,
+            "total_rejections": 1200,
+            "last_completion": "2025-01-03T00:00:00",
+            "best_run_id": "c",
+        },
+    ]
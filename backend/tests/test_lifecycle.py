@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app.lifecycle import ShuttingDown, StepTracker
+
+
+def test_drain_waits_for_running_steps_and_refuses_new_ones():
+    async def scenario():
+        tracker = StepTracker()
+        committed = []
+
+        async def step():
+            async with tracker.track():
+                await asyncio.sleep(0.05)
+                committed.append(True)
+
+        running = asyncio.create_task(step())
+        await asyncio.sleep(0)
+        assert tracker.active == 1
+        drained = await tracker.drain(timeout=1.0)
+        assert drained and committed == [True]
+        with pytest.raises(ShuttingDown):
+            async with tracker.track():
+                pass
+        await running
+
+    asyncio.run(scenario())
+
+
+def test_drain_gives_up_after_timeout():
+    async def scenario():
+        tracker = StepTracker()
+        release = asyncio.Event()
+
+        async def step():
+            async with tracker.track():
+                await release.wait()
+
+        running = asyncio.create_task(step())
+        await asyncio.sleep(0)
+        assert not await tracker.drain(timeout=0.01)
+        assert tracker.active == 1
+        release.set()
+        await running
+        assert tracker.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_app_lifespan_drains_running_steps_before_closing_pools(monkeypatch):
+    from app import main, router_public
+    from app.config import settings
+
+    tracker = StepTracker()
+    disposed = []
+
+    class Engine:
+        async def dispose(self):
+            disposed.append(tracker.active)
+
+    monkeypatch.setattr(settings, "MIGRATE_ON_STARTUP", False)
+    monkeypatch.setattr(settings, "SHUTDOWN_DRAIN_SECONDS", 1.0)
+    monkeypatch.setattr(main, "steps", tracker)
+    monkeypatch.setattr(router_public, "steps", tracker)
+    monkeypatch.setattr(main, "engine", Engine())
+
+    async def scenario():
+        committed = []
+
+        async def step():
+            async with tracker.track():
+                await asyncio.sleep(0.05)
+                committed.append(True)
+
+        async with main.app.router.lifespan_context(main.app):
+            running = asyncio.create_task(step())
+            await asyncio.sleep(0)
+        # Shutdown returned only after the step committed, and then closed the pool
+        assert committed == [True]
+        assert disposed == [0]
+        assert tracker.closing
+        await running
+
+    asyncio.run(scenario())
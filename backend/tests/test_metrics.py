@@ -0,0 +1,101 @@
+import json
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import router_public
+from app.db import Base, get_session
+from app.main import app
+from app.metrics import Counter, Histogram, Registry, on_cursor_execute
+from app.models import Run
+from app.run_cache import drop_run_state
+
+
+def test_counter_and_histogram_text_exposition():
+    reg = Registry()
+    c = reg.register(Counter("calls_total", "Calls.", ("endpoint", "outcome")))
+    h = reg.register(Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0)))
+    c.inc(endpoint="decide", outcome="ok")
+    c.inc(2, endpoint="decide", outcome="ok")
+    h.observe(0.05, route="/a")
+    h.observe(0.5, route="/a")
+    h.observe(5.0, route="/a")
+
+    text = reg.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{endpoint="decide",outcome="ok"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/a"} 3' in text
+    assert text.endswith("\n")
+
+
+def _series(text, prefix):
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_step_request_is_exposed_by_route_template(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'db.sqlite3'}"
+    sync_engine = create_engine(url)
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(
+            Run.__table__.insert().values(
+                id="r1",
+                scenario=1,
+                game_id="g1",
+                status="running",
+                constraints_json=json.dumps([{"attribute": "berlin", "minCount": 5}]),
+                attribute_stats_json=json.dumps({"relativeFrequencies": {"berlin": 0.3}, "correlations": {}}),
+                capacity_required=10,
+                pending_person_index=0,
+                pending_attributes_json=json.dumps({"berlin": True}),
+            )
+        )
+    sync_engine.dispose()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}", poolclass=NullPool)
+    event.listen(engine.sync_engine, "before_cursor_execute", on_cursor_execute)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def session_override():
+        async with Session() as session:
+            yield session
+
+    async def fake_decide(*, game_id, person_index, accept):
+        return {
+            "status": "running",
+            "admittedCount": 1,
+            "rejectedCount": 0,
+            "nextPerson": {"personIndex": person_index + 1, "attributes": {"berlin": False}},
+        }
+
+    monkeypatch.setattr(router_public, "decide_and_next", fake_decide)
+    monkeypatch.setitem(app.dependency_overrides, get_session, session_override)
+    drop_run_state("r1")
+    # No context manager: the lifespan would migrate the configured database and drain steps
+    client = TestClient(app)
+    route = 'route="/api/runs/{run_id}/auto-step"'
+    before = client.get("/metrics").text
+    try:
+        r = client.post("/api/runs/r1/auto-step", json={"personIndex": 0})
+        assert r.status_code == 200
+        after = client.get("/metrics").text
+    finally:
+        drop_run_state("r1")
+
+    def delta(prefix):
+        return _series(after, prefix) - _series(before, prefix)
+
+    # Labelled by the route template, not the concrete run id
+    assert delta(f'http_request_duration_seconds_count{{method="POST",{route},status="200"}}') == 1
+    assert "/api/runs/r1/auto-step" not in after
+    # Every statement of the request is counted against it
+    assert delta(f"db_queries_per_request_count{{{route}}}") == 1
+    assert delta(f"db_queries_per_request_sum{{{route}}}") >= 4
+    for phase in ("db_read", "recovery", "strategy", "db_write", "external_call", "event_persist"):
+        assert delta(f'step_phase_duration_seconds_count{{route="auto_step",phase="{phase}"}}') >= 1
+    assert "# TYPE db_queries_total counter" in after
@@ -0,0 +1,255 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import locks, router_public
+from app.db import (
+    Base,
+    _add_missing_columns,
+    _add_missing_indexes,
+    _backfill_admitted_by_attribute,
+    _backfill_last_person_index,
+)
+from app.locks import MemoryLockBackend, OptimisticLockBackend
+from app.models import Run
+from app.repo import admitted_by_attribute, get_run, record_step
+from app.run_cache import drop_run_state
+from app.schemas import StepRequest
+from app.service_logic import count_admitted_by_attribute
+
+
+async def _setup(url: str):
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add(
+            Run(
+                id="r1",
+                scenario=1,
+                game_id="g1",
+                status="running",
+                constraints_json=json.dumps([{"attribute": "berlin", "minCount": 5}]),
+                attribute_stats_json=json.dumps({"relativeFrequencies": {"berlin": 0.3}, "correlations": {}}),
+                capacity_required=10,
+                pending_person_index=0,
+                pending_attributes_json=json.dumps({"berlin": True}),
+            )
+        )
+        await session.commit()
+    return engine
+
+
+def test_concurrent_duplicate_step_gets_409_without_lock(tmp_path, monkeypatch):
+    calls = []
+
+    async def fake_decide(*, game_id, person_index, accept):
+        calls.append(person_index)
+        await asyncio.sleep(0.05)
+        return {
+            "status": "running",
+            "admittedCount": 1,
+            "rejectedCount": 0,
+            "nextPerson": {"personIndex": person_index + 1, "attributes": {"berlin": False}},
+        }
+
+    monkeypatch.setattr(router_public, "decide_and_next", fake_decide)
+    monkeypatch.setattr(locks, "_backend", OptimisticLockBackend())
+    drop_run_state("r1")
+
+    async def scenario():
+        engine = await _setup(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        Session = async_sessionmaker(engine, expire_on_commit=False)
+
+        async def step():
+            async with Session() as session:
+                try:
+                    await router_public.step_run("r1", StepRequest(personIndex=0, accept=True), session=session)
+                    return 200
+                except HTTPException as exc:
+                    return exc.status_code
+
+        statuses = await asyncio.gather(step(), step())
+        async with Session() as session:
+            run = await get_run(session, "r1")
+            events = (await session.execute(text("SELECT person_index FROM events"))).all()
+        await engine.dispose()
+        return sorted(statuses), run, events
+
+    statuses, run, events = asyncio.run(scenario())
+    drop_run_state("r1")
+    assert statuses == [200, 409]
+    assert calls == [0]  # the loser never reached the external API
+    assert events == [(0,)]
+    assert run.pending_person_index == 1
+    assert run.last_person_index == 0
+    assert run.admitted_count == 1
+
+
+def test_pause_during_a_step_waits_for_its_record(tmp_path, monkeypatch):
+    monkeypatch.setattr(locks, "_backend", MemoryLockBackend())
+    drop_run_state("r1")
+
+    async def scenario():
+        engine = await _setup(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        Session = async_sessionmaker(engine, expire_on_commit=False)
+        pauses = []
+
+        async def pause():
+            async with Session() as session:
+                return await router_public.pause_run("r1", session=session)
+
+        async def fake_decide(*, game_id, person_index, accept):
+            # The person is claimed; the pause arrives while the external call is out
+            pauses.append(asyncio.create_task(pause()))
+            await asyncio.sleep(0.05)
+            return {
+                "status": "running",
+                "admittedCount": 1,
+                "rejectedCount": 0,
+                "nextPerson": {"personIndex": person_index + 1, "attributes": {"berlin": False}},
+            }
+
+        monkeypatch.setattr(router_public, "decide_and_next", fake_decide)
+        async with Session() as session:
+            await router_public.step_run("r1", StepRequest(personIndex=0, accept=True), session=session)
+        summary = await pauses[0]
+        async with Session() as session:
+            run = await get_run(session, "r1")
+            events = (await session.execute(text("SELECT person_index FROM events"))).all()
+        await engine.dispose()
+        return summary, run, events
+
+    summary, run, events = asyncio.run(scenario())
+    drop_run_state("r1")
+    assert events == [(0,)]
+    assert run.last_person_index == 0
+    assert run.pending_person_index == 1
+    assert summary.status == run.status == "paused"
+
+
+def test_duplicate_event_is_rejected_by_the_database(tmp_path):
+    async def scenario():
+        engine = await _setup(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        fields = dict(
+            person_index=0,
+            attributes_json="{}",
+            accepted=True,
+            admitted_count=1,
+            rejected_count=0,
+            status="running",
+            pending_person_index=1,
+            pending_attributes_json="{}",
+        )
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await record_step(session, await get_run(session, "r1"), **fields)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            with pytest.raises(IntegrityError):
+                await record_step(session, await get_run(session, "r1"), **fields)
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_recorded_steps_maintain_admitted_by_attribute(tmp_path):
+    people = [({"berlin": True, "local": True}, True), ({"berlin": True}, False), ({"berlin": True}, True)]
+
+    async def scenario():
+        engine = await _setup(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            for i, (attributes, accepted) in enumerate(people):
+                await record_step(
+                    session,
+                    await get_run(session, "r1"),
+                    person_index=i,
+                    attributes_json=json.dumps(attributes),
+                    accepted=accepted,
+                    admitted_count=i + 1,
+                    rejected_count=0,
+                    status="running",
+                    pending_person_index=i + 1,
+                    pending_attributes_json="{}",
+                )
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            counts = admitted_by_attribute(await get_run(session, "r1"))
+            scanned = await count_admitted_by_attribute(session, "r1")
+        await engine.dispose()
+        return counts, scanned
+
+    counts, scanned = asyncio.run(scenario())
+    assert counts == scanned == {"berlin": 2, "local": 1}
+
+
+def test_migration_adds_version_unique_index_and_last_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE runs (id VARCHAR(36) PRIMARY KEY, scenario INTEGER NOT NULL)"))
+        conn.execute(text("CREATE TABLE events (id INTEGER PRIMARY KEY, run_id VARCHAR(36), person_index INTEGER)"))
+        conn.execute(text("INSERT INTO runs (id, scenario) VALUES ('r1', 1), ('r2', 1)"))
+        conn.execute(text("INSERT INTO events (run_id, person_index) VALUES ('r1', 0), ('r1', 1), ('r1', 2)"))
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        _add_missing_indexes(conn)
+        _backfill_last_person_index(conn)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, version, last_person_index FROM runs ORDER BY id")).all()
+        assert rows == [("r1", 0, 2), ("r2", 0, None)]
+        indexes = {ix["name"]: ix for ix in inspect(conn).get_indexes("events")}
+    assert indexes["ux_event_run_person"]["unique"]
+    engine.dispose()
+
+
+def test_migration_backfills_admitted_by_attribute(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE runs (id VARCHAR(36) PRIMARY KEY, scenario INTEGER NOT NULL)"))
+        conn.execute(
+            text(
+                "CREATE TABLE events (id INTEGER PRIMARY KEY, run_id VARCHAR(36), person_index INTEGER, "
+                "attributes_json TEXT, accepted BOOLEAN)"
+            )
+        )
+        conn.execute(text("INSERT INTO runs (id, scenario) VALUES ('r1', 1), ('r2', 1)"))
+        conn.execute(
+            text(
+                "INSERT INTO events (run_id, person_index, attributes_json, accepted) VALUES "
+                "('r1', 0, '{\"berlin\": true, \"local\": false}', 1), "
+                "('r1', 1, '{\"berlin\": true}', 0), "
+                "('r1', 2, '{\"berlin\": true, \"local\": true}', 1)"
+            )
+        )
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        _backfill_admitted_by_attribute(conn)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, admitted_by_attribute_json FROM runs ORDER BY id")).all()
+    assert json.loads(rows[0][1]) == {"berlin": 2, "local": 1}
+    assert rows[1] == ("r2", None)
+    engine.dispose()
+
+
+def test_migration_dedupes_events_and_replaces_the_plain_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE runs (id VARCHAR(36) PRIMARY KEY, scenario INTEGER NOT NULL)"))
+        conn.execute(text("CREATE TABLE events (id INTEGER PRIMARY KEY, run_id VARCHAR(36), person_index INTEGER)"))
+        conn.execute(text("CREATE INDEX ix_event_run_person ON events (run_id, person_index)"))
+        conn.execute(text("INSERT INTO runs (id, scenario) VALUES ('r1', 1)"))
+        # Person 1 was recorded twice by racing steps
+        conn.execute(
+            text("INSERT INTO events (id, run_id, person_index) VALUES (1, 'r1', 0), (2, 'r1', 1), (3, 'r1', 1)")
+        )
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        _add_missing_indexes(conn)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id FROM events ORDER BY id")).all() == [(1,), (2,)]
+        indexes = {ix["name"]: ix for ix in inspect(conn).get_indexes("events")}
+    assert indexes["ux_event_run_person"]["unique"]
+    assert "ix_event_run_person" not in indexes
+    engine.dispose()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import locks
+from app.db import Base
+from app.locks import MemoryLockBackend, OptimisticLockBackend
+from app.models import Run
+from app.recovery import FAILED, REPLAYED, is_abandoned, needs_recovery, recover_run
+from app.repo import get_run
+from app.run_cache import drop_run_state
+
+
+class RemoteError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = SimpleNamespace(status_code=status_code)
+
+
+def _interrupted_run(**overrides):
+    # Crashed after sending "accept person 3" but before its event committed
+    fields = dict(
+        id="r1",
+        scenario=1,
+        game_id="g1",
+        status="running",
+        constraints_json=json.dumps([{"attribute": "berlin", "minCount": 5}]),
+        attribute_stats_json=json.dumps({"relativeFrequencies": {"berlin": 0.3}, "correlations": {}}),
+        admitted_count=2,
+        rejected_count=1,
+        capacity_required=10,
+        last_person_index=2,
+        pending_person_index=3,
+        pending_attributes_json=json.dumps({"berlin": True}),
+        inflight_person_index=3,
+        inflight_accept=True,
+        inflight_at=datetime.utcnow(),
+    )
+    fields.update(overrides)
+    return Run(**fields)
+
+
+def _recover(tmp_path, decide, **overrides):
+    drop_run_state("r1")
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(_interrupted_run(**overrides))
+            await session.commit()
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as session:
+                run = await get_run(session, "r1")
+                outcome = await recover_run(session, run, decide)
+        except Exception as exc:
+            outcome = exc
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            run = await get_run(session, "r1")
+            events = (await session.execute(text("SELECT person_index, accepted FROM events"))).all()
+        await engine.dispose()
+        return outcome, run, events
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        drop_run_state("r1")
+
+
+def test_replays_recorded_decision_when_remote_is_consistent(tmp_path):
+    calls = []
+
+    async def decide(*, game_id, person_index, accept):
+        calls.append((person_index, accept))
+        return {
+            "status": "running",
+            "admittedCount": 3,
+            "rejectedCount": 1,
+            "nextPerson": {"personIndex": 4, "attributes": {"berlin": False}},
+        }
+
+    outcome, run, events = _recover(tmp_path, decide)
+    assert outcome == REPLAYED
+    assert calls == [(3, True)]
+    assert events == [(3, 1)]
+    assert (run.admitted_count, run.rejected_count) == (3, 1)
+    assert (run.last_person_index, run.pending_person_index) == (3, 4)
+    assert run.inflight_person_index is None and run.status == "running"
+    assert json.loads(run.estimator_json)
+    assert not needs_recovery(run)
+
+
+def test_marks_failed_when_remote_counters_diverge(tmp_path):
+    async def decide(*, game_id, person_index, accept):
+        # Remote is already two persons further: the decision landed before the crash
+        return {
+            "status": "running",
+            "admittedCount": 4,
+            "rejectedCount": 1,
+            "nextPerson": {"personIndex": 5, "attributes": {"berlin": False}},
+        }
+
+    outcome, run, events = _recover(tmp_path, decide)
+    assert outcome == FAILED
+    assert events == []
+    assert run.status == "failed"
+    assert run.inflight_person_index is None and run.pending_person_index is None
+
+
+def test_marks_failed_when_remote_refuses_replay(tmp_path):
+    async def decide(*, game_id, person_index, accept):
+        raise RemoteError(400)
+
+    outcome, run, _ = _recover(tmp_path, decide)
+    assert outcome == FAILED
+    assert run.status == "failed"
+
+
+def test_keeps_intent_when_remote_is_unavailable(tmp_path):
+    async def decide(*, game_id, person_index, accept):
+        raise RemoteError(503)
+
+    outcome, run, _ = _recover(tmp_path, decide)
+    assert isinstance(outcome, RemoteError)
+    assert run.status == "running"
+    assert run.inflight_person_index == 3
+
+
+def test_detects_legacy_gap_between_pending_and_last_index():
+    run = _interrupted_run(inflight_person_index=None, inflight_accept=None, pending_person_index=2)
+    assert needs_recovery(run)
+
+
+def test_optimistic_intent_is_abandoned_only_when_old(monkeypatch):
+    fresh = _interrupted_run()
+    old = _interrupted_run(inflight_at=datetime.utcnow() - timedelta(minutes=5))
+
+    monkeypatch.setattr(locks, "_backend", OptimisticLockBackend())
+    assert not is_abandoned(fresh)
+    assert is_abandoned(old)
+
+    # An exclusive lock is held by the caller: nothing else can be mid-step
+    monkeypatch.setattr(locks, "_backend", MemoryLockBackend())
+    assert is_abandoned(fresh)
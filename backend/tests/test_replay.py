@@ -0,0 +1,63 @@
+import asyncio
+import json
+import random
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.db import Base
+from app.models import Event, Run
+from app.replay import replay_runs
+
+
+CONSTRAINTS = [{"attribute": "berlin", "minCount": 5}]
+
+
+async def _seed(url: str, run_ids):
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    rng = random.Random(7)
+    async with AsyncSession(engine) as session:
+        for run_id in run_ids:
+            session.add(
+                Run(
+                    id=run_id,
+                    scenario=1,
+                    game_id=f"game-{run_id}",
+                    status="completed",
+                    constraints_json=json.dumps(CONSTRAINTS),
+                    attribute_stats_json=json.dumps({"relativeFrequencies": {"berlin": 0.3}}),
+                    admitted_count=10,
+                    rejected_count=90,
+                    capacity_required=10,
+                )
+            )
+            for i in range(100):
+                session.add(
+                    Event(
+                        run_id=run_id,
+                        person_index=i,
+                        attributes_json=json.dumps({"berlin": rng.random() < 0.3}),
+                        accepted=False,
+                        admitted_count=0,
+                        rejected_count=i,
+                    )
+                )
+        await session.commit()
+    await engine.dispose()
+
+
+def test_replay_matches_across_process_pool(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'replay.sqlite3'}"
+    asyncio.run(_seed(url, ["r1", "r2"]))
+
+    serial = replay_runs(["greedy_tightness"], database_url=url, max_workers=1)
+    pooled = replay_runs(["greedy_tightness"], database_url=url, max_workers=2)
+    assert [(r.run_id, r.rejected) for r in serial] == [(r.run_id, r.rejected) for r in pooled]
+
+    for r in serial:
+        assert r.completed
+        assert r.constraints_met
+        assert r.admitted == 10
+        assert r.persons_seen == r.admitted + r.rejected
+        assert r.original_rejected == 90
@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app import router_public, run_cache
+from app.config import settings
+from app.db import Base
+from app.estimator import FrequencyEstimator
+from app.models import Run
+from app.repo import get_run, record_step
+from app.run_cache import drop_run_state, get_run_state, sync_run_state
+from app.schemas import StepRequest
+
+
+def _run(run_id, **overrides):
+    fields = dict(
+        id=run_id,
+        scenario=1,
+        game_id="g1",
+        status="running",
+        constraints_json=json.dumps([{"attribute": "berlin", "minCount": 5}]),
+        attribute_stats_json=json.dumps({"relativeFrequencies": {"berlin": 0.3}, "correlations": {}}),
+        capacity_required=10,
+        version=0,
+    )
+    fields.update(overrides)
+    return Run(**fields)
+
+
+def test_least_recently_used_run_is_evicted(monkeypatch):
+    monkeypatch.setattr(settings, "RUN_STATE_CACHE_SIZE", 2)
+    runs = [_run(f"lru-{i}") for i in range(3)]
+    try:
+        first = get_run_state(runs[0])
+        get_run_state(runs[1])
+        assert get_run_state(runs[0]) is first  # touched: now most recent
+        get_run_state(runs[2])
+        assert set(run_cache._states) == {"lru-0", "lru-2"}
+    finally:
+        for run in runs:
+            drop_run_state(run.id)
+
+
+def test_cached_estimator_follows_steps_committed_by_another_worker(tmp_path):
+    drop_run_state("r1")
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(_run("r1", pending_person_index=0, pending_attributes_json=json.dumps({"berlin": True})))
+            await session.commit()
+
+        # This worker caches the run's state, then another worker steps it twice
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            cached = get_run_state(await get_run(session, "r1"))
+        elsewhere = FrequencyEstimator.from_json(cached.estimator.to_json())
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            run = await get_run(session, "r1")
+            for i in range(2):
+                elsewhere.observe({"berlin": True})
+                await record_step(
+                    session,
+                    run,
+                    person_index=i,
+                    attributes_json=json.dumps({"berlin": True}),
+                    accepted=True,
+                    admitted_count=i + 1,
+                    rejected_count=0,
+                    status="running",
+                    pending_person_index=i + 1,
+                    pending_attributes_json=json.dumps({"berlin": True}),
+                    estimator_json=elsewhere.to_json(),
+                )
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            run = await get_run(session, "r1")
+            reloaded = get_run_state(run).estimator
+            seen = (reloaded.observed, reloaded.relative_frequencies())
+            # A step committed here marks the state current: no reload on the next read
+            reloaded.observe({"berlin": False})
+            await record_step(
+                session,
+                run,
+                person_index=2,
+                attributes_json=json.dumps({"berlin": False}),
+                accepted=False,
+                admitted_count=2,
+                rejected_count=1,
+                status="running",
+                pending_person_index=3,
+                pending_attributes_json=json.dumps({"berlin": True}),
+                estimator_json=reloaded.to_json(),
+            )
+            sync_run_state(run, reloaded)
+            again = get_run_state(run).estimator
+        await engine.dispose()
+        return seen, elsewhere, reloaded, again
+
+    try:
+        seen, elsewhere, reloaded, again = asyncio.run(scenario())
+    finally:
+        drop_run_state("r1")
+    assert seen == (2, elsewhere.relative_frequencies())
+    assert again is reloaded and again.observed == 3
+
+
+def test_reader_between_claim_and_record_does_not_lose_the_observation(tmp_path, monkeypatch):
+    drop_run_state("r1")
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(engine, expire_on_commit=False)
+        async with Session() as session:
+            session.add(_run("r1", pending_person_index=0, pending_attributes_json=json.dumps({"berlin": True})))
+            await session.commit()
+
+        async def decide(*, game_id, person_index, accept):
+            # The run is claimed (version bumped): an estimates request reloads the state
+            async with Session() as session:
+                await router_public.get_estimates("r1", session=session)
+            return {
+                "status": "running",
+                "admittedCount": person_index + 1,
+                "rejectedCount": 0,
+                "nextPerson": {"personIndex": person_index + 1, "attributes": {"berlin": True}},
+            }
+
+        monkeypatch.setattr(router_public, "decide_and_next", decide)
+        for i in range(2):
+            async with Session() as session:
+                await router_public.step_run("r1", StepRequest(personIndex=i, accept=True), session=session)
+        async with Session() as session:
+            run = await get_run(session, "r1")
+            checkpoint = FrequencyEstimator.from_json(run.estimator_json)
+            cached = get_run_state(run).estimator
+        await engine.dispose()
+        return checkpoint, cached
+
+    try:
+        checkpoint, cached = asyncio.run(scenario())
+    finally:
+        drop_run_state("r1")
+    assert checkpoint.observed == 2
+    assert cached.observed == 2
@@ -1,8 +1,15 @@
+from collections import OrderedDict
+
 import pytest
 
+from app import lookahead
+from app.lookahead import get_evaluator, lookahead_stats
 from app.service_logic import (
     decide_accept_greedy,
     decide_accept_expected_feasible,
+    decide_accept_lookahead_1,
+    decide_accept_lookahead_k,
+    is_known_strategy,
 )
 
 
@@ -83,3 +90,77 @@ def test_expected_feasible_guard_rejects_when_accept_would_break_expectation():
         relative_frequencies=rel,
     )
     assert accept is False
+
+
+def test_lookahead_k_horizon_one_matches_lookahead_1():
+    attrs = {"berlin": False, "black": True}
+    constraints = [
+        {"attribute": "berlin", "minCount": 400},
+        {"attribute": "black", "minCount": 600},
+    ]
+    counts = {"berlin": 300, "black": 500}
+    rel = {"berlin": 0.4, "black": 0.6}
+    kwargs = dict(
+        person_attributes=attrs,
+        constraints=constraints,
+        admitted_count_by_attr=counts,
+        admitted_count=700,
+        capacity_required=1000,
+        relative_frequencies=rel,
+    )
+    assert decide_accept_lookahead_k(horizon=1, **kwargs) == decide_accept_lookahead_1(**kwargs)
+
+
+def test_lookahead_k_memoizes_repeated_states():
+    attrs = {"berlin": False, "black": False}
+    constraints = [
+        {"attribute": "berlin", "minCount": 9},
+        {"attribute": "black", "minCount": 9},
+    ]
+    counts = {"berlin": 5, "black": 5}
+    kwargs = dict(
+        person_attributes=attrs,
+        constraints=constraints,
+        admitted_count_by_attr=counts,
+        admitted_count=5,
+        capacity_required=20,
+        relative_frequencies={"berlin": 0.5, "black": 0.5},
+        horizon=3,
+        time_budget_ms=10_000,
+    )
+    # Person satisfies no deficit: rejecting keeps strictly more expected slack
+    assert decide_accept_lookahead_k(**kwargs) is False
+    before = lookahead_stats()
+    decide_accept_lookahead_k(**kwargs)
+    after = lookahead_stats()
+    assert after["cacheHits"] > before["cacheHits"]
+    assert after["cacheMisses"] == before["cacheMisses"]
+    assert after["decisions"] == before["decisions"] + 1
+
+
+def test_lookahead_cache_counts_survive_evaluator_eviction(monkeypatch):
+    monkeypatch.setattr(lookahead, "_evaluators", OrderedDict())
+    monkeypatch.setattr(lookahead, "_MAX_EVALUATORS", 1)
+    ev = get_evaluator(relative_frequencies={"berlin": 0.41}, attributes=["berlin"], horizon=2, samples=0)
+    ev.cache.get(("probe",))
+    ev.cache.put(("probe",), 1.0)
+    ev.cache.get(("probe",))
+    before = lookahead_stats()
+    get_evaluator(relative_frequencies={"berlin": 0.59}, attributes=["berlin"], horizon=2, samples=0)
+    after = lookahead_stats()
+    assert after["evaluators"] == 1
+    assert after["cacheHits"] == before["cacheHits"]
+    assert after["cacheMisses"] == before["cacheMisses"]
+
+
+def test_lookahead_evaluator_keeps_exact_frequencies():
+    ev = get_evaluator(relative_frequencies={"berlin": 0.3149}, attributes=["berlin"], horizon=2, samples=8)
+    assert ev.frequencies == (0.3149,)
+    # Nearby estimates share the cached evaluator through the rounded key
+    assert get_evaluator(relative_frequencies={"berlin": 0.3101}, attributes=["berlin"], horizon=2, samples=8) is ev
+
+
+def test_lookahead_horizon_outside_bounds_is_unknown():
+    assert is_known_strategy("lookahead_1") and is_known_strategy("lookahead_6")
+    assert not is_known_strategy("lookahead_0")
+    assert not is_known_strategy("lookahead_40")
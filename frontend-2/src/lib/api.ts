@@ -11,6 +11,12 @@ import {
 
 const BASE = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000/api'
 
+// Backend-issued paths (e.g. NextPerson.imageUrl) are relative to the API origin.
+// BASE may itself be relative (e.g. "/api" behind a proxy), so anchor it to the page.
+export function resolveApiUrl(url: string): string {
+  return url.startsWith('/') ? new URL(url, new URL(BASE, window.location.origin)).toString() : url
+}
+
 async function handleResponse<T>(res: Response): Promise<T> {
   if (!res.ok) {
     const text = await res.text()
@@ -1,5 +1,6 @@
 import { buildSignature } from '@berghain/signature'
 import type { NextPerson, ScenarioManifest } from '../types'
+import { resolveApiUrl } from './api'
 
 class ImageLoader {
   private manifestCache = new Map<number, ScenarioManifest>()
@@ -28,6 +29,9 @@ class ImageLoader {
   }
 
   async getImageUrl(scenario: number, person: NextPerson): Promise<string> {
+    if (person.imageUrl) {
+      return resolveApiUrl(person.imageUrl)
+    }
     try {
       // Build signature from person attributes
       const signature = buildSignature(scenario, person.attributes)
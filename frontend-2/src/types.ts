@@ -25,6 +25,8 @@ export type RunSummary = {
 export type NextPerson = {
   personIndex: number
   attributes: Record<string, boolean>
+  // Content-hashed image resolved by the backend; skips the manifest lookup
+  imageUrl?: string | null
 }
 
 export type EventOut = {
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+class BlobCache:
+    """
+    Content-addressed blob store for generated images with size-based LRU eviction.
+
+    Blobs live at `<root>/<key[:2]>/<key>`; a hit refreshes the file's mtime,
+    which is the recency used for eviction once the store exceeds `max_bytes`.
+    """
+
+    def __init__(self, root: str | Path, *, max_bytes: int):
+        self.root = Path(root).expanduser().resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total = sum(p.stat().st_size for p in self._blobs())
+
+    def _blobs(self):
+        return (p for p in self.root.glob("??/*") if p.is_file() and not p.name.endswith(".tmp"))
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        p = self._path(key)
+        try:
+            data = p.read_bytes()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(p.name + ".tmp")
+        tmp.write_bytes(data)
+        with self._lock:
+            previous = p.stat().st_size if p.exists() else 0
+            tmp.replace(p)
+            self._total += len(data) - previous
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for p in self._blobs():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._total = total
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from typing import List, Sequence, Tuple, Optional, Set, Dict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import bisect
+import itertools
+import math
 import random
 from collections import Counter
 
@@ -26,7 +29,163 @@ def enumerate_bit_combos(n: int, required_indices: Optional[List[int]] = None) -
     return combos
 
 
-def plan_assignments(
+class ComboSpace(Sequence[List[int]]):
+    """
+    Lazy view of the distinct bit combinations with `required_indices` fixed to 1.
+
+    Combos are integer masks over the free bits only, decoded to bit lists on
+    access, so nothing is materialized and no combo appears twice. Iteration
+    order matches the first occurrences in `enumerate_bit_combos`.
+    """
+
+    def __init__(self, n: int, required_indices: Optional[Sequence[int]] = None):
+        self.n = max(0, n)
+        required = {i for i in (required_indices or []) if 0 <= i < self.n}
+        self.required_mask = sum(1 << i for i in required)
+        self.free = [k for k in range(self.n) if k not in required]
+
+    def __len__(self) -> int:
+        return 1 << len(self.free)
+
+    def mask(self, index: int) -> int:
+        # Deposit the bits of `index` into the free positions
+        m = self.required_mask
+        for j, k in enumerate(self.free):
+            if (index >> j) & 1:
+                m |= 1 << k
+        return m
+
+    def decode(self, mask: int) -> List[int]:
+        return [(mask >> k) & 1 for k in range(self.n)]
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.decode(self.mask(index))
+
+
+def combo_weights(
+    combos: Sequence[List[int]],
+    attr_ids: Sequence[str],
+    relative_frequencies: Dict[str, float],
+    correlations: Optional[Dict[str, Dict[str, float]]] = None,
+) -> List[float]:
+    """
+    Expected share of people matching each combo, from scenario attribute stats.
+
+    Independent Bernoulli marginals, corrected pairwise for `correlations`
+    (second-order Bahadur expansion, clipped at zero). Attributes without a
+    frequency count as a coin flip. Weights sum to 1.
+    """
+    p = [min(max(float(relative_frequencies.get(a, 0.5)), 1e-6), 1 - 1e-6) for a in attr_ids]
+    sd = [math.sqrt(q * (1 - q)) for q in p]
+    correlations = correlations or {}
+    pairs = []
+    for i, j in itertools.combinations(range(len(attr_ids)), 2):
+        a, b = attr_ids[i], attr_ids[j]
+        # The published matrix may carry only one triangle: read either order
+        rho = (correlations.get(a) or {}).get(b)
+        if rho is None:
+            rho = (correlations.get(b) or {}).get(a, 0.0)
+        rho = float(rho)
+        if rho:
+            pairs.append((i, j, rho))
+    weights: List[float] = []
+    for bits in combos:
+        base = 1.0
+        for b, q in zip(bits, p):
+            base *= q if b else 1 - q
+        z = [(b - q) / d for b, q, d in zip(bits, p, sd)]
+        weights.append(base * max(0.0, 1.0 + sum(rho * z[i] * z[j] for i, j, rho in pairs)))
+    total = sum(weights)
+    if total <= 0:
+        return [1.0 / len(weights)] * len(weights) if weights else []
+    return [w / total for w in weights]
+
+
+def allocate_counts(weights: Sequence[float], total: int, *, floor: int = 1) -> List[int]:
+    """
+    Split `total` images across combos proportionally to `weights`.
+
+    Every combo first gets `floor` images (or, when the budget cannot cover
+    that, the most likely combos get one each); the rest is apportioned by
+    largest remainder, ties going to the earlier combo.
+    """
+    n = len(weights)
+    if n == 0 or total <= 0:
+        return [0] * n
+    by_weight = sorted(range(n), key=lambda i: -weights[i])
+    counts = [0] * n
+    if floor * n <= total:
+        counts = [floor] * n
+    else:
+        for i in by_weight[:total]:
+            counts[i] = 1
+    left = total - sum(counts)
+    if left <= 0:
+        return counts
+    wsum = sum(weights) or 1.0
+    quotas = [w / wsum * left for w in weights]
+    for i, q in enumerate(quotas):
+        counts[i] += int(q)
+    short = total - sum(counts)
+    for i in sorted(range(n), key=lambda i: (-(quotas[i] - int(quotas[i])), i))[:short]:
+        counts[i] += 1
+    return counts
+
+
+class AllocatedCombos(Sequence[List[int]]):
+    """
+    Lazy sequence repeating each combo of `combos` `counts[i]` times.
+
+    Laid out in rounds: round r holds every combo with more than r images,
+    most frequent first, so the plan covers all combos before repeating any
+    and a partial run still favours the common ones. Memory is O(combos).
+    """
+
+    def __init__(self, combos: Sequence[List[int]], counts: Sequence[int]):
+        self.combos = combos
+        self._order = sorted((i for i, c in enumerate(counts) if c > 0), key=lambda i: (-counts[i], i))
+        self._starts: List[int] = []
+        total = 0
+        for r in range(max(counts, default=0)):
+            self._starts.append(total)
+            total += sum(1 for c in counts if c > r)
+        self._len = total
+        self.max_repeats = max(counts, default=0)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        r = bisect.bisect_right(self._starts, index) - 1
+        return self.combos[self._order[index - self._starts[r]]]
+
+
+def _celebrity_stream(celebrities: Sequence[str], total: int, rng: random.Random) -> Iterator[str]:
+    # Fair shuffled cycles: all celebrities appear before any repeats
+    produced = 0
+    while produced < total:
+        cycle = list(celebrities)
+        rng.shuffle(cycle)
+        for celeb in cycle:
+            if produced >= total:
+                return
+            yield celeb
+            produced += 1
+
+
+def iter_assignments(
     *,
     total_images: int,
     combos: Sequence[List[int]],
@@ -35,26 +194,13 @@ def plan_assignments(
     attr_ids: Optional[Sequence[str]] = None,
     international_attr: str = "international",
     forbidden_international_celebrities: Optional[Sequence[str]] = None,
-) -> List[Tuple[List[int], str]]:
+) -> Iterator[Tuple[List[int], str]]:
+    """Stream (bits, celebrity) pairs; same plan as `plan_assignments`, in constant memory."""
     if total_images <= 0:
-        return []
+        return
     n_combos = len(combos)
     rng = random.Random(seed)
-
-    # Ensure fair celebrity distribution: all celebrities appear before any repeats
-    # Create shuffled cycles where each celebrity appears once per cycle
-    celeb_stream: List[str] = []
-    cycles_needed = (total_images + len(celebrities) - 1) // len(celebrities)  # Ceiling division
-    
-    for cycle_num in range(cycles_needed):
-        cycle = list(celebrities)
-        rng.shuffle(cycle)
-        celeb_stream.extend(cycle)
-        if len(celeb_stream) >= total_images:
-            break
-    
-    # Trim to exact number needed
-    celeb_stream = celeb_stream[:total_images]
+    stream = _celebrity_stream(celebrities, total_images, rng)
 
     # Prepare restriction logic (simple and deterministic)
     intl_index: Optional[int] = None
@@ -68,22 +214,69 @@ def plan_assignments(
         is_international = bool(bits[intl_index])
         return is_international and celeb in forbidden
 
-    pairs: List[Tuple[List[int], str]] = []
-    j = 0  # pointer into celeb_stream
+    upcoming = next(stream, None)
+    last: Optional[str] = None
     for t in range(total_images):
-        bits = list(combos[t]) if t < n_combos else list(combos[t % n_combos])
-        # Advance celeb pointer until non-violating
+        bits = list(combos[t % n_combos])
+        # Advance the celeb stream until non-violating
         guard = 0
-        while j < len(celeb_stream) and violates(bits, celeb_stream[j]) and guard < len(celebrities) * 2:
-            j += 1
+        while upcoming is not None and violates(bits, upcoming) and guard < len(celebrities) * 2:
+            last, upcoming = upcoming, next(stream, None)
             guard += 1
-        celeb = celeb_stream[j] if j < len(celeb_stream) else celeb_stream[-1]
-        pairs.append((bits, celeb))
-        j += 1
-    return pairs
+        if upcoming is not None:
+            last, upcoming = upcoming, next(stream, None)
+        # Once the stream is used up, keep reusing its final celebrity
+        yield bits, last  # type: ignore[misc]
+
+
+def plan_assignments(
+    *,
+    total_images: int,
+    combos: Sequence[List[int]],
+    celebrities: Sequence[str],
+    seed: int,
+    attr_ids: Optional[Sequence[str]] = None,
+    international_attr: str = "international",
+    forbidden_international_celebrities: Optional[Sequence[str]] = None,
+) -> List[Tuple[List[int], str]]:
+    return list(
+        iter_assignments(
+            total_images=total_images,
+            combos=combos,
+            celebrities=celebrities,
+            seed=seed,
+            attr_ids=attr_ids,
+            international_attr=international_attr,
+            forbidden_international_celebrities=forbidden_international_celebrities,
+        )
+    )
+
+
+def group_requests(
+    pairs: Iterable[Tuple[List[int], str]], *, max_batch: int = 10, distinct: bool = False
+) -> Iterator[Tuple[List[int], str, List[int]]]:
+    """
+    Collapse identical (bits, celebrity) pairs into batched jobs.
+
+    Identical pairs produce identical prompts, so each repeat becomes another
+    variant of one n>1 request. Yields (bits, celeb, variant indices) in
+    first-seen order, with at most `max_batch` variants per job. When the
+    caller knows no pair repeats (`distinct`), pairs stream straight through.
+    """
+    if distinct:
+        for bits, celeb in pairs:
+            yield bits, celeb, [0]
+        return
+    counts: Dict[Tuple[Tuple[int, ...], str], int] = {}
+    for bits, celeb in pairs:
+        key = (tuple(bits), celeb)
+        counts[key] = counts.get(key, 0) + 1
+    for (bits, celeb), count in counts.items():
+        for start in range(0, count, max_batch):
+            yield list(bits), celeb, list(range(start, min(count, start + max_batch)))
 
 
-def analyze_celebrity_distribution(pairs: List[Tuple[List[int], str]]) -> Dict[str, int]:
+def analyze_celebrity_distribution(pairs: Iterable[Tuple[List[int], str]]) -> Dict[str, int]:
     """Analyze how many times each celebrity appears in the planned assignments."""
     celebrity_counts = Counter(celeb for _, celeb in pairs)
     return dict(celebrity_counts)
@@ -16,6 +16,48 @@ class RetryConfig(BaseModel):
     max_seconds: float = 8.0
 
 
+class RateLimitConfig(BaseModel):
+    # AIMD: start at `concurrency`, grow on success up to max_concurrency, halve on 429
+    adaptive: bool = True
+    max_concurrency: int | None = Field(
+        default=None, description="Upper bound for adaptive concurrency (default: 4x concurrency)", ge=1
+    )
+    images_per_minute: float | None = Field(default=None, description="Optional image budget (an n-image request counts n)", gt=0)
+    tokens_per_minute: int | None = Field(default=None, description="Optional token budget", gt=0)
+    max_rate_limit_retries: int = Field(default=8, description="Retries of a job after 429s", ge=0)
+
+
+class PlannerConfig(BaseModel):
+    # uniform: cycle through every combo; weighted: split total_images by expected combo frequency
+    mode: str = Field(default="uniform", description="uniform | weighted")
+    # JSON with relativeFrequencies/correlations (or a new-game response carrying attributeStatistics)
+    stats_path: str | None = None
+    relative_frequencies: Dict[str, float] = Field(default_factory=dict)
+    correlations: Dict[str, Dict[str, float]] = Field(default_factory=dict)
+    min_per_combo: int = Field(default=1, description="Coverage floor per combo when the budget allows", ge=0)
+
+
+class QueueConfig(BaseModel):
+    # Failed jobs are retried by later `--resume` runs until they have failed this many times
+    max_attempts: int = Field(default=3, ge=1)
+
+
+class DerivativesConfig(BaseModel):
+    # Smaller encodes of each output (never upscaled) plus an inline LQIP placeholder
+    enabled: bool = True
+    widths: List[int] = Field(default_factory=lambda: [320, 640])
+    formats: List[str] = Field(default_factory=lambda: ["avif", "webp"])
+    quality: int = Field(default=60, ge=1, le=100)
+    lqip_width: int = Field(default=16, description="Placeholder width in px (0 = none)", ge=0)
+
+
+class CacheConfig(BaseModel):
+    # Content-addressed store of raw API outputs, keyed by prompt + request inputs
+    enabled: bool = True
+    dir: str = "./.cache/images"
+    max_bytes: int = Field(default=2 * 1024**3, description="Evict least recently used blobs above this size", ge=0)
+
+
 class ImageConfig(BaseModel):
     # Allowed sizes now per OpenAI: 1024x1024, 1024x1536, 1536x1024, or 'auto'.
     # Back-compat: if an int is provided (e.g., 1024), it will be coerced to '1024x1024'.
@@ -25,6 +67,9 @@ class ImageConfig(BaseModel):
     )
     format: str = Field("webp", description="Output format: webp/png/jpg")
     model: str = Field("gpt-image-1", description="OpenAI image model name")
+    max_batch: int = Field(
+        10, ge=1, le=10, description="Max images per request (n); repeats of one job share a call"
+    )
     style: str = "exaggerated caricature, bold lines, high contrast, consistent character sheet"
     framing: str = "waist-up portrait, facing camera, slight 3/4 angle"
     negative: str = "no logos, no brand names, no text overlays"
@@ -80,7 +125,16 @@ class AppConfig(BaseModel):
 
     seed: int = 42
     concurrency: int = 3
+    # Processes for decode/re-encode of API outputs (default: CPU count)
+    transcode_workers: int | None = Field(default=None, ge=1)
+    # Rewrite manifest.json from the append-only journal every N completed images
+    manifest_compact_every: int = Field(default=100, ge=1)
     retry: RetryConfig = Field(default_factory=RetryConfig)
+    rate_limit: RateLimitConfig = Field(default_factory=RateLimitConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    planner: PlannerConfig = Field(default_factory=PlannerConfig)
+    queue: QueueConfig = Field(default_factory=QueueConfig)
+    derivatives: DerivativesConfig = Field(default_factory=DerivativesConfig)
     image: ImageConfig = Field(default_factory=ImageConfig)
 
     attributes: Dict[str, Dict[str, str]] = Field(default_factory=dict)
@@ -154,4 +208,19 @@ def load_config(path: str | Path = "config.yaml") -> AppConfig:
         if cfg.image.input_fidelity not in ("low", "high", "auto"):
             raise SystemExit("image.input_fidelity must be one of: low|high|auto")
 
+    # Validate derivatives
+    bad = [f for f in cfg.derivatives.formats if f.lower() not in ("avif", "webp", "png", "jpg", "jpeg")]
+    if bad:
+        raise SystemExit(f"derivatives.formats must be avif/webp/png/jpg, got: {bad}")
+    if any(w <= 0 for w in cfg.derivatives.widths):
+        raise SystemExit("derivatives.widths must be positive")
+
+    # Validate planner
+    if cfg.planner.mode not in ("uniform", "weighted"):
+        raise SystemExit("planner.mode must be uniform or weighted")
+    if cfg.planner.stats_path and not Path(cfg.planner.stats_path).exists():
+        raise SystemExit(f"planner.stats_path not found: {cfg.planner.stats_path}")
+    if cfg.planner.mode == "weighted" and not (cfg.planner.stats_path or cfg.planner.relative_frequencies):
+        raise SystemExit("planner.mode weighted needs stats_path or relative_frequencies")
+
     return cfg
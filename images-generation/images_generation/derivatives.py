@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from PIL import Image, features
+
+from .transcode import write_once
+
+
+_SAVE_FORMATS = {"avif": "AVIF", "webp": "WEBP", "jpg": "JPEG", "jpeg": "JPEG", "png": "PNG"}
+
+
+def derived_dir(scenario_dir: Path) -> Path:
+    return scenario_dir / "derived"
+
+
+def supported_formats(formats: Sequence[str]) -> List[str]:
+    """Drop encoders this Pillow build lacks (AVIF needs libavif)."""
+    out = []
+    for fmt in formats:
+        fmt = fmt.lower()
+        if fmt == "avif" and not features.check("avif"):
+            continue
+        out.append(fmt)
+    return out
+
+
+def is_current(record: Optional[Dict[str, Any]], checksum: str, spec: Dict[str, Any], scenario_dir: Path) -> bool:
+    if not record or record.get("source") != checksum or record.get("spec") != spec:
+        return False
+    return all((scenario_dir / f["file"]).exists() for f in record.get("files", []))
+
+
+def build_derivatives(
+    scenario_dir: str,
+    filename: str,
+    widths: Sequence[int],
+    formats: Sequence[str],
+    quality: int,
+    lqip_width: int,
+    previous: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Encode `filename` at each width (never upscaled) in each format, plus a tiny
+    inline LQIP placeholder. Runs in a worker process.
+
+    Returns the manifest record; when `previous` was built from the same source
+    checksum and settings (and its files still exist) it is returned unchanged.
+    """
+    root = Path(scenario_dir)
+    src = root / filename
+    data = src.read_bytes()
+    checksum = hashlib.sha256(data).hexdigest()
+    spec = {"widths": sorted(set(widths)), "formats": list(formats), "quality": quality, "lqip": lqip_width}
+    if is_current(previous, checksum, spec, root):
+        return previous  # type: ignore[return-value]
+
+    out_dir = derived_dir(root)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files: List[Dict[str, Any]] = []
+    record: Dict[str, Any] = {"source": checksum, "spec": spec, "files": files}
+    with Image.open(io.BytesIO(data)) as im:
+        im.load()
+        w, h = im.size
+        record["width"], record["height"] = w, h
+        for width in sorted(set(widths)):
+            if width >= w:
+                continue  # the original already covers this width
+            height = max(1, round(h * width / w))
+            resized = im.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                frame = resized.convert("RGB") if _SAVE_FORMATS[fmt] == "JPEG" else resized
+                buf = io.BytesIO()
+                frame.save(buf, format=_SAVE_FORMATS[fmt], quality=quality)
+                name = f"{src.stem}.w{width}.{fmt}"
+                size = write_once(out_dir / name, buf.getbuffer())
+                files.append({
+                    "file": f"{out_dir.name}/{name}",
+                    "width": width,
+                    "height": height,
+                    "format": fmt,
+                    "bytes": size,
+                })
+        if lqip_width:
+            tw = min(lqip_width, w)
+            tiny = im.resize((tw, max(1, round(h * tw / w))), Image.BILINEAR)
+            buf = io.BytesIO()
+            tiny.save(buf, format="WEBP", quality=30)
+            record["lqip"] = "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+    return record
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import shutil
+import threading
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 
 def slugify_celeb(name: str) -> str:
@@ -27,11 +31,29 @@ def scenario_dir(output_dir: str, scenario: int) -> Path:
     return p
 
 
-def filename_for(scenario_dir: Path, celeb_slug: str, code: str, ext: str) -> Path:
+def filename_for(scenario_dir: Path, celeb_slug: str, code: str, ext: str, *, variant: int = 0) -> Path:
     ext = ext.lower().lstrip(".")
+    # Repeats of the same (celebrity, combo) get a -v{i} suffix instead of overwriting
+    if variant:
+        celeb_slug = f"{celeb_slug}-v{variant}"
     return scenario_dir / f"{celeb_slug}__{code}.{ext}"
 
 
+def read_attribute_stats(path: str | Path) -> Dict[str, Any]:
+    """
+    Load scenario attribute statistics ({relativeFrequencies, correlations}).
+
+    Also accepts a saved new-game response, which nests them under attributeStatistics.
+    """
+    data = json.loads(Path(path).read_text("utf-8"))
+    if isinstance(data, dict) and isinstance(data.get("attributeStatistics"), dict):
+        data = data["attributeStatistics"]
+    return {
+        "relativeFrequencies": dict(data.get("relativeFrequencies") or {}),
+        "correlations": dict(data.get("correlations") or {}),
+    }
+
+
 def manifest_path(scenario_dir: Path) -> Path:
     return scenario_dir / "manifest.json"
 
@@ -46,9 +68,177 @@ def read_manifest(scenario_dir: Path) -> Dict[str, Any]:
         return {"items": []}
 
 
+def _fsync_dir(path: Path) -> None:
+    # Makes a rename durable; directories cannot be opened this way on Windows
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def write_manifest(scenario_dir: Path, manifest: Dict[str, Any]) -> None:
+    """Atomically replace manifest.json; durable once this returns (data and rename fsynced)."""
     p = manifest_path(scenario_dir)
     tmp = p.with_suffix(".json.tmp")
-    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(json.dumps(manifest, indent=2, ensure_ascii=False))
+        f.flush()
+        os.fsync(f.fileno())
     tmp.replace(p)
+    _fsync_dir(scenario_dir)
+
+
+def journal_path(scenario_dir: Path) -> Path:
+    return scenario_dir / "manifest.journal.ndjson"
+
+
+def read_journal(scenario_dir: Path) -> List[Dict[str, Any]]:
+    p = journal_path(scenario_dir)
+    if not p.exists():
+        return []
+    entries: List[Dict[str, Any]] = []
+    with p.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Torn final line from a crash mid-write
+                continue
+    return entries
+
+
+def compact_manifest(scenario_dir: Path, scenario: int) -> Dict[str, Any]:
+    """Fold journal entries into manifest.json (atomic replace), then empty the journal.
+
+    Safe to repeat after a crash at any point: entries are keyed by filename.
+    """
+    manifest = read_manifest(scenario_dir)
+    items = {item["filename"]: item for item in manifest.get("items", [])}
+    journal = read_journal(scenario_dir)
+    for entry in journal:
+        items[entry["filename"]] = entry
+    manifest = {
+        "scenario": scenario,
+        "items": sorted(items.values(), key=lambda x: x["filename"]),
+    }
+    if journal or not manifest_path(scenario_dir).exists():
+        write_manifest(scenario_dir, manifest)
+    # Only now is the journal redundant: the manifest above is on disk
+    p = journal_path(scenario_dir)
+    if p.exists():
+        with p.open("r+", encoding="utf-8") as f:
+            f.truncate(0)
+    return manifest
+
+
+def index_path(scenario_dir: Path) -> Path:
+    return scenario_dir / "index.json"
+
+
+def hashed_dir(scenario_dir: Path) -> Path:
+    return scenario_dir / "hashed"
+
+
+def signature_of(filename: str) -> str | None:
+    """`celeb__UV1_I0.webp` -> `UV1_I0` (the combo code shared with the game client)."""
+    stem = Path(filename).stem
+    return stem.split("__", 1)[1] if "__" in stem else None
+
+
+def write_image_index(
+    scenario_dir: Path,
+    scenario: int,
+    items: List[Dict[str, Any]],
+    *,
+    attr_ids: List[str],
+    tokens: Dict[str, str],
+) -> Dict[str, Any]:
+    """
+    Publish outputs under content-hashed names and write index.json mapping
+    signature -> hashed filenames, so the files can be cached forever.
+
+    Hashed copies live in `hashed/`; `version` changes whenever any mapped file or the mapping itself does.
+    """
+    out_dir = hashed_dir(scenario_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    mapping: Dict[str, List[str]] = {}
+    for item in items:
+        src = scenario_dir / item["filename"]
+        signature = signature_of(item["filename"])
+        if signature is None or not src.exists():
+            continue
+        digest = hashlib.sha256(src.read_bytes()).hexdigest()[:10]
+        hashed = f"{src.stem}.{digest}{src.suffix}"
+        dst = out_dir / hashed
+        if not dst.exists():
+            # A copy, not a hard link: an in-place overwrite of the output
+            # (override: true) must not change a published, immutable file
+            shutil.copyfile(src, dst)
+        mapping.setdefault(signature, []).append(hashed)
+    for names in mapping.values():
+        names.sort()
+    mapping = dict(sorted(mapping.items()))
+    index = {
+        "scenario": scenario,
+        "version": hashlib.sha256(json.dumps(mapping, sort_keys=True).encode("utf-8")).hexdigest()[:12],
+        "attributes": list(attr_ids),
+        "tokens": {aid: tokens[aid] for aid in attr_ids},
+        "mapping": mapping,
+    }
+    p = index_path(scenario_dir)
+    tmp = p.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    tmp.replace(p)
+    return index
+
+
+class ManifestJournal:
+    """
+    Append-only NDJSON log of completed manifest items, fsynced per batch.
+
+    Methods block on disk IO; async callers run them via asyncio.to_thread.
+    An internal lock keeps appends and compaction from interleaving across threads.
+    """
+
+    def __init__(self, scenario_dir: Path, scenario: int, *, compact_every: int = 100):
+        self.scenario_dir = scenario_dir
+        self.scenario = scenario
+        self.compact_every = compact_every
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._fh = journal_path(scenario_dir).open("a", encoding="utf-8")
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        self.extend([entry])
+
+    def extend(self, entries: List[Dict[str, Any]]) -> None:
+        if not entries:
+            return
+        with self._lock:
+            self._fh.write("".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n" for e in entries))
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._pending += len(entries)
+            if self.compact_every and self._pending >= self.compact_every:
+                self._compact()
+
+    def compact(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._compact()
+
+    def _compact(self) -> Dict[str, Any]:
+        self._fh.flush()
+        manifest = compact_manifest(self.scenario_dir, self.scenario)
+        self._pending = 0
+        return manifest
 
+    def close(self) -> Dict[str, Any]:
+        manifest = self.compact()
+        self._fh.close()
+        return manifest
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .utils import utc_now_iso
+
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    bits TEXT NOT NULL,
+    celebrity TEXT NOT NULL,
+    variants TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_state ON jobs (state, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class Job(NamedTuple):
+    id: int
+    bits: List[int]
+    celebrity: str
+    variants: List[int]
+    attempts: int
+
+
+def queue_path(scenario_dir: Path) -> Path:
+    return scenario_dir / "jobs.sqlite3"
+
+
+class JobQueue:
+    """
+    Persistent plan of generation jobs (one row per n>1 request), SQLite-backed.
+
+    Jobs move pending -> running -> done | failed. The runner claims jobs from a
+    single event loop, so a claim is a plain read-then-update. On resume, jobs
+    left running by a crash go back to pending and failed jobs get another try
+    until `max_attempts`.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # Plan
+
+    def plan_key(self) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'plan'").fetchone()
+        return row[0] if row else None
+
+    def has_plan(self) -> bool:
+        return self.plan_key() is not None
+
+    def replace_plan(self, jobs: Iterable[Tuple[List[int], str, List[int]]], *, plan_key: str, chunk: int = 1000) -> int:
+        """Drop any previous plan and enqueue `jobs` as pending, streaming in chunks."""
+        with self._conn:
+            self._conn.execute("DELETE FROM jobs")
+            self._conn.execute("DELETE FROM meta WHERE key = 'plan'")
+        count = 0
+        batch: List[Tuple[str, str, str]] = []
+        for bits, celeb, variants in jobs:
+            batch.append(("".join(str(b) for b in bits), celeb, json.dumps(variants)))
+            if len(batch) >= chunk:
+                count += self._insert(batch)
+                batch = []
+        count += self._insert(batch)
+        # Recorded last: an interrupted enqueue leaves no plan and is redone
+        with self._conn:
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('plan', ?)", (plan_key,))
+        return count
+
+    def _insert(self, batch: List[Tuple[str, str, str]]) -> int:
+        if not batch:
+            return 0
+        with self._conn:
+            self._conn.executemany("INSERT INTO jobs (bits, celebrity, variants) VALUES (?, ?, ?)", batch)
+        return len(batch)
+
+    def requeue(self, *, max_attempts: int) -> int:
+        """Make interrupted and retryable failed jobs pending again; returns how many."""
+        with self._conn:
+            cur = self._conn.execute(
+                "UPDATE jobs SET state = ? WHERE state = ? OR (state = ? AND attempts < ?)",
+                (PENDING, RUNNING, FAILED, max_attempts),
+            )
+        return cur.rowcount
+
+    # Work
+
+    def claim(self) -> Optional[Job]:
+        row = self._conn.execute(
+            "SELECT id, bits, celebrity, variants, attempts FROM jobs WHERE state = ? ORDER BY id LIMIT 1",
+            (PENDING,),
+        ).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?", (RUNNING, utc_now_iso(), row[0])
+            )
+        return Job(row[0], [int(c) for c in row[1]], row[2], json.loads(row[3]), row[4])
+
+    def complete(self, job_id: int) -> None:
+        with self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (DONE, utc_now_iso(), job_id),
+            )
+
+    def fail(self, job_id: int, error: str) -> None:
+        with self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (FAILED, error, utc_now_iso(), job_id),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: n for state, n in rows}
+
+    def pending_images(self) -> int:
+        total = 0
+        for (variants,) in self._conn.execute("SELECT variants FROM jobs WHERE state = ?", (PENDING,)):
+            total += len(json.loads(variants))
+        return total
@@ -12,12 +12,15 @@ def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Generate caricature images for attribute combinations.")
     parser.add_argument("--config", default="config.yaml", help="Path to YAML config")
     parser.add_argument("--dry-run", action="store_true", help="Plan and print without generating")
+    parser.add_argument(
+        "--resume", action="store_true", help="Continue the stored job queue instead of re-planning"
+    )
     parser.add_argument("-v", "--verbose", action="store_true", help="Print per-file logs and errors")
     args = parser.parse_args(argv)
 
     cfg = load_config(args.config)
     try:
-        asyncio.run(run(cfg, dry_run=args.dry_run, verbose=args.verbose))
+        asyncio.run(run(cfg, dry_run=args.dry_run, verbose=args.verbose, resume=args.resume))
         return 0
     except KeyboardInterrupt:
         return 130
@@ -1,287 +1,370 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import io
+import json
+import mimetypes
 import os
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from tenacity import stop_after_attempt, wait_exponential_jitter, Retrying
-
-try:
-    from openai import OpenAI
-except Exception:  # pragma: no cover
-    OpenAI = None  # type: ignore
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 
 from PIL import Image
 import httpx
 
+from .ratelimit import AdaptiveLimiter, RateLimitedError, parse_retry_after
+from .transcode import encode, needs_transcode
+from .utils import sha256_bytes
+
 
 class ImageResult:
-    def __init__(self, content: bytes, mime: str):
+    def __init__(
+        self,
+        content: bytes,
+        mime: str,
+        *,
+        tokens: int = 0,
+        headers: Optional[Dict[str, str]] = None,
+        images: Optional[List[bytes]] = None,
+    ):
         self.content = content
         self.mime = mime
+        # Every image of an n>1 request, in response order (content is the first)
+        self.images = images or [content]
+        # Usage and response headers feed the adaptive rate limiter
+        self.tokens = tokens
+        self.headers = headers or {}
 
 
 def _to_format(content: bytes, fmt: str) -> bytes:
-    fmt = fmt.lower()
-    if fmt in ("png", "jpg", "jpeg", "webp"):
-        with Image.open(io.BytesIO(content)) as im:
-            out = io.BytesIO()
-            save_fmt = "JPEG" if fmt in ("jpg", "jpeg") else fmt.upper()
-            im.save(out, format=save_fmt)
-            return out.getvalue()
+    # Skip the decode/encode round trip when the API already returned `fmt`
+    if needs_transcode(content, fmt):
+        return encode(content, fmt).getvalue()
     return content
 
 
-def _download_url(url: str) -> bytes:
-    with httpx.Client(timeout=60.0) as client:
-        r = client.get(url)
-        r.raise_for_status()
-        return r.content
+def _mime_for(fmt: str) -> str:
+    return "image/webp" if fmt == "webp" else ("image/jpeg" if fmt in ("jpg", "jpeg") else "image/png")
+
+
+class CachedAsset:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.content = f.read()
+        self.filename = os.path.basename(path)
+        self.digest = sha256_bytes(self.content)
+        # The edits endpoint rejects uploads it cannot identify as png/jpeg/webp
+        self.mime = mimetypes.guess_type(self.filename)[0] or "application/octet-stream"
+        try:
+            with Image.open(io.BytesIO(self.content)) as im:
+                self.dimensions: Optional[Tuple[int, int]] = im.size
+                self.mime = Image.MIME.get(im.format or "", self.mime)
+        except Exception:
+            self.dimensions = None
+
+    @property
+    def size_str(self) -> Optional[str]:
+        return f"{self.dimensions[0]}x{self.dimensions[1]}" if self.dimensions else None
+
+    def upload(self) -> Tuple[str, bytes, str]:
+        # (filename, content, mime) works for both the SDK and httpx multipart
+        return (self.filename, self.content, self.mime)
+
+
+class AssetCache:
+    """Reference/background files read and measured once per client, then reused for every request."""
+
+    def __init__(self) -> None:
+        self._assets: Dict[str, CachedAsset] = {}
+
+    def get(self, path: str) -> CachedAsset:
+        asset = self._assets.get(path)
+        if asset is None:
+            asset = CachedAsset(path)
+            self._assets[path] = asset
+        return asset
+
+    async def load(self, paths: Iterable[str]) -> None:
+        """Read and measure uncached files in a worker thread, off the event loop."""
+        for path in paths:
+            if path not in self._assets:
+                asset = await asyncio.to_thread(CachedAsset, path)
+                # A concurrent first use may have loaded it meanwhile: keep one copy
+                self._assets.setdefault(path, asset)
+
+
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+# 429s are not retried here: they are raised as RateLimitedError for the limiter
+RETRYABLE_STATUS = {408, 409, 500, 502, 503, 504}
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return False
+
+
+class AsyncOpenAIImageClient:
+    """
+    Async-native Images client over one pooled httpx.AsyncClient.
 
+    Calls the REST endpoints directly (no SDK, no executor threads), so the
+    number of in-flight requests is bounded only by the caller's semaphore.
+    `base_url` (or OPENAI_BASE_URL) and `transport` allow pointing it at a
+    local mock endpoint.
+    """
 
-class OpenAIImageClient:
-    def __init__(self, *, api_key: Optional[str], attempts: int, base_seconds: float, max_seconds: float, debug: bool = False):
+    def __init__(
+        self,
+        *,
+        api_key: Optional[str],
+        attempts: int,
+        base_seconds: float,
+        max_seconds: float,
+        max_connections: int = 10,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        debug: bool = False,
+    ):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise RuntimeError("OPENAI_API_KEY missing; set in environment or .env")
         self.attempts = attempts
         self.base_seconds = base_seconds
         self.max_seconds = max_seconds
-        self._client = OpenAI() if OpenAI else None
         self.debug = debug
+        self._http = httpx.AsyncClient(
+            base_url=base_url or os.getenv("OPENAI_BASE_URL") or DEFAULT_API_BASE,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=httpx.Timeout(120.0, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        # URL results point at storage hosts: fetch them without the API key
+        self._download = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0), transport=transport)
+        self.assets = AssetCache()
+
+    async def __aenter__(self) -> "AsyncOpenAIImageClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+        await self._download.aclose()
 
-    def generate(
+    async def _decode_item(self, item: Dict[str, Any]) -> bytes:
+        if item.get("b64_json"):
+            return base64.b64decode(item["b64_json"])
+        if item.get("url"):
+            r = await self._download.get(item["url"])
+            r.raise_for_status()
+            return r.content
+        raise RuntimeError("Image response missing b64_json and url")
+
+    async def _post_once(
+        self,
+        *,
+        prompt: str,
+        size: str,
+        model: str,
+        images: List[str],
+        options: Dict[str, str],
+        n: int = 1,
+    ) -> Tuple[List[bytes], Dict[str, Any], Dict[str, str]]:
+        if n > 1:
+            options = {**options, "n": n}
+        if images:
+            data = {"model": model, "prompt": prompt, "size": size, **{k: str(v) for k, v in options.items()}}
+            field = "image[]" if len(images) > 1 else "image"
+            files = [(field, self.assets.get(path).upload()) for path in images]
+            if self.debug:
+                print(f"[images] async edits: model={model}, size={size}, images={images}")
+            r = await self._http.post("/images/edits", data=data, files=files)
+        else:
+            payload = {"model": model, "prompt": prompt, "size": size, **options}
+            if self.debug:
+                print(f"[images] async generate: model={model}, size={size}")
+            r = await self._http.post("/images/generations", json=payload)
+        if r.status_code == 429:
+            headers = {k.lower(): v for k, v in r.headers.items()}
+            raise RateLimitedError(
+                f"rate limited (429): {r.text[:200]}",
+                retry_after=parse_retry_after(headers),
+                headers=headers,
+            )
+        r.raise_for_status()
+        body = r.json()
+        raws = [await self._decode_item(item) for item in body["data"][:n]]
+        if not raws:
+            raise RuntimeError("Image response contained no images")
+        return raws, body, {k.lower(): v for k, v in r.headers.items()}
+
+    async def _request(
+        self,
+        *,
+        size: str,
+        reference_image_path: str | None,
+        background_image_path: str | None,
+        quality: str | None,
+        input_fidelity: str | None,
+        background: str | None,
+        moderation: str | None,
+    ) -> Tuple[str, List[str], Dict[str, str]]:
+        target_size = size
+        # Background first, reference second
+        images = [p for p in (background_image_path, reference_image_path) if p]
+        await self.assets.load(images)
+        if background_image_path:
+            target_size = self.assets.get(background_image_path).size_str or target_size
+        options = {
+            k: v
+            for k, v in (
+                ("quality", quality),
+                ("input_fidelity", input_fidelity if images else None),
+                ("background", background),
+                ("moderation", moderation),
+            )
+            if v is not None
+        }
+        return target_size, images, options
+
+    async def cache_key(
         self,
         *,
         prompt: str,
         size: str,
-        out_format: str,
         model: str = "gpt-image-1",
-        # Legacy single reference image (kept for backward compat)
         reference_image_path: str | None = None,
-        # New: background base image for edits and optional mask
         background_image_path: str | None = None,
-        mask_path: str | None = None,
-        # Optional list of extra reference images (style/context only)
-        reference_image_paths: list[str] | None = None,
-        # Optional rendering controls
         quality: str | None = None,
         input_fidelity: str | None = None,
         background: str | None = None,
         moderation: str | None = None,
+        variant: int = 0,
+    ) -> str:
+        """Content address of a request: identical inputs yield an identical (reusable) image.
+
+        `variant` tells apart the images of one batched (n>1) request.
+        """
+        target_size, images, options = await self._request(
+            size=size,
+            reference_image_path=reference_image_path,
+            background_image_path=background_image_path,
+            quality=quality,
+            input_fidelity=input_fidelity,
+            background=background,
+            moderation=moderation,
+        )
+        spec = {
+            "prompt": prompt,
+            "model": model,
+            "size": target_size,
+            "options": options,
+            "images": [self.assets.get(p).digest for p in images],
+        }
+        if variant:
+            spec["variant"] = variant
+        return sha256_bytes(json.dumps(spec, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+    async def fetch(
+        self,
+        *,
+        prompt: str,
+        size: str,
+        model: str = "gpt-image-1",
+        reference_image_path: str | None = None,
+        background_image_path: str | None = None,
+        quality: str | None = None,
+        input_fidelity: str | None = None,
+        background: str | None = None,
+        moderation: str | None = None,
+        n: int = 1,
+        limiter: Optional[AdaptiveLimiter] = None,
     ) -> ImageResult:
-        out_format = out_format.lower()
-        target_size = size
-        for attempt in Retrying(
+        """Run the request and return the image(s) exactly as the API produced them (no transcoding).
+
+        With a `limiter`, each attempt holds its own slot and reports its outcome; the
+        retry backoff runs between slots so a failing call does not pin concurrency.
+        A 429 is reported to the limiter and raised for the caller to reschedule.
+        """
+        target_size, images, options = await self._request(
+            size=size,
+            reference_image_path=reference_image_path,
+            background_image_path=background_image_path,
+            quality=quality,
+            input_fidelity=input_fidelity,
+            background=background,
+            moderation=moderation,
+        )
+        raws, body, headers = [], {}, {}
+        async for attempt in AsyncRetrying(
             stop=stop_after_attempt(self.attempts),
             wait=wait_exponential_jitter(initial=self.base_seconds, max=self.max_seconds),
+            retry=retry_if_exception(_is_retryable),
             reraise=True,
         ):
             with attempt:
-                # 1) If both background and reference images are provided, use new multi-image API
-                if background_image_path and reference_image_path:
-                    if self._client is None:
-                        raise RuntimeError("OpenAI SDK client not available for image edits; install/openai or set up environment correctly.")
-                    if self.debug:
-                        print(f"[images] SDK edits (multi-image): model={model}, size={target_size}, bg={background_image_path}, ref={reference_image_path}")
-
-                    # Open both images - background first, then reference
-                    bg_f = open(background_image_path, "rb")
-                    ref_f = open(reference_image_path, "rb")
-                    try:
-                        # Set target size to match background
-                        try:
-                            with Image.open(background_image_path) as _bg_im:
-                                target_size = f"{_bg_im.size[0]}x{_bg_im.size[1]}"
-                        except Exception:
-                            pass
-
-                        kwargs = {
-                            "model": model,
-                            "prompt": prompt,
-                            "image": [bg_f, ref_f],  # Background first, reference second
-                            "size": target_size,
-                        }
-                        if quality is not None:
-                            kwargs["quality"] = quality
-                        if input_fidelity is not None:
-                            kwargs["input_fidelity"] = input_fidelity
-                        if background is not None:
-                            kwargs["background"] = background
-                        if moderation is not None:
-                            kwargs["moderation"] = moderation
-                        
-                        resp = self._client.images.edit(**kwargs)
-                    finally:
-                        try:
-                            bg_f.close()
-                        except Exception:
-                            pass
-                        try:
-                            ref_f.close()
-                        except Exception:
-                            pass
-
-                    data0 = resp.data[0]
-                    if hasattr(data0, "b64_json") and data0.b64_json:  # type: ignore[attr-defined]
-                        raw = base64.b64decode(data0.b64_json)  # type: ignore[attr-defined]
-                    elif hasattr(data0, "url") and data0.url:  # type: ignore[attr-defined]
-                        raw = _download_url(data0.url)  # type: ignore[attr-defined]
-                    else:
-                        raise RuntimeError("Image response missing b64_json and url")
-                    content = _to_format(raw, out_format)
-                    mime = "image/webp" if out_format == "webp" else (
-                        "image/jpeg" if out_format in ("jpg", "jpeg") else "image/png"
+                if limiter is None:
+                    raws, body, headers = await self._post_once(
+                        prompt=prompt, size=target_size, model=model, images=images, options=options, n=n
                     )
-                    return ImageResult(content=content, mime=mime)
-
-                # 2) If only background image is provided, use it for editing
-                elif background_image_path:
-                    if self._client is None:
-                        raise RuntimeError("OpenAI SDK client not available for image edits; install/openai or set up environment correctly.")
-                    if self.debug:
-                        print(f"[images] SDK edits (background-only): model={model}, size={target_size}, bg={background_image_path}")
-
-                    bg_f = open(background_image_path, "rb")
-                    try:
-                        # Set target size to match background
-                        try:
-                            with Image.open(background_image_path) as _bg_im:
-                                target_size = f"{_bg_im.size[0]}x{_bg_im.size[1]}"
-                        except Exception:
-                            pass
-
-                        kwargs = {
-                            "model": model,
-                            "prompt": prompt,
-                            "image": bg_f,
-                            "size": target_size,
-                        }
-                        if quality is not None:
-                            kwargs["quality"] = quality
-                        if input_fidelity is not None:
-                            kwargs["input_fidelity"] = input_fidelity
-                        if background is not None:
-                            kwargs["background"] = background
-                        if moderation is not None:
-                            kwargs["moderation"] = moderation
-                        
-                        resp = self._client.images.edit(**kwargs)
-                    finally:
+                else:
+                    async with limiter.slot(weight=n) as slot:
                         try:
-                            bg_f.close()
-                        except Exception:
-                            pass
-
-                    data0 = resp.data[0]
-                    if hasattr(data0, "b64_json") and data0.b64_json:  # type: ignore[attr-defined]
-                        raw = base64.b64decode(data0.b64_json)  # type: ignore[attr-defined]
-                    elif hasattr(data0, "url") and data0.url:  # type: ignore[attr-defined]
-                        raw = _download_url(data0.url)  # type: ignore[attr-defined]
-                    else:
-                        raise RuntimeError("Image response missing b64_json and url")
-                    content = _to_format(raw, out_format)
-                    mime = "image/webp" if out_format == "webp" else (
-                        "image/jpeg" if out_format in ("jpg", "jpeg") else "image/png"
-                    )
-                    return ImageResult(content=content, mime=mime)
-
-                # 3) Otherwise, if a single reference image is provided, prefer SDK edits; fallback to HTTP edits
-                elif reference_image_path:
-                    if self._client is not None:
-                        if self.debug:
-                            print(f"[images] SDK edit: model={model}, size={target_size}, image={reference_image_path}")
-                        try:
-                            with open(reference_image_path, "rb") as f:
-                                resp = self._client.images.edit(
-                                    model=model,
-                                    prompt=prompt,
-                                    image=f,
-                                    size=target_size,
-                                )
-                            data0 = resp.data[0]
-                            if hasattr(data0, "b64_json") and data0.b64_json:  # type: ignore[attr-defined]
-                                raw = base64.b64decode(data0.b64_json)  # type: ignore[attr-defined]
-                            elif hasattr(data0, "url") and data0.url:  # type: ignore[attr-defined]
-                                raw = _download_url(data0.url)  # type: ignore[attr-defined]
-                            else:
-                                raise RuntimeError("Image response missing b64_json and url")
-                            content = _to_format(raw, out_format)
-                            mime = "image/webp" if out_format == "webp" else (
-                                "image/jpeg" if out_format in ("jpg", "jpeg") else "image/png"
+                            raws, body, headers = await self._post_once(
+                                prompt=prompt, size=target_size, model=model, images=images, options=options, n=n
                             )
-                            return ImageResult(content=content, mime=mime)
-                        except Exception as e:
-                            if self.debug:
-                                print(f"[images] SDK edit failed; falling back to HTTP edits: {e}")
-
-                    # HTTP edits (single image, no mask)
-                    with httpx.Client(timeout=60.0) as client:
-                        url = "https://api.openai.com/v1/images/edits"
-                        headers = {"Authorization": f"Bearer {self.api_key}"}
-                        data = {"model": model, "prompt": prompt, "size": target_size}
-                        with open(reference_image_path, "rb") as f:
-                            files = {"image": (os.path.basename(reference_image_path), f, "application/octet-stream")}
-                            if self.debug:
-                                print(f"[images] HTTP edits: model={model}, size={target_size}, image={reference_image_path}")
-                        r = client.post(url, headers=headers, data=data, files=files)
-                        r.raise_for_status()
-                        j = r.json()
-                        item0 = j["data"][0]
-                        if "b64_json" in item0 and item0["b64_json"]:
-                            raw = base64.b64decode(item0["b64_json"])
-                        elif "url" in item0 and item0["url"]:
-                            raw = _download_url(item0["url"])
-                        else:
-                            raise RuntimeError("Image response missing b64_json and url")
-                        content = _to_format(raw, out_format)
-                        mime = "image/webp" if out_format == "webp" else (
-                            "image/jpeg" if out_format in ("jpg", "jpeg") else "image/png"
-                        )
-                        return ImageResult(content=content, mime=mime)
-
-                # 3) Otherwise, try SDK generate
-                if self._client is not None:
-                    if self.debug:
-                        print(f"[images] SDK generate: model={model}, size={target_size}")
-                    resp = self._client.images.generate(
-                        model=model,
-                        prompt=prompt,
-                        size=target_size,
-                    )
-                    data0 = resp.data[0]
-                    if hasattr(data0, "b64_json") and data0.b64_json:  # type: ignore[attr-defined]
-                        raw = base64.b64decode(data0.b64_json)  # type: ignore[attr-defined]
-                    elif hasattr(data0, "url") and data0.url:  # type: ignore[attr-defined]
-                        raw = _download_url(data0.url)  # type: ignore[attr-defined]
-                    else:
-                        raise RuntimeError("Image response missing b64_json and url")
-                    content = _to_format(raw, out_format)
-                    mime = "image/webp" if out_format == "webp" else (
-                        "image/jpeg" if out_format in ("jpg", "jpeg") else "image/png"
-                    )
-                    return ImageResult(content=content, mime=mime)
-
-                # 4) Fallback HTTP generate
-                with httpx.Client(timeout=60.0) as client:
-                    url = "https://api.openai.com/v1/images/generations"
-                    headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-                    payload = {"model": model, "prompt": prompt, "size": target_size}
-                    if self.debug:
-                        print(f"[images] HTTP generate: keys={list(payload.keys())}, size={target_size}")
-                    r = client.post(url, headers=headers, json=payload)
-                    r.raise_for_status()
-                    j = r.json()
-                    item0 = j["data"][0]
-                    if "b64_json" in item0 and item0["b64_json"]:
-                        raw = base64.b64decode(item0["b64_json"])
-                    elif "url" in item0 and item0["url"]:
-                        raw = _download_url(item0["url"])
-                    else:
-                        raise RuntimeError("Image response missing b64_json and url")
-                    content = _to_format(raw, out_format)
-                    mime = "image/webp" if out_format == "webp" else (
-                        "image/jpeg" if out_format in ("jpg", "jpeg") else "image/png"
-                    )
-                    return ImageResult(content=content, mime=mime)
+                        except RateLimitedError as e:
+                            # Limiter backs off (AIMD + Retry-After) before the caller retries
+                            slot.throttled(e)
+                            raise
+                        slot.ok(tokens=int((body.get("usage") or {}).get("total_tokens", 0) or 0), headers=headers)
+        usage = body.get("usage") or {}
+        return ImageResult(
+            content=raws[0],
+            mime="application/octet-stream",
+            tokens=int(usage.get("total_tokens", 0) or 0),
+            headers=headers,
+            images=raws,
+        )
+
+    async def generate(
+        self,
+        *,
+        prompt: str,
+        size: str,
+        out_format: str,
+        model: str = "gpt-image-1",
+        reference_image_path: str | None = None,
+        background_image_path: str | None = None,
+        quality: str | None = None,
+        input_fidelity: str | None = None,
+        background: str | None = None,
+        moderation: str | None = None,
+    ) -> ImageResult:
+        out_format = out_format.lower()
+        result = await self.fetch(
+            prompt=prompt,
+            size=size,
+            model=model,
+            reference_image_path=reference_image_path,
+            background_image_path=background_image_path,
+            quality=quality,
+            input_fidelity=input_fidelity,
+            background=background,
+            moderation=moderation,
+        )
+        # Transcoding is CPU-bound; keep it off the event loop
+        result.content = await asyncio.to_thread(_to_format, result.content, out_format)
+        result.mime = _mime_for(out_format)
+        return result
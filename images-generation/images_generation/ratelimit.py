@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Deque, Mapping, Optional, Tuple
+
+
+class RateLimitedError(RuntimeError):
+    def __init__(self, message: str, *, retry_after: Optional[float], headers: Mapping[str, str]):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.headers = headers
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI-style reset durations ("20ms", "1.5s", "6m0s") into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _UNIT_SECONDS[u] for n, u in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to Retry-After (seconds or HTTP date) or ratelimit reset headers."""
+    raw = headers.get("retry-after-ms")
+    if raw:
+        try:
+            return max(0.0, float(raw) / 1000.0)
+        except ValueError:
+            pass
+    raw = headers.get("retry-after")
+    if raw:
+        try:
+            return max(0.0, float(raw))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    resets = [
+        parse_reset(headers.get(h))
+        for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+    ]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter for rate-limited APIs.
+
+    The in-flight limit grows by `increase` per window of successful calls and is
+    multiplied by `decrease` on a 429, pausing new calls until the server's
+    Retry-After/reset time. Optional per-minute budgets on images (each call
+    weighs the number of images it requests) and tokens are enforced over a
+    sliding 60s window.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial: int,
+        minimum: int = 1,
+        maximum: int,
+        images_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[int] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        default_backoff: float = 2.0,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.images_per_minute = images_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.increase = increase
+        self.decrease = decrease
+        self.default_backoff = default_backoff
+        self.in_flight = 0
+        self.rate_limited = 0
+        self._resume_at = 0.0
+        self._starts: Deque[Tuple[float, int]] = deque()
+        self._tokens: Deque[Tuple[float, int]] = deque()
+        self._cond = asyncio.Condition()
+
+    def _prune(self, now: float) -> None:
+        while self._starts and now - self._starts[0][0] >= 60.0:
+            self._starts.popleft()
+        while self._tokens and now - self._tokens[0][0] >= 60.0:
+            self._tokens.popleft()
+
+    def _wait_time(self, now: float, weight: int) -> Optional[float]:
+        """None if a call may start now, else seconds until re-checking (0 = wait for a release)."""
+        if now < self._resume_at:
+            return self._resume_at - now
+        self._prune(now)
+        # A call larger than the whole budget still runs once the window is empty
+        if (
+            self.images_per_minute
+            and self._starts
+            and sum(w for _, w in self._starts) + weight > self.images_per_minute
+        ):
+            return 60.0 - (now - self._starts[0][0])
+        if self.tokens_per_minute and sum(t for _, t in self._tokens) >= self.tokens_per_minute:
+            return 60.0 - (now - self._tokens[0][0])
+        if self.in_flight >= int(self.limit):
+            return 0.0
+        return None
+
+    async def acquire(self, weight: int = 1) -> None:
+        async with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now, weight)
+                if wait is None:
+                    break
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+            self._starts.append((time.monotonic(), weight))
+
+    async def release(
+        self,
+        *,
+        success: bool,
+        rate_limited: bool = False,
+        retry_after: Optional[float] = None,
+        tokens: int = 0,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        async with self._cond:
+            now = time.monotonic()
+            self.in_flight -= 1
+            if tokens:
+                self._tokens.append((now, tokens))
+            if rate_limited:
+                self.rate_limited += 1
+                self.limit = max(float(self.minimum), self.limit * self.decrease)
+                delay = retry_after if retry_after is not None else self.default_backoff
+                self._resume_at = max(self._resume_at, now + delay)
+            elif success:
+                self.limit = min(float(self.maximum), self.limit + self.increase / max(1.0, self.limit))
+            if headers is not None and headers.get("x-ratelimit-remaining-requests") == "0":
+                reset = parse_reset(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    self._resume_at = max(self._resume_at, now + reset)
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self, weight: int = 1) -> AsyncIterator["_Slot"]:
+        """Hold one in-flight call that counts `weight` images against the per-minute budget."""
+        await self.acquire(weight)
+        s = _Slot()
+        try:
+            yield s
+        finally:
+            await self.release(
+                success=s.success,
+                rate_limited=s.rate_limited,
+                retry_after=s.retry_after,
+                tokens=s.tokens,
+                headers=s.headers,
+            )
+
+
+class _Slot:
+    """Outcome of one call, reported back to the limiter when the slot is released."""
+
+    def __init__(self) -> None:
+        self.success = False
+        self.rate_limited = False
+        self.retry_after: Optional[float] = None
+        self.tokens = 0
+        self.headers: Optional[Mapping[str, str]] = None
+
+    def ok(self, *, tokens: int = 0, headers: Optional[Mapping[str, str]] = None) -> None:
+        self.success = True
+        self.tokens = tokens
+        self.headers = headers
+
+    def throttled(self, err: RateLimitedError) -> None:
+        self.rate_limited = True
+        self.retry_after = err.retry_after
+        self.headers = err.headers
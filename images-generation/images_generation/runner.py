@@ -4,23 +4,39 @@ import asyncio
 from dataclasses import asdict
 import io
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
 
 from tqdm import tqdm
 
 from .config import AppConfig
 from .abbreviations import make_attribute_tokens, encode_combo
-from .combos import enumerate_bit_combos, plan_assignments, analyze_celebrity_distribution
+from .combos import (
+    AllocatedCombos,
+    ComboSpace,
+    allocate_counts,
+    analyze_celebrity_distribution,
+    combo_weights,
+    group_requests,
+    iter_assignments,
+)
 from .fileio import (
+    ManifestJournal,
+    compact_manifest,
     filename_for,
-    read_manifest,
+    read_attribute_stats,
     scenario_dir,
-    slugify_celeb,
+    write_image_index,
     write_manifest,
+    slugify_celeb,
 )
-from .openai_client import OpenAIImageClient
+from .blobcache import BlobCache
+from .derivatives import build_derivatives, supported_formats
+from .jobqueue import JobQueue, queue_path
+from .openai_client import AsyncOpenAIImageClient, _to_format
+from .ratelimit import AdaptiveLimiter, RateLimitedError
+from .transcode import Transcoder, write_once
 from .prompt_builder import build_structured_prompt, structured_to_text_prompt
-from .utils import utc_now_iso, build_rect_mask_and_preview, normalize_mask_to_alpha
+from .utils import sha256_bytes, utc_now_iso, build_rect_mask_and_preview, normalize_mask_to_alpha
 import json
 
 
@@ -28,9 +44,37 @@ def json_dumps(obj) -> str:
     return json.dumps(obj, ensure_ascii=False, indent=2)
 
 
+def build_limiter(cfg: AppConfig) -> AdaptiveLimiter:
+    rl = cfg.rate_limit
+    if rl.adaptive:
+        minimum, maximum = 1, rl.max_concurrency or cfg.concurrency * 4
+    else:
+        # Fixed concurrency, but still honor Retry-After and the per-minute budgets
+        minimum = maximum = cfg.concurrency
+    return AdaptiveLimiter(
+        initial=cfg.concurrency,
+        minimum=minimum,
+        maximum=maximum,
+        images_per_minute=rl.images_per_minute,
+        tokens_per_minute=rl.tokens_per_minute,
+    )
+
+
+def weighted_combos(cfg: AppConfig, combos: Sequence[List[int]]) -> AllocatedCombos:
+    """Spread total_images over combos by their expected share of the scenario's people."""
+    stats = {"relativeFrequencies": {}, "correlations": {}}
+    if cfg.planner.stats_path:
+        stats = read_attribute_stats(cfg.planner.stats_path)
+    freqs = {**stats["relativeFrequencies"], **cfg.planner.relative_frequencies}
+    corrs = {**stats["correlations"], **cfg.planner.correlations}
+    weights = combo_weights(combos, cfg.attr_ids, freqs, corrs)
+    counts = allocate_counts(weights, cfg.total_images, floor=cfg.planner.min_per_combo)
+    return AllocatedCombos(combos, counts)
+
+
 async def _generate_one(
-    sem: asyncio.Semaphore,
-    client: OpenAIImageClient,
+    limiter: AdaptiveLimiter,
+    client: AsyncOpenAIImageClient,
     cfg: AppConfig,
     scenario_path: Path,
     celeb: str,
@@ -39,17 +83,34 @@ async def _generate_one(
     attr_ids: List[str],
     attr_visuals: Dict[str, str],
     dry_run: bool,
-) -> Tuple[str, str, Dict[str, bool], bool, str]:
+    done: Set[str] | None = None,
+    cache: BlobCache | None = None,
+    transcoder: Transcoder | None = None,
+    variants: Sequence[int] = (0,),
+) -> List[Tuple[str, str, Dict[str, bool], bool, str]]:
     """
-    Returns: (filename, celeb, attributes, skipped, error_message)
+    Generates every variant of one (combo, celebrity) job with a single n>1 request.
+
+    Returns one (filename, celeb, attributes, skipped, error_message) per variant.
     """
     attributes = {aid: bool(b) for aid, b in zip(attr_ids, bits)}
     code = encode_combo(bits, tokens_ordered)
     celeb_slug = slugify_celeb(celeb)
-    out_path = filename_for(scenario_path, celeb_slug, code, cfg.image.format)
+    out_paths = {v: filename_for(scenario_path, celeb_slug, code, cfg.image.format, variant=v) for v in variants}
+
+    results: Dict[int, Tuple[str, str, Dict[str, bool], bool, str]] = {}
 
-    if out_path.exists() and not cfg.override:
-        return (str(out_path.name), celeb, attributes, True, "")
+    def finish(v: int, skipped: bool = False, error: str = "") -> None:
+        results[v] = (str(out_paths[v].name), celeb, attributes, skipped, error)
+
+    pending: List[int] = []
+    for v, out_path in out_paths.items():
+        if not cfg.override and ((done is not None and out_path.name in done) or out_path.exists()):
+            finish(v, skipped=True)
+        else:
+            pending.append(v)
+    if not pending:
+        return [results[v] for v in variants]
 
     structured = build_structured_prompt(
         celebrity=celeb,
@@ -61,36 +122,133 @@ async def _generate_one(
     )
     prompt = structured_to_text_prompt(structured)
 
-    async with sem:
+    if dry_run:
+        for v in pending:
+            finish(v, error="DRY_RUN")
+        return [results[v] for v in variants]
+    request = dict(
+        prompt=prompt,
+        size=str(cfg.image.size),
+        model=cfg.image.model,
+        # Keep legacy single reference for style if provided
+        reference_image_path=cfg.image.attach_image_path,
+        # New background support (no masking)
+        background_image_path=cfg.image.background_image_path,
+        quality=cfg.image.quality,
+        input_fidelity=cfg.image.input_fidelity,
+        background=cfg.image.background,
+        moderation=cfg.image.moderation,
+    )
+    raws: Dict[int, bytes] = {}
+    keys: Dict[int, str] = {}
+    if cache is not None:
         try:
-            if dry_run:
-                return (str(out_path.name), celeb, attributes, False, "DRY_RUN")
-            loop = asyncio.get_running_loop()
-            result = await loop.run_in_executor(
-                None,
-                lambda: client.generate(
-                    prompt=prompt,
-                    size=str(cfg.image.size),
-                    out_format=cfg.image.format,
-                    model=cfg.image.model,
-                    # Keep legacy single reference for style if provided
-                    reference_image_path=cfg.image.attach_image_path,
-                    # New background support (no masking)
-                    background_image_path=cfg.image.background_image_path,
-                    quality=cfg.image.quality,
-                    input_fidelity=cfg.image.input_fidelity,
-                    background=cfg.image.background,
-                    moderation=cfg.image.moderation,
-                ),
-            )
-            # Save the result directly (no post-processing needed with new API)
-            out_path.write_bytes(result.content)
-            return (str(out_path.name), celeb, attributes, False, "")
+            for v in pending:
+                keys[v] = await client.cache_key(**request, variant=v)
+                hit = await asyncio.to_thread(cache.get, keys[v])
+                if hit is not None:
+                    raws[v] = hit
         except Exception as e:  # noqa: BLE001
-            return (str(out_path.name), celeb, attributes, False, str(e))
+            for v in pending:
+                finish(v, error=str(e))
+            return [results[v] for v in variants]
+
+    last_error = ""
+    for _ in range(cfg.rate_limit.max_rate_limit_retries + 1):
+        missing = [v for v in pending if v not in raws]
+        if not missing:
+            break
+        try:
+            # Each attempt takes its own limiter slot; a 429 has already backed the limiter off
+            result = await client.fetch(**request, n=len(missing), limiter=limiter)
+        except RateLimitedError as e:
+            last_error = str(e)
+            continue
+        except Exception as e:  # noqa: BLE001
+            last_error = str(e)
+            break
+        # Fan the batch out; variants the API did not return go round again
+        for v, raw in zip(missing, result.images):
+            raws[v] = raw
+            if cache is not None:
+                # Keep the untranscoded output so a format change still hits
+                await asyncio.to_thread(cache.put, keys[v], raw)
+
+    for v in pending:
+        if v not in raws:
+            finish(v, error=last_error)
+            continue
+        try:
+            if transcoder is not None:
+                await transcoder.write(raws[v], cfg.image.format, out_paths[v])
+            else:
+                content = await asyncio.to_thread(_to_format, raws[v], cfg.image.format)
+                await asyncio.to_thread(write_once, out_paths[v], content)
+        except Exception as e:  # noqa: BLE001
+            finish(v, error=str(e))
+            continue
+        finish(v)
+    return [results[v] for v in variants]
+
+
+async def build_manifest_derivatives(
+    cfg: AppConfig,
+    scenario_path: Path,
+    manifest: Dict,
+    transcoder: Transcoder,
+    *,
+    verbose: bool = False,
+) -> Dict:
+    """Build responsive/LQIP derivatives on the process pool and record them per manifest item."""
+    d = cfg.derivatives
+    formats = supported_formats(d.formats)
+    items = [it for it in manifest.get("items", []) if (scenario_path / it["filename"]).exists()]
+    records = await asyncio.gather(
+        *(
+            transcoder.submit(
+                build_derivatives,
+                str(scenario_path),
+                it["filename"],
+                d.widths,
+                formats,
+                d.quality,
+                d.lqip_width,
+                it.get("derivatives"),
+            )
+            for it in items
+        ),
+        return_exceptions=True,
+    )
+    changed = 0
+    for it, record in zip(items, records):
+        if isinstance(record, BaseException):
+            print(f"[WARN] derivatives for {it['filename']} failed: {record}")
+            continue
+        if record != it.get("derivatives"):
+            it["derivatives"] = record
+            changed += 1
+    if changed:
+        write_manifest(scenario_path, manifest)
+    if verbose:
+        print(f"Derivatives: built={changed}, up to date={len(items) - changed}")
+    return manifest
+
+
+def plan_key(cfg: AppConfig) -> str:
+    """Fingerprint of every setting that shapes the job plan."""
+    spec = {
+        "total_images": cfg.total_images,
+        "seed": cfg.seed,
+        "attributes": cfg.attr_ids,
+        "required_attributes": cfg.required_attributes,
+        "celebrities": cfg.celebrities,
+        "planner": cfg.planner.model_dump(),
+        "max_batch": cfg.image.max_batch,
+    }
+    return sha256_bytes(json.dumps(spec, sort_keys=True).encode("utf-8"))
 
 
-async def run(cfg: AppConfig, *, dry_run: bool = False, verbose: bool = False) -> None:
+async def run(cfg: AppConfig, *, dry_run: bool = False, verbose: bool = False, resume: bool = False) -> None:
     scenario_path = scenario_dir(cfg.output_dir, cfg.scenario)
 
     # Note: Masking logic removed - using new multi-image API without masks
@@ -106,128 +264,206 @@ async def run(cfg: AppConfig, *, dry_run: bool = False, verbose: bool = False) -
         if req_attr in attr_ids:
             required_indices.append(attr_ids.index(req_attr))
     
-    combos = enumerate_bit_combos(len(attr_ids), required_indices)
-
-    # Plan assignments (deterministic)
-    pairs = plan_assignments(
-        total_images=cfg.total_images,
-        combos=combos,
-        celebrities=cfg.celebrities,
-        seed=cfg.seed,
-        attr_ids=attr_ids,
-    )
-    
+    # Distinct combos over the free bits, decoded lazily
+    combos: Sequence[List[int]] = ComboSpace(len(attr_ids), required_indices)
+    # A pair can only repeat once the plan wraps around the combo sequence
+    distinct = cfg.total_images <= len(combos)
+    if cfg.planner.mode == "weighted":
+        combos = weighted_combos(cfg, combos)
+        distinct = combos.max_repeats <= 1
+
+    # Plan assignments (deterministic); re-iterable, streamed on each pass
+    def plan() -> Iterator[Tuple[List[int], str]]:
+        return iter_assignments(
+            total_images=cfg.total_images,
+            combos=combos,
+            celebrities=cfg.celebrities,
+            seed=cfg.seed,
+            attr_ids=attr_ids,
+        )
+
     # Show celebrity distribution in verbose mode
     if verbose:
-        distribution = analyze_celebrity_distribution(pairs)
+        distribution = analyze_celebrity_distribution(plan())
         print(f"Celebrity distribution for {cfg.total_images} images:")
         for celeb, count in distribution.items():
             print(f"  {celeb}: {count} image(s)")
         print()
 
+    # Repeats of a pair share one prompt: issue them as a single n>1 request
+    def planned_jobs() -> Iterator[Tuple[List[int], str, List[int]]]:
+        return group_requests(plan(), max_batch=cfg.image.max_batch, distinct=distinct)
+
+    total_planned = max(0, cfg.total_images)
+
     # Dry run: print planned filenames and exit without API calls or manifest writes
     if dry_run:
         attr_visuals = {aid: (cfg.attributes.get(aid, {})).get("visual", "") for aid in attr_ids}
         print("Planned outputs:")
-        for bits, celeb in pairs:
+        requests = 0
+        for bits, celeb, variants in planned_jobs():
             code = encode_combo(bits, tokens_ordered)
             celeb_slug = slugify_celeb(celeb)
-            out_path = filename_for(scenario_path, celeb_slug, code, cfg.image.format)
-            print(f"- {out_path}")
-        print(f"Total planned: {len(pairs)}")
+            requests += 1
+            for v in variants:
+                out_path = filename_for(scenario_path, celeb_slug, code, cfg.image.format, variant=v)
+                print(f"- {out_path}")
+        print(f"Total planned: {total_planned} ({requests} requests)")
         return
 
-    # Client and semaphore
-    client = OpenAIImageClient(
+    # Adaptive limiter and client (one pooled connection per concurrent request)
+    limiter = build_limiter(cfg)
+    client = AsyncOpenAIImageClient(
         api_key=None,
         attempts=cfg.retry.attempts,
         base_seconds=cfg.retry.base_seconds,
         max_seconds=cfg.retry.max_seconds,
+        max_connections=limiter.maximum,
         debug=verbose,
     )
-    sem = asyncio.Semaphore(cfg.concurrency)
-
-    # Build visuals lookup for attributes
-    attr_visuals = {aid: (cfg.attributes.get(aid, {})).get("visual", "") for aid in attr_ids}
-
-    # Existing manifest
-    manifest = read_manifest(scenario_path)
-    items = {item["filename"]: item for item in manifest.get("items", [])}
-
-    tasks = []
-    for bits, celeb in pairs:
-        tasks.append(
-            _generate_one(
-                sem,
-                client,
-                cfg,
-                scenario_path,
-                celeb,
-                bits,
-                tokens_ordered,
-                attr_ids,
-                attr_visuals,
-                dry_run,
-            )
-        )
+    cache = BlobCache(cfg.cache.dir, max_bytes=cfg.cache.max_bytes) if cfg.cache.enabled else None
+    # Encoding runs in worker processes, overlapping with requests still in flight
+    transcoder = Transcoder(cfg.transcode_workers)
+    try:
+        # Build visuals lookup for attributes
+        attr_visuals = {aid: (cfg.attributes.get(aid, {})).get("visual", "") for aid in attr_ids}
+
+        # Fold any journal left by an interrupted run into the manifest; its
+        # filenames are known-done, so those outputs are not re-statted
+        manifest = compact_manifest(scenario_path, cfg.scenario)
+        done = {item["filename"] for item in manifest.get("items", [])}
+
+        generated = 0
+        skipped = 0
+        errors = 0
+        requests = 0
+        error_items: List[dict] = []
+
+        async def record(results: List[Tuple[str, str, Dict[str, bool], bool, str]]) -> None:
+            nonlocal generated, skipped, errors
+            entries = []
+            for fn, celeb, attrs, was_skipped, err in results:
+                progress.update(1)
+                if err and err != "DRY_RUN":
+                    errors += 1
+                    error_items.append({
+                        "filename": fn,
+                        "celebrity": celeb,
+                        "error": err,
+                    })
+                    if verbose:
+                        print(f"[ERROR] {fn} ({celeb}): {err}")
+                    continue
+                if was_skipped:
+                    skipped += 1
+                    if verbose:
+                        print(f"[SKIP] {fn} already exists (override={cfg.override})")
+                    if fn in done:
+                        continue
+                else:
+                    generated += 1
+                    if verbose:
+                        print(f"[OK]   {fn}")
+                entries.append({
+                    "filename": fn,
+                    "celebrity": celeb,
+                    "attributes": attrs,
+                    "scenario": cfg.scenario,
+                    "size": cfg.image.size,
+                    "format": cfg.image.format,
+                    "createdAt": utc_now_iso(),
+                })
+                done.add(fn)
+            # Journal each completed job immediately so a crash keeps paid-for images;
+            # the fsync (and any compaction) runs off the event loop
+            await asyncio.to_thread(journal.extend, entries)
 
-    generated = 0
-    skipped = 0
-    errors = 0
-    error_items: List[dict] = []
-    results: List[Tuple[str, str, Dict[str, bool], bool, str]] = []
-    for coro in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="images"):
-        fn, celeb, attrs, was_skipped, err = await coro
-        if err and err != "DRY_RUN":
-            errors += 1
-            error_items.append({
-                "filename": fn,
-                "celebrity": celeb,
-                "error": err,
-            })
-            if verbose:
-                print(f"[ERROR] {fn} ({celeb}): {err}")
-        elif was_skipped:
-            skipped += 1
-            if verbose:
-                print(f"[SKIP] {fn} already exists (override={cfg.override})")
+        journal = ManifestJournal(scenario_path, cfg.scenario, compact_every=cfg.manifest_compact_every)
+        # Persistent queue: --resume picks up the stored plan where it stopped
+        queue = JobQueue(queue_path(scenario_path))
+        key = plan_key(cfg)
+        if resume and queue.has_plan():
+            if queue.plan_key() != key:
+                print("Note: planning config changed since this queue was built; resuming the stored plan")
+            queue.requeue(max_attempts=cfg.queue.max_attempts)
         else:
-            generated += 1
-            if verbose:
-                print(f"[OK]   {fn}")
-        results.append((fn, celeb, attrs, was_skipped, err))
-
-    # Update manifest
-    for fn, celeb, attrs, was_skipped, err in results:
-        if err and err != "DRY_RUN":
-            continue
-        items[fn] = {
-            "filename": fn,
-            "celebrity": celeb,
-            "attributes": attrs,
-            "scenario": cfg.scenario,
-            "size": cfg.image.size,
-            "format": cfg.image.format,
-            "createdAt": utc_now_iso(),
-        }
-
-    manifest = {
-        "scenario": cfg.scenario,
-        "items": sorted(items.values(), key=lambda x: x["filename"]),
-    }
-    write_manifest(scenario_path, manifest)
+            queue.replace_plan(planned_jobs(), plan_key=key)
+        total_planned = queue.pending_images()
+
+        async def worker() -> None:
+            nonlocal requests
+            while (job := queue.claim()) is not None:
+                requests += 1
+                results = await _generate_one(
+                    limiter,
+                    client,
+                    cfg,
+                    scenario_path,
+                    job.celebrity,
+                    job.bits,
+                    tokens_ordered,
+                    attr_ids,
+                    attr_visuals,
+                    dry_run,
+                    done,
+                    cache,
+                    transcoder,
+                    job.variants,
+                )
+                # Journal before closing the job: a crash in between re-runs the job
+                # (its images are skipped as existing) instead of dropping them from the manifest
+                await record(results)
+                failures = [err for *_, err in results if err and err != "DRY_RUN"]
+                if failures:
+                    queue.fail(job.id, failures[0])
+                else:
+                    queue.complete(job.id)
 
-    # Write error log if any
-    if error_items:
-        (scenario_path / "errors.json").write_text(
-            json_dumps(error_items), encoding="utf-8"
+        progress = tqdm(total=total_planned, desc="images")
+        try:
+            # Bounded workers pull jobs as they go; nothing beyond them is held in memory
+            await asyncio.gather(*(worker() for _ in range(max(1, limiter.maximum))))
+        finally:
+            progress.close()
+            manifest = await asyncio.to_thread(journal.close)
+            states = queue.counts()
+            queue.close()
+
+        if cfg.derivatives.enabled:
+            manifest = await build_manifest_derivatives(cfg, scenario_path, manifest, transcoder, verbose=verbose)
+
+        # Precompiled signature -> hashed filenames index for the backend/client
+        index = write_image_index(
+            scenario_path,
+            cfg.scenario,
+            manifest.get("items", []),
+            attr_ids=attr_ids,
+            tokens=tokens_map,
         )
+        if verbose:
+            print(f"Index: {len(index['mapping'])} signature(s), version {index['version']}")
 
-    print(
-        f"Summary: generated={generated}, skipped={skipped}, errors={errors}, total_planned={len(tasks)}"
-    )
-    if not verbose and error_items:
-        # Show first few errors to help debugging
-        print("Sample errors (first 5):")
-        for it in error_items[:5]:
-            print(f" - {it['filename']}: {it['error']}")
+        # Write error log if any
+        if error_items:
+            (scenario_path / "errors.json").write_text(
+                json_dumps(error_items), encoding="utf-8"
+            )
+
+        print(
+            f"Summary: generated={generated}, skipped={skipped}, errors={errors}, total_planned={total_planned}, requests={requests}"
+        )
+        if verbose:
+            print(f"Rate limits: 429s={limiter.rate_limited}, final concurrency={int(limiter.limit)}")
+            if cache is not None:
+                print(f"Generation cache: hits={cache.hits}, misses={cache.misses}")
+            print(f"Transcode: converted={transcoder.transcoded}, passthrough={transcoder.passthrough}")
+        if states.get("failed"):
+            print(f"{states['failed']} job(s) failed; rerun with --resume to retry them (up to queue.max_attempts)")
+        if not verbose and error_items:
+            # Show first few errors to help debugging
+            print("Sample errors (first 5):")
+            for it in error_items[:5]:
+                print(f" - {it['filename']}: {it['error']}")
+    finally:
+        await client.aclose()
+        transcoder.close()
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+
+_SAVE_FORMATS = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP"}
+
+
+def detect_format(data: bytes | memoryview) -> Optional[str]:
+    """Sniff the container format from magic bytes (png/jpeg/webp), or None."""
+    head = bytes(data[:12])
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def needs_transcode(data: bytes | memoryview, fmt: str) -> bool:
+    fmt = fmt.lower()
+    if fmt not in _SAVE_FORMATS:
+        return False
+    current = detect_format(data)
+    return current is None or _SAVE_FORMATS[current] != _SAVE_FORMATS[fmt]
+
+
+def encode(data: bytes | memoryview, fmt: str) -> io.BytesIO:
+    """Decode `data` and re-encode it as `fmt` into an in-memory buffer."""
+    with Image.open(io.BytesIO(data)) as im:
+        out = io.BytesIO()
+        im.save(out, format=_SAVE_FORMATS[fmt.lower()])
+    return out
+
+
+def write_once(path: str | Path, data: bytes | memoryview) -> int:
+    """Write the whole payload with a single buffered write."""
+    with open(path, "wb") as f:
+        return f.write(data)
+
+
+def _transcode_shared(name: str, size: int, fmt: str, path: str) -> int:
+    # Runs in a worker process: read the raw image straight out of the parent's
+    # shared block, encode, and write the file so only an int travels back
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        with shm.buf[:size] as view:
+            out = encode(view, fmt)
+    finally:
+        shm.close()
+    return write_once(path, out.getbuffer())
+
+
+class Transcoder:
+    """
+    Decode/encode stage on a process pool, so WebP/JPEG encoding runs on
+    other cores while the event loop keeps network requests in flight.
+
+    Raw bytes are handed over through shared memory instead of being pickled;
+    outputs already in the target format are written as-is.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.transcoded = 0
+        self.passthrough = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Started lazily: fully cached or already-converted runs never fork
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def write(self, raw: bytes, fmt: str, path: str | Path) -> int:
+        if not needs_transcode(raw, fmt):
+            self.passthrough += 1
+            return await asyncio.to_thread(write_once, path, raw)
+        shm = shared_memory.SharedMemory(create=True, size=len(raw))
+        try:
+            shm.buf[: len(raw)] = raw
+            loop = asyncio.get_running_loop()
+            written = await loop.run_in_executor(
+                self._executor(), _transcode_shared, shm.name, len(raw), fmt, str(path)
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+        self.transcoded += 1
+        return written
+
+    async def submit(self, fn, *args):
+        """Run another CPU-bound stage (e.g. derivatives) on the same pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), fn, *args)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
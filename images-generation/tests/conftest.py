@@ -0,0 +1,109 @@
+import base64
+import io
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+
+def png_bytes(size=(8, 8), color=(200, 30, 30)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+class MockImagesServer:
+    """Local stand-in for the Images API. `script` is a list of status codes
+    served in order before falling back to 200 responses. With `url_results`
+    images are returned as URLs on this server; their GETs land in `downloads`.
+    Multipart file parts are recorded in `uploads` as (filename, content type)."""
+
+    def __init__(self):
+        self.requests = []
+        self.script = []
+        self.headers = {}
+        self.url_results = False
+        self.downloads = []
+        self.uploads = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.downloads.append((self.path, dict(self.headers)))
+                content = png_bytes()
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                with server._lock:
+                    server.requests.append((self.path, self.headers.get("Content-Type", ""), body))
+                    server.uploads.extend(
+                        (name.decode(), ctype.decode())
+                        for name, ctype in re.findall(rb'filename="([^"]*)"\r\nContent-Type: ([^\r]*)\r\n', body)
+                    )
+                    status = server.script.pop(0) if server.script else 200
+                if status != 200:
+                    self.send_response(status)
+                    for k, v in server.headers.items():
+                        self.send_header(k, v)
+                    self.send_header("Content-Length", "2")
+                    self.end_headers()
+                    self.wfile.write(b"{}")
+                    return
+                n = 1
+                if "json" in self.headers.get("Content-Type", ""):
+                    n = int(json.loads(body or b"{}").get("n", 1))
+                else:
+                    m = re.search(rb'name="n"\r\n\r\n(\d+)', body)
+                    n = int(m.group(1)) if m else 1
+                if server.url_results:
+                    data = [{"url": f"{server.url}/files/{i}.png"} for i in range(n)]
+                else:
+                    data = [{"b64_json": base64.b64encode(png_bytes()).decode()} for _ in range(n)]
+                payload = json.dumps(
+                    {
+                        "data": data,
+                        "usage": {"total_tokens": 100},
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def mock_images(monkeypatch, tmp_path):
+    server = MockImagesServer().start()
+    # Relative defaults (e.g. the generation cache dir) stay inside the test's tmp dir
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    yield server
+    server.stop()
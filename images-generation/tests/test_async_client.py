@@ -0,0 +1,166 @@
+import asyncio
+import json
+import threading
+
+from images_generation import openai_client
+from images_generation.config import AppConfig, CacheConfig
+from images_generation.openai_client import AsyncOpenAIImageClient
+from images_generation.ratelimit import AdaptiveLimiter
+from images_generation.runner import run
+
+from conftest import png_bytes
+
+
+def test_generate_retries_server_errors_and_transcodes(mock_images):
+    mock_images.script = [500, 503]
+
+    async def go():
+        async with AsyncOpenAIImageClient(api_key=None, attempts=3, base_seconds=0.01, max_seconds=0.02) as client:
+            return await client.generate(prompt="p", size="1024x1024", out_format="webp")
+
+    result = asyncio.run(go())
+    assert result.mime == "image/webp"
+    assert result.content[8:12] == b"WEBP"
+    assert len(mock_images.requests) == 3
+    assert all(path == "/v1/images/generations" for path, _, _ in mock_images.requests)
+
+
+def test_url_results_are_downloaded_without_the_api_key(mock_images):
+    mock_images.url_results = True
+
+    async def go():
+        async with AsyncOpenAIImageClient(api_key=None, attempts=1, base_seconds=0.01, max_seconds=0.02) as client:
+            return await client.fetch(prompt="p", size="1024x1024")
+
+    result = asyncio.run(go())
+    assert result.content == png_bytes()
+    assert [path for path, _ in mock_images.downloads] == ["/v1/files/0.png"]
+    assert all("Authorization" not in headers for _, headers in mock_images.downloads)
+
+
+def test_retries_release_the_limiter_slot_between_attempts(mock_images):
+    mock_images.script = [500, 503]
+    limiter = AdaptiveLimiter(initial=1, maximum=1)
+
+    async def go():
+        async with AsyncOpenAIImageClient(api_key=None, attempts=3, base_seconds=0.01, max_seconds=0.02) as client:
+            return await client.fetch(prompt="p", size="1024x1024", limiter=limiter)
+
+    asyncio.run(go())
+    # One slot per attempt, none held once the request finished
+    assert len(limiter._starts) == 3
+    assert limiter.in_flight == 0
+
+
+def test_edit_uploads_background_then_reference(mock_images, tmp_path):
+    bg = tmp_path / "bg.png"
+    ref = tmp_path / "ref.png"
+    bg.write_bytes(png_bytes((16, 24)))
+    ref.write_bytes(png_bytes())
+
+    async def go():
+        async with AsyncOpenAIImageClient(api_key=None, attempts=1, base_seconds=0.01, max_seconds=0.02) as client:
+            return await client.generate(
+                prompt="p",
+                size="1024x1024",
+                out_format="png",
+                background_image_path=str(bg),
+                reference_image_path=str(ref),
+            )
+
+    asyncio.run(go())
+    path, content_type, body = mock_images.requests[0]
+    assert path == "/v1/images/edits"
+    assert content_type.startswith("multipart/form-data")
+    assert body.count(b'name="image[]"') == 2
+    assert body.index(b'filename="bg.png"') < body.index(b'filename="ref.png"')
+    assert mock_images.uploads == [("bg.png", "image/png"), ("ref.png", "image/png")]
+    assert b"16x24" in body
+
+
+def test_runner_generates_all_images_against_mock(mock_images, tmp_path):
+    cfg = AppConfig(
+        output_dir=str(tmp_path),
+        total_images=4,
+        concurrency=4,
+        attributes={"techno": {"visual": "v"}, "berlin": {"visual": "w"}},
+        celebrities=["A", "B"],
+    )
+    asyncio.run(run(cfg))
+    out = list((tmp_path / "scenario_1").glob("*.webp"))
+    assert len(out) == 4
+    assert len(mock_images.requests) == 4
+    assert (tmp_path / "scenario_1" / "manifest.json").exists()
+
+
+def test_reference_assets_are_read_once_per_client(mock_images, tmp_path):
+    bg = tmp_path / "bg.png"
+    bg.write_bytes(png_bytes((16, 24)))
+
+    async def go():
+        async with AsyncOpenAIImageClient(api_key=None, attempts=1, base_seconds=0.01, max_seconds=0.02) as client:
+            await client.generate(prompt="p", size="auto", out_format="png", background_image_path=str(bg))
+            # Later requests reuse the cached bytes and dimensions, not the file on disk
+            bg.write_bytes(png_bytes((32, 32)))
+            await client.generate(prompt="p", size="auto", out_format="png", background_image_path=str(bg))
+
+    asyncio.run(go())
+    bodies = [body for _, _, body in mock_images.requests]
+    assert len(bodies) == 2
+    assert all(b"16x24" in body for body in bodies)
+
+
+def test_reference_assets_are_read_off_the_event_loop(mock_images, tmp_path, monkeypatch):
+    bg = tmp_path / "bg.png"
+    bg.write_bytes(png_bytes((16, 24)))
+    readers = []
+    real_init = openai_client.CachedAsset.__init__
+
+    def spy(self, path):
+        readers.append(threading.current_thread())
+        real_init(self, path)
+
+    monkeypatch.setattr(openai_client.CachedAsset, "__init__", spy)
+
+    async def go():
+        async with AsyncOpenAIImageClient(api_key=None, attempts=1, base_seconds=0.01, max_seconds=0.02) as client:
+            await client.cache_key(prompt="p", size="auto", background_image_path=str(bg))
+            await client.generate(prompt="p", size="auto", out_format="png", background_image_path=str(bg))
+
+    asyncio.run(go())
+    assert len(readers) == 1 and readers[0] is not threading.main_thread()
+
+
+def test_generation_cache_skips_api_for_repeated_requests(mock_images, tmp_path):
+    def cfg(out: str, fmt: str) -> AppConfig:
+        return AppConfig(
+            output_dir=str(tmp_path / out),
+            total_images=4,
+            attributes={"techno": {"visual": "v"}, "berlin": {"visual": "w"}},
+            celebrities=["A", "B"],
+            image={"format": fmt},
+            cache=CacheConfig(dir=str(tmp_path / "cache")),
+        )
+
+    asyncio.run(run(cfg("first", "webp")))
+    assert len(mock_images.requests) == 4
+    # Same prompts into a fresh output dir and another format: served from the cache
+    asyncio.run(run(cfg("second", "png")))
+    assert len(mock_images.requests) == 4
+    assert len(list((tmp_path / "second" / "scenario_1").glob("*.png"))) == 4
+
+
+def test_runner_batches_repeated_jobs_into_one_request(mock_images, tmp_path):
+    cfg = AppConfig(
+        output_dir=str(tmp_path),
+        total_images=8,
+        attributes={"techno": {"visual": "v"}, "berlin": {"visual": "w"}},
+        celebrities=["A"],
+    )
+    asyncio.run(run(cfg))
+    names = sorted(p.name for p in (tmp_path / "scenario_1").glob("*.webp"))
+    assert len(names) == 8
+    assert sum(name.startswith("a-v1__") for name in names) == 4
+    # Four combos, each planned twice for the one celebrity: one n=2 call apiece
+    assert len(mock_images.requests) == 4
+    assert all(json.loads(body)["n"] == 2 for _, _, body in mock_images.requests)
@@ -0,0 +1,68 @@
+import itertools
+
+from images_generation.combos import (
+    AllocatedCombos,
+    ComboSpace,
+    allocate_counts,
+    combo_weights,
+    enumerate_bit_combos,
+    iter_assignments,
+    plan_assignments,
+)
+
+
+def test_combo_space_is_distinct_and_lazy():
+    space = ComboSpace(12, required_indices=[0, 5])
+    assert len(space) == 1 << 10
+    combos = list(space)
+    assert len({tuple(c) for c in combos}) == len(combos)
+    assert all(c[0] == 1 and c[5] == 1 for c in combos)
+    # Same order as the first occurrences in the eager enumeration
+    eager = list(dict.fromkeys(tuple(c) for c in enumerate_bit_combos(6, [2])))
+    assert [tuple(c) for c in ComboSpace(6, [2])] == eager
+
+
+def test_iter_assignments_streams_the_same_plan():
+    kwargs = dict(
+        total_images=40,
+        combos=ComboSpace(4, [1]),
+        celebrities=["Angela Merkel", "X", "Y"],
+        seed=7,
+        attr_ids=["a", "b", "international", "d"],
+    )
+    assert list(itertools.islice(iter_assignments(**kwargs), 5)) == plan_assignments(**kwargs)[:5]
+    assert list(iter_assignments(**kwargs)) == plan_assignments(**kwargs)
+    assert all(not (bits[2] and celeb == "Angela Merkel") for bits, celeb in plan_assignments(**kwargs))
+
+
+def test_weighted_allocation_follows_frequencies_with_floor():
+    space = ComboSpace(2)  # [0,0], [1,0], [0,1], [1,1]
+    weights = combo_weights(space, ["a", "b"], {"a": 0.9, "b": 0.5})
+    assert abs(sum(weights) - 1) < 1e-9
+    counts = allocate_counts(weights, 20, floor=1)
+    assert sum(counts) == 20 and min(counts) >= 1
+    assert counts[1] > counts[0] and counts[3] > counts[2]
+    # Budget below the floor: the most likely combos get one image each
+    assert allocate_counts(weights, 2, floor=1) == [0, 1, 0, 1]
+
+
+def test_correlations_shift_weight_to_co_occurring_combos():
+    space = ComboSpace(2)
+    plain = combo_weights(space, ["a", "b"], {"a": 0.5, "b": 0.5})
+    correlated = combo_weights(space, ["a", "b"], {"a": 0.5, "b": 0.5}, {"a": {"b": 0.6}})
+    assert correlated[3] > plain[3] and correlated[1] < plain[1]
+
+
+def test_correlations_are_read_from_either_triangle():
+    space = ComboSpace(2)
+    freqs = {"a": 0.4, "b": 0.7}
+    upper = combo_weights(space, ["a", "b"], freqs, {"a": {"b": 0.3}})
+    lower = combo_weights(space, ["a", "b"], freqs, {"b": {"a": 0.3}})
+    assert lower == upper != combo_weights(space, ["a", "b"], freqs)
+
+
+def test_allocated_combos_cover_everything_before_repeating():
+    space = ComboSpace(2)
+    seq = AllocatedCombos(space, [1, 3, 0, 2])
+    assert len(seq) == 6 and seq.max_repeats == 3
+    assert list(seq) == [[1, 0], [1, 1], [0, 0], [1, 0], [1, 1], [1, 0]]
@@ -0,0 +1,22 @@
+from images_generation.derivatives import build_derivatives, supported_formats
+from images_generation.transcode import detect_format
+
+from conftest import png_bytes
+
+
+def test_builds_widths_formats_and_lqip_then_skips_by_checksum(tmp_path):
+    (tmp_path / "a__T1.png").write_bytes(png_bytes((64, 96)))
+    formats = supported_formats(["avif", "webp"])
+    record = build_derivatives(str(tmp_path), "a__T1.png", [16, 32, 128], formats, 60, 8)
+
+    built = {(f["width"], f["format"]) for f in record["files"]}
+    # 128px would be an upscale of the 64px original: skipped
+    assert built == {(w, fmt) for w in (16, 32) for fmt in formats}
+    assert all(f["height"] == f["width"] * 3 // 2 for f in record["files"])
+    assert detect_format((tmp_path / "derived" / "a__T1.w16.webp").read_bytes()) == "webp"
+    assert record["lqip"].startswith("data:image/webp;base64,")
+
+    # Same source and settings: the previous record comes back untouched
+    assert build_derivatives(str(tmp_path), "a__T1.png", [16, 32, 128], formats, 60, 8, record) is record
+    (tmp_path / "a__T1.png").write_bytes(png_bytes((64, 96), color=(0, 0, 0)))
+    assert build_derivatives(str(tmp_path), "a__T1.png", [16, 32, 128], formats, 60, 8, record)["source"] != record["source"]
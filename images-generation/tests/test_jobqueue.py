@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from images_generation.config import AppConfig
+from images_generation.fileio import read_manifest
+from images_generation.jobqueue import JobQueue, queue_path
+from images_generation.runner import run
+
+
+def test_queue_requeues_interrupted_and_failed_jobs(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite3")
+    queue.replace_plan([([1, 0], "A", [0]), ([0, 1], "B", [0, 1]), ([1, 1], "A", [0])], plan_key="k")
+    first, second = queue.claim(), queue.claim()
+    assert (first.bits, second.variants) == ([1, 0], [0, 1])
+    queue.fail(first.id, "boom")
+    # second is left running, as after a crash
+    assert queue.counts() == {"failed": 1, "running": 1, "pending": 1}
+    assert queue.requeue(max_attempts=1) == 1  # failed job is out of attempts
+    assert queue.counts() == {"failed": 1, "pending": 2}
+    queue.close()
+
+
+def test_resume_retries_only_failed_work(mock_images, tmp_path):
+    cfg = AppConfig(
+        output_dir=str(tmp_path),
+        total_images=4,
+        concurrency=1,
+        retry={"attempts": 1, "base_seconds": 0.01, "max_seconds": 0.02},
+        rate_limit={"adaptive": False},
+        attributes={"techno": {"visual": "v"}, "berlin": {"visual": "w"}},
+        celebrities=["A"],
+    )
+    mock_images.script = [500]
+    asyncio.run(run(cfg))
+    assert len(list((tmp_path / "scenario_1").glob("*.webp"))) == 3
+    queue = JobQueue(queue_path(tmp_path / "scenario_1"))
+    assert queue.counts() == {"done": 3, "failed": 1}
+    queue.close()
+
+    asyncio.run(run(cfg, resume=True))
+    assert len(list((tmp_path / "scenario_1").glob("*.webp"))) == 4
+    # The three finished jobs were neither re-planned nor re-requested
+    assert len(mock_images.requests) == 5
+
+
+def test_images_are_journaled_before_their_job_is_closed(mock_images, tmp_path, monkeypatch):
+    cfg = AppConfig(
+        output_dir=str(tmp_path),
+        total_images=1,
+        concurrency=1,
+        attributes={"techno": {"visual": "v"}},
+        celebrities=["A"],
+    )
+
+    def crash(self, job_id):
+        raise RuntimeError("crashed before the job was closed")
+
+    monkeypatch.setattr(JobQueue, "complete", crash)
+    with pytest.raises(RuntimeError):
+        asyncio.run(run(cfg))
+    # The paid-for image is in the manifest even though its job never reached "done"
+    assert [item["celebrity"] for item in read_manifest(tmp_path / "scenario_1")["items"]] == ["A"]
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from images_generation.config import AppConfig
+from images_generation.fileio import (
+    ManifestJournal,
+    compact_manifest,
+    journal_path,
+    manifest_path,
+    read_manifest,
+    write_image_index,
+)
+from images_generation.runner import run
+
+
+def _item(name):
+    return {"filename": name, "celebrity": "A", "attributes": {}, "scenario": 1}
+
+
+def test_journal_survives_crash_and_compacts(tmp_path):
+    journal = ManifestJournal(tmp_path, 1, compact_every=2)
+    journal.append(_item("a.webp"))
+    journal.append(_item("b.webp"))  # triggers compaction
+    journal.append(_item("c.webp"))
+    # Simulate a crash: no close(), plus a torn trailing write
+    with journal_path(tmp_path).open("a", encoding="utf-8") as f:
+        f.write('{"filename": "d.we')
+
+    assert [i["filename"] for i in read_manifest(tmp_path)["items"]] == ["a.webp", "b.webp"]
+    manifest = compact_manifest(tmp_path, 1)
+    assert [i["filename"] for i in manifest["items"]] == ["a.webp", "b.webp", "c.webp"]
+    assert journal_path(tmp_path).read_text() == ""
+    assert json.loads(manifest_path(tmp_path).read_text()) == manifest
+
+
+def test_compaction_makes_the_manifest_durable_before_truncating(tmp_path, monkeypatch):
+    from images_generation import fileio
+
+    journal = ManifestJournal(tmp_path, 1, compact_every=0)
+    journal.append(_item("a.webp"))
+    events = []
+    real_fsync, real_replace = fileio.os.fsync, fileio.Path.replace
+
+    def fsync(fd):
+        events.append("fsync")
+        real_fsync(fd)
+
+    def replace(self, target):
+        events.append("replace")
+        return real_replace(self, target)
+
+    def fsync_dir(path):
+        events.append("fsync_dir")
+
+    monkeypatch.setattr(fileio.os, "fsync", fsync)
+    monkeypatch.setattr(fileio.Path, "replace", replace)
+    monkeypatch.setattr(fileio, "_fsync_dir", fsync_dir)
+    journal.close()
+    assert events == ["fsync", "replace", "fsync_dir"]
+    assert journal_path(tmp_path).read_text() == ""
+    assert [i["filename"] for i in read_manifest(tmp_path)["items"]] == ["a.webp"]
+
+
+def test_journal_batches_from_threads_interleave_with_compaction(tmp_path):
+    journal = ManifestJournal(tmp_path, 1, compact_every=5)
+
+    async def go():
+        # Same shape as the runner: every job's batch is written from a worker thread
+        await asyncio.gather(
+            *(asyncio.to_thread(journal.extend, [_item(f"{w}-{i}.webp") for i in range(3)]) for w in range(8))
+        )
+        return await asyncio.to_thread(journal.close)
+
+    manifest = asyncio.run(go())
+    assert sorted(i["filename"] for i in manifest["items"]) == sorted(f"{w}-{i}.webp" for w in range(8) for i in range(3))
+    assert journal_path(tmp_path).read_text() == ""
+
+
+def test_resumed_run_skips_journaled_images(mock_images, tmp_path):
+    cfg = AppConfig(
+        output_dir=str(tmp_path),
+        total_images=4,
+        concurrency=2,
+        attributes={"techno": {"visual": "v"}, "berlin": {"visual": "w"}},
+        celebrities=["A"],
+    )
+    asyncio.run(run(cfg))
+    assert len(mock_images.requests) == 4
+    asyncio.run(run(cfg))
+    assert len(mock_images.requests) == 4
+    assert len(read_manifest(tmp_path / "scenario_1")["items"]) == 4
+
+
+def test_image_index_maps_signatures_to_hashed_files(tmp_path):
+    (tmp_path / "a__T1_B0.webp").write_bytes(b"one")
+    (tmp_path / "a-v1__T1_B0.webp").write_bytes(b"two")
+    items = [{"filename": "a__T1_B0.webp"}, {"filename": "a-v1__T1_B0.webp"}, {"filename": "gone__T0_B0.webp"}]
+    index = write_image_index(tmp_path, 1, items, attr_ids=["techno", "berlin"], tokens={"techno": "T", "berlin": "B"})
+    names = index["mapping"]["T1_B0"]
+    assert len(names) == 2 and list(index["mapping"]) == ["T1_B0"]
+    assert all((tmp_path / "hashed" / n).read_bytes() in (b"one", b"two") for n in names)
+    assert json.loads((tmp_path / "index.json").read_text()) == index
+    # Same content, same version; changed content, new hashed name and version
+    assert write_image_index(tmp_path, 1, items, attr_ids=["techno", "berlin"], tokens={"techno": "T", "berlin": "B"})["version"] == index["version"]
+    (tmp_path / "a__T1_B0.webp").write_bytes(b"three")
+    assert write_image_index(tmp_path, 1, items, attr_ids=["techno", "berlin"], tokens={"techno": "T", "berlin": "B"})["version"] != index["version"]
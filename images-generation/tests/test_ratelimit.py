@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from images_generation.config import AppConfig
+from images_generation.ratelimit import AdaptiveLimiter, RateLimitedError, parse_reset, parse_retry_after
+from images_generation.runner import run
+
+
+def test_parse_reset_and_retry_after():
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("6m0s") == pytest.approx(360.0)
+    assert parse_reset("1.5") == pytest.approx(1.5)
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"x-ratelimit-reset-requests": "1s", "x-ratelimit-reset-tokens": "2s"}) == 2.0
+    assert parse_retry_after({}) is None
+
+
+def test_aimd_increase_and_decrease():
+    async def go():
+        limiter = AdaptiveLimiter(initial=2, maximum=4)
+        for _ in range(6):
+            async with limiter.slot() as slot:
+                slot.ok()
+        grown = limiter.limit
+        async with limiter.slot() as slot:
+            slot.throttled(RateLimitedError("429", retry_after=0.0, headers={}))
+        return grown, limiter.limit
+
+    grown, shrunk = asyncio.run(go())
+    assert 3.0 < grown <= 4.0
+    assert shrunk == pytest.approx(grown * 0.5)
+
+
+def test_images_per_minute_budget_blocks():
+    async def go():
+        limiter = AdaptiveLimiter(initial=4, maximum=4, images_per_minute=2)
+        for _ in range(2):
+            async with limiter.slot() as slot:
+                slot.ok()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(), timeout=0.1)
+
+    asyncio.run(go())
+
+
+def test_images_per_minute_budget_counts_images_not_calls():
+    async def go():
+        limiter = AdaptiveLimiter(initial=4, maximum=4, images_per_minute=4)
+        async with limiter.slot(weight=3) as slot:
+            slot.ok()
+        # One call of three images leaves room for one more image, not another batch
+        async with limiter.slot() as slot:
+            slot.ok()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(2), timeout=0.1)
+
+    asyncio.run(go())
+
+
+def test_runner_backs_off_on_429_and_completes(mock_images, tmp_path):
+    mock_images.script = [429, 429, 429]
+    mock_images.headers = {"Retry-After": "0.05"}
+    cfg = AppConfig(
+        output_dir=str(tmp_path),
+        total_images=4,
+        concurrency=4,
+        attributes={"techno": {"visual": "v"}, "berlin": {"visual": "w"}},
+        celebrities=["A"],
+    )
+    asyncio.run(run(cfg))
+    assert len(list((tmp_path / "scenario_1").glob("*.webp"))) == 4
+    assert len(mock_images.requests) == 7
@@ -0,0 +1,30 @@
+import asyncio
+
+from images_generation.transcode import Transcoder, detect_format, needs_transcode
+
+from conftest import png_bytes
+
+
+def test_needs_transcode_skips_matching_format():
+    raw = png_bytes()
+    assert detect_format(raw) == "png"
+    assert not needs_transcode(raw, "png")
+    assert needs_transcode(raw, "webp")
+    assert not needs_transcode(raw, "gif")  # unsupported targets are written as-is
+
+
+def test_transcoder_converts_in_pool_and_passes_through(tmp_path):
+    raw = png_bytes((32, 16))
+    transcoder = Transcoder(max_workers=1)
+
+    async def go():
+        await transcoder.write(raw, "webp", tmp_path / "a.webp")
+        await transcoder.write(raw, "png", tmp_path / "b.png")
+
+    try:
+        asyncio.run(go())
+    finally:
+        transcoder.close()
+    assert detect_format((tmp_path / "a.webp").read_bytes()) == "webp"
+    assert (tmp_path / "b.png").read_bytes() == raw
+    assert (transcoder.transcoded, transcoder.passthrough) == (1, 1)